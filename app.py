@@ -6,8 +6,10 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from cache import Cache
+import database
+from config import CONFIGS
+from metrics import QueryMetrics
 
 # Initialize SQLAlchemy with a base class
 class Base(DeclarativeBase):
@@ -16,12 +18,8 @@ class Base(DeclarativeBase):
 # Initialize Flask extensions
 db = SQLAlchemy(model_class=Base)
 login_manager = LoginManager()
-
-# Create Flask application
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "german-tutors-dev-key")
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///german_tutors.db"
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+metrics = QueryMetrics()
+cache = Cache()
 
 # Custom Jinja filter
 def format_datetime(value, format='%Y-%m-%d'):
@@ -32,38 +30,51 @@ def format_datetime(value, format='%Y-%m-%d'):
     except Exception as e:
         return value
 
-# Register it with Jinja
-app.jinja_env.filters['datetime'] = format_datetime
-
-# Initialize extensions with app
-db.init_app(app)
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-login_manager.login_message = 'Please log in to access this page.'
-
-# Import routes after app is created to avoid circular imports
-from routes import *  # noqa: E402, F403
-import models  # noqa: E402, F401
 
-# Create database tables
-with app.app_context():
-    db.create_all()
+def create_app(config=None):
+    """Create and configure the Flask application.
+    
+    `config` is a config class from config.py; by default it is picked by the
+    APP_CONFIG environment variable (development, production or testing).
+    Nothing here touches the database: run `flask init-db` to create the schema
+    and the admin account.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config or CONFIGS[os.environ.get("APP_CONFIG", "development")])
+    
+    # Configure logging
+    logging.basicConfig(level=app.config["LOG_LEVEL"])
     
-    # Check if admin user exists, create if not
-    from models import User, Role
-    admin = User.query.filter_by(username="admin").first()
-    if not admin:
-        from werkzeug.security import generate_password_hash
-        admin_user = User(
-            username="admin",
-            password_hash=generate_password_hash("admin123"),
-            email="admin@germantutors.com",
-            role=Role.ADMIN,
-            created_at=dt.utcnow()
-        )
-        db.session.add(admin_user)
-        db.session.commit()
-        app.logger.info("Admin user created")
+    # Register the Jinja filter
+    app.jinja_env.filters['datetime'] = format_datetime
+    
+    # Initialize extensions with app
+    db.init_app(app)
+    database.init_app(app, db)
+    login_manager.init_app(app)
+    metrics.init_app(app)
+    cache.init_app(app)
+    # forget_login_user has to reach every worker, or one of them could keep
+    # serving a user without the tutor profile they have since created
+    if app.config['LOGIN_CACHE_TTL'] and not cache.shared:
+        raise ValueError('LOGIN_CACHE_TTL needs a shared cache; set CACHE_TYPE to filesystem or redis')
+    login_manager.login_view = 'login'
+    login_manager.login_message = 'Please log in to access this page.'
+    
+    # Import routes and commands here, once the extensions exist, to avoid circular imports
+    import models  # noqa: F401
+    import routes
+    import commands
+    
+    routes.init_app(app)
+    commands.init_app(app)
+    
+    return app
+
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    # Development server only; see wsgi.py and gunicorn.conf.py for production.
+    # Import the factory by module name so models and routes share this
+    # module's extensions rather than a second copy under __main__.
+    from app import create_app as app_factory
+    app_factory().run(debug=os.environ.get("FLASK_DEBUG", "1") == "1")
@@ -0,0 +1,134 @@
+"""Stress test for double-booking: many students race for the same few slots.
+
+Every client thread logs in as its own student, waits at a barrier, then tries
+to book and pay for one of a handful of contested slots with a single tutor.
+Two rounds run against a fresh database: one with the normal hold time, where
+the race happens at student_book_tutor, and one with holds that expire
+immediately, so every student gets a hold and the race moves to
+student_payment. Afterwards the script counts overlapping confirmed bookings
+and exits non-zero if it finds any:
+
+    python benchmarks/booking_race.py --clients 32 --slots 3 --rounds 5
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+from sqlalchemy.orm import aliased
+
+# Importing the concurrency benchmark also puts the repository root on sys.path
+from concurrency import PAYMENT_FORM, make_config, seed
+
+from app import create_app, db
+
+
+def contender(app, username, slots, barrier, counts, lock):
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': 'bench'})
+    tutor_id, date, hour = random.choice(slots)
+    barrier.wait()
+
+    response = client.post(f'/student/book/{tutor_id}', data={
+        'booking_date': date.isoformat(),
+        'start_time': f'{hour:02d}:00',
+        'end_time': f'{hour + 1:02d}:00',
+    })
+    location = response.headers.get('Location', '')
+    if response.status_code >= 500:
+        outcome = 'errors'
+    elif '/student/payment/' not in location:
+        outcome = 'refused at booking'
+    else:
+        response = client.post(location, data=PAYMENT_FORM)
+        if response.status_code >= 500:
+            outcome = 'errors'
+        elif '/student/dashboard' in response.headers.get('Location', ''):
+            outcome = 'confirmed'
+        else:
+            outcome = 'refused at payment'
+
+    with lock:
+        counts[outcome] += 1
+
+
+def count_double_bookings():
+    from models import Booking, BookingStatus
+
+    other = aliased(Booking)
+    return db.session.query(db.func.count()) \
+        .select_from(Booking) \
+        .join(other, db.and_(
+            other.tutor_profile_id == Booking.tutor_profile_id,
+            other.booking_date == Booking.booking_date,
+            other.id > Booking.id,
+            other.start_time < Booking.end_time,
+            other.end_time > Booking.start_time
+        )) \
+        .filter(Booking.status == BookingStatus.CONFIRMED) \
+        .filter(other.status == BookingStatus.CONFIRMED) \
+        .scalar()
+
+
+def run(label, config, args):
+    app = create_app(config)
+    app.logger.disabled = True
+    profile_ids = seed(app, 1, args.clients)
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+
+    counts = Counter()
+    lock = threading.Lock()
+    for round_number in range(args.rounds):
+        # Fresh slots each round so every round is contested from scratch
+        slots = [(profile_ids[0], tomorrow + datetime.timedelta(days=round_number), 8 + i)
+                 for i in range(args.slots)]
+        barrier = threading.Barrier(args.clients)
+        threads = [
+            threading.Thread(target=contender, args=(app, f'bench_student{i}', slots, barrier, counts, lock))
+            for i in range(args.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    with app.app_context():
+        double_bookings = count_double_bookings()
+        db.engine.dispose()
+
+    print(f'{label:<24} {counts["confirmed"]:>10} {counts["refused at booking"]:>10} '
+          f'{counts["refused at payment"]:>10} {counts["errors"]:>7} {double_bookings:>8}')
+    return double_bookings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--slots', type=int, default=3, help='Contested slots per round')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"holds":<24} {"confirmed":>10} {"ref. book":>10} {"ref. pay":>10} {"errors":>7} {"overlaps":>8}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'race.db')
+        uri = os.environ.get('DATABASE_URL') or f'sqlite:///{path}'
+        overlaps = 0
+        for label, hold_minutes in [('normal hold', 15), ('holds expire at once', 0)]:
+            config = make_config(uri, 'WAL', 'NORMAL', 5000)
+            config.BOOKING_HOLD_MINUTES = hold_minutes
+            overlaps += run(label, config, args)
+            if os.path.exists(path):
+                os.remove(path)
+
+    if overlaps:
+        sys.exit(f'{overlaps} overlapping confirmed bookings')
+    print(f'No overlapping confirmed bookings (expected {args.slots * args.rounds} confirmed per run)')
+
+
+if __name__ == '__main__':
+    main()
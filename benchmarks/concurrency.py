@@ -0,0 +1,199 @@
+"""Concurrent booking/payment benchmark comparing database connection settings.
+
+Each client thread logs in as its own student and repeatedly books a random
+slot with a random tutor (student_book_tutor) and pays for it
+(student_payment), while reader threads poll the tutor search and slot APIs.
+The same workload runs once with SQLite's default rollback journal and once
+with the tuned WAL settings from config.py, against a fresh database file each
+time:
+
+    python benchmarks/concurrency.py --clients 16 --readers 8 --duration 15
+
+Set DATABASE_URL to a PostgreSQL database to benchmark the pooled engine
+instead (the SQLite-only baseline is skipped then).
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from config import ProductionConfig  # noqa: E402
+from database import engine_options  # noqa: E402
+
+
+PAYMENT_FORM = {
+    'card_number': '4242424242424242',
+    'card_expiry': '12/30',
+    'card_cvc': '123',
+    'cardholder_name': 'Bench Student',
+}
+
+
+def make_config(uri, journal_mode, synchronous, busy_timeout_ms):
+    class BenchConfig(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = uri
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(uri, os.environ)
+        SQLITE_JOURNAL_MODE = journal_mode
+        SQLITE_SYNCHRONOUS = synchronous
+        SQLITE_BUSY_TIMEOUT_MS = busy_timeout_ms
+        WTF_CSRF_ENABLED = False
+        METRICS_ENABLED = False
+        CACHE_TYPE = 'null'
+        # Matches the cheap hash seed() gives every account, so logins don't rehash
+        PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    return BenchConfig
+
+
+def seed(app, tutors, students):
+    """Create tutors with hourly slots 08:00-20:00 every day, plus student accounts"""
+    from models import User, Role, TutorProfile, Availability
+
+    # A single cheap hash shared by every account keeps seeding and login fast
+    password_hash = generate_password_hash('bench', method='pbkdf2:sha256:1000')
+
+    with app.app_context():
+        import commands
+        db.drop_all()
+        commands.upgrade_schema()
+
+        db.session.execute(db.insert(User), [
+            {'username': f'bench_tutor{i}', 'email': f'bench_tutor{i}@example.com',
+             'password_hash': password_hash, 'role': Role.TUTOR}
+            for i in range(tutors)
+        ] + [
+            {'username': f'bench_student{i}', 'email': f'bench_student{i}@example.com',
+             'password_hash': password_hash, 'role': Role.STUDENT}
+            for i in range(students)
+        ])
+        tutor_user_ids = db.session.scalars(
+            db.select(User.id).where(User.role == Role.TUTOR).order_by(User.id)
+        ).all()
+        db.session.execute(db.insert(TutorProfile), [
+            {'user_id': user_id, 'hourly_rate': 30.0} for user_id in tutor_user_ids
+        ])
+        profile_ids = db.session.scalars(db.select(TutorProfile.id)).all()
+        db.session.execute(db.insert(Availability), [
+            {'tutor_profile_id': profile_id, 'day_of_week': day,
+             'start_time': datetime.time(hour), 'end_time': datetime.time(hour + 1), 'is_available': True}
+            for profile_id in profile_ids
+            for day in range(7)
+            for hour in range(8, 20)
+        ])
+        db.session.commit()
+        return profile_ids
+
+
+def booking_client(app, username, profile_ids, deadline, counts, lock):
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': 'bench'})
+    local = Counter()
+    today = datetime.date.today()
+
+    while time.perf_counter() < deadline:
+        tutor_id = random.choice(profile_ids)
+        date = today + datetime.timedelta(days=random.randint(0, 13))
+        hour = random.randint(8, 19)
+        response = client.post(f'/student/book/{tutor_id}', data={
+            'booking_date': date.isoformat(),
+            'start_time': f'{hour:02d}:00',
+            'end_time': f'{hour + 1:02d}:00',
+        })
+        if response.status_code >= 500:
+            local['errors'] += 1
+            continue
+
+        location = response.headers.get('Location', '')
+        if '/student/payment/' not in location:
+            local['slot_taken'] += 1
+            continue
+
+        response = client.post(location, data=PAYMENT_FORM)
+        local['errors' if response.status_code >= 500 else 'booked'] += 1
+
+    with lock:
+        counts.update(local)
+
+
+def reader_client(app, username, profile_ids, deadline, counts, lock):
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': 'bench'})
+    local = Counter()
+
+    while time.perf_counter() < deadline:
+        if random.random() < 0.5:
+            response = client.get('/api/tutors?sort=price')
+        else:
+            response = client.post('/student/get_available_times', json={
+                'tutor_id': random.choice(profile_ids),
+                'date': datetime.date.today().isoformat(),
+            })
+        local['errors' if response.status_code >= 500 else 'reads'] += 1
+
+    with lock:
+        counts.update(local)
+
+
+def run(label, config, args):
+    app = create_app(config)
+    # Failures are counted below; the tracebacks behind them would drown the table
+    app.logger.disabled = True
+    profile_ids = seed(app, args.tutors, args.clients + args.readers)
+
+    counts = Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=booking_client, args=(app, f'bench_student{i}', profile_ids, deadline, counts, lock))
+        for i in range(args.clients)
+    ] + [
+        threading.Thread(target=reader_client, args=(app, f'bench_student{args.clients + i}', profile_ids, deadline, counts, lock))
+        for i in range(args.readers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        db.engine.dispose()
+
+    print(f'{label:<28} {counts["booked"] / elapsed:>10.1f} {counts["reads"] / elapsed:>10.1f} '
+          f'{counts["slot_taken"]:>10} {counts["errors"]:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16, help='Threads booking and paying')
+    parser.add_argument('--readers', type=int, default=8, help='Threads reading search and slot APIs')
+    parser.add_argument('--tutors', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=15)
+    args = parser.parse_args()
+
+    print(f'{"settings":<28} {"bookings/s":>10} {"reads/s":>10} {"slot taken":>10} {"errors":>8}')
+
+    database_url = os.environ.get('DATABASE_URL')
+    if database_url:
+        run('configured DATABASE_URL', make_config(database_url, 'WAL', 'NORMAL', 5000), args)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        uri = f'sqlite:///{os.path.join(directory, "bench.db")}'
+        run('sqlite rollback journal', make_config(uri, 'DELETE', 'FULL', 0), args)
+        os.remove(os.path.join(directory, 'bench.db'))
+        run('sqlite WAL + busy_timeout', make_config(uri, 'WAL', 'NORMAL', 5000), args)
+
+
+if __name__ == '__main__':
+    main()
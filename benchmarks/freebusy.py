@@ -0,0 +1,75 @@
+"""Time the free/busy queries behind /api/freebusy on a large synthetic catalogue.
+
+Seeds a fresh SQLite database with many tutors (hourly slots 08:00-20:00 every
+day) and random confirmed bookings, then times "who is free tomorrow
+18:00-19:00" across every tutor and a 7-day matrix for one page of tutors:
+
+    python benchmarks/freebusy.py --tutors 3000 --bookings 20000
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+# Importing the concurrency benchmark also puts the repository root on sys.path
+from concurrency import make_config, seed
+
+from app import create_app, db
+
+
+def timed(f, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = f()
+        times.append(time.perf_counter() - started)
+    return result, statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tutors', type=int, default=3000)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(make_config(f'sqlite:///{os.path.join(directory, "freebusy.db")}', 'WAL', 'NORMAL', 5000))
+        profile_ids = seed(app, args.tutors, 1)
+
+        with app.app_context():
+            from freebusy import free_busy, free_during
+            from models import Booking, BookingStatus, User, Role
+
+            student_id = db.session.scalar(db.select(User.id).where(User.role == Role.STUDENT))
+            today = datetime.date.today()
+            db.session.execute(db.insert(Booking), [
+                {'student_id': student_id, 'tutor_profile_id': random.choice(profile_ids),
+                 'booking_date': today + datetime.timedelta(days=random.randint(0, 6)),
+                 'start_time': datetime.time(hour), 'end_time': datetime.time(hour + 1),
+                 'status': BookingStatus.CONFIRMED}
+                for hour in (random.randint(8, 19) for _ in range(args.bookings))
+            ])
+            db.session.commit()
+
+            tomorrow = today + datetime.timedelta(days=1)
+
+            def who_is_free():
+                ids, _, free = free_busy(tomorrow, 1, start_time=datetime.time(18), end_time=datetime.time(19))
+                return ids[free_during(free, datetime.time(18), datetime.time(19))]
+
+            free_ids, ms = timed(who_is_free, args.runs)
+            print(f'free tomorrow 18:00-19:00 across {args.tutors} tutors: {ms:.1f} ms ({len(free_ids)} free)')
+
+            page = profile_ids[:100]
+            _, ms = timed(lambda: free_busy(today, 7, page), args.runs)
+            print(f'7-day matrix for {len(page)} tutors: {ms:.1f} ms')
+
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Closed-loop HTTP load test reporting requests/sec and latency per route.
+
+Start the app under the server you want to measure (gunicorn, waitress or the
+development server), then for example:
+
+    python benchmarks/loadtest.py --base-url http://localhost:8000 \
+        --username student1 --password secret --concurrency 32 --duration 30 \
+        --path / --path /student/tutors --path /api/tutors --path /student/tutor/1
+"""
+import argparse
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+
+DEFAULT_PATHS = ['/', '/student/tutors', '/api/tutors']
+CSRF_TOKEN_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def login(session, base_url, username, password):
+    """Log a session in through the login form, passing the CSRF token if the form has one"""
+    page = session.get(f'{base_url}/login')
+    match = CSRF_TOKEN_PATTERN.search(page.text)
+    data = {'username': username, 'password': password}
+    if match:
+        data['csrf_token'] = match.group(1)
+
+    response = session.post(f'{base_url}/login', data=data, allow_redirects=False)
+    if response.status_code != 302:
+        raise SystemExit(f'Login failed for {username}: HTTP {response.status_code}')
+
+
+def worker(session, base_url, paths, deadline, results, errors, lock):
+    latencies = defaultdict(list)
+    failures = defaultdict(int)
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+
+        started = time.perf_counter()
+        try:
+            response = session.get(f'{base_url}{path}', allow_redirects=False)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+
+        if ok:
+            latencies[path].append(elapsed)
+        else:
+            failures[path] += 1
+
+    with lock:
+        for path, values in latencies.items():
+            results[path].extend(values)
+        for path, count in failures.items():
+            errors[path] += count
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--path', action='append', dest='paths', help='Route to request (repeatable)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Number of client threads')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to run')
+    parser.add_argument('--username', help='Log every client in as this user first')
+    parser.add_argument('--password')
+    args = parser.parse_args()
+
+    paths = args.paths or DEFAULT_PATHS
+    credentials = (args.username, args.password) if args.username else None
+    results = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    try:
+        requests.get(args.base_url, timeout=5)
+    except requests.RequestException as e:
+        raise SystemExit(f'Cannot reach {args.base_url}: {e}')
+
+    # Log every client in before the clock starts so password hashing isn't measured
+    sessions = [requests.Session() for _ in range(args.concurrency)]
+    if credentials:
+        for session in sessions:
+            login(session, args.base_url, *credentials)
+
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(session, args.base_url, paths, deadline, results, errors, lock))
+        for session in sessions
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f'{args.concurrency} clients for {elapsed:.1f}s against {args.base_url}')
+    print(f'{"path":<30} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    total = 0
+    for path in paths:
+        values = results.get(path, [])
+        total += len(values)
+        if not values:
+            print(f'{path:<30} {0:>8.1f} {"-":>8} {"-":>8} {"-":>8} {errors[path]:>7}')
+            continue
+        print(f'{path:<30} {len(values) / elapsed:>8.1f} '
+              f'{statistics.median(values) * 1000:>8.1f} '
+              f'{percentile(values, 0.95) * 1000:>8.1f} '
+              f'{percentile(values, 0.99) * 1000:>8.1f} '
+              f'{errors[path]:>7}')
+    print(f'{"total":<30} {total / elapsed:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
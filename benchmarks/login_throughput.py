@@ -0,0 +1,126 @@
+"""Measure login throughput for different password hashing settings.
+
+For each PASSWORD_HASH_METHOD, every student account is given a hash made with
+it, then client threads log in and out as fast as they can while reader
+threads poll the tutor search API. Reports logins per second (in total and
+per core), login latency and the read rate alongside, which shows how much
+the verification pool (PASSWORD_VERIFY_THREADS) shields other requests:
+
+    python benchmarks/login_throughput.py --clients 8 --pool 1 --duration 10
+    python benchmarks/login_throughput.py --methods scrypt pbkdf2:sha256:600000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+# Importing the concurrency benchmark also puts the repository root on sys.path
+from concurrency import make_config, seed
+
+from app import create_app, db
+
+
+DEFAULT_METHODS = ['scrypt', 'scrypt:16384:8:1', 'pbkdf2:sha256:600000', 'pbkdf2:sha256:100000']
+
+
+def core_count():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def login_client(app, username, deadline, latencies, failures, lock):
+    client = app.test_client()
+    local = []
+    failed = 0
+
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = client.post('/login', data={'username': username, 'password': 'bench'})
+        local.append(time.perf_counter() - started)
+        if response.status_code != 302 or '/login' in response.headers.get('Location', ''):
+            failed += 1
+        client.get('/logout')
+
+    with lock:
+        latencies.extend(local)
+        failures.append(failed)
+
+
+def reader_client(app, username, deadline, reads, lock):
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': 'bench'})
+    count = 0
+
+    while time.perf_counter() < deadline:
+        client.get('/api/tutors?sort=price')
+        count += 1
+
+    with lock:
+        reads.append(count)
+
+
+def run(uri, method, args):
+    class LoginConfig(make_config(uri, 'WAL', 'NORMAL', 5000)):
+        PASSWORD_HASH_METHOD = method
+        PASSWORD_VERIFY_THREADS = args.pool
+
+    app = create_app(LoginConfig)
+    seed(app, 10, args.clients + args.readers)
+
+    with app.app_context():
+        from models import User
+        from passwords import hash_password
+        db.session.execute(db.update(User).values(password_hash=hash_password('bench')))
+        db.session.commit()
+
+    latencies, failures, reads = [], [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=login_client, args=(app, f'bench_student{i}', deadline, latencies, failures, lock))
+        for i in range(args.clients)
+    ] + [
+        threading.Thread(target=reader_client, args=(app, f'bench_student{args.clients + i}', deadline, reads, lock))
+        for i in range(args.readers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        db.engine.dispose()
+
+    logins_per_second = len(latencies) / elapsed
+    p50 = statistics.median(latencies) * 1000 if latencies else float('nan')
+    p95 = statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else float('nan')
+    print(f'{method:<24} {logins_per_second:>9.1f} {logins_per_second / core_count():>10.1f} '
+          f'{p50:>9.1f} {p95:>9.1f} {sum(reads) / elapsed:>9.1f} {sum(failures):>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', nargs='+', default=DEFAULT_METHODS, help='PASSWORD_HASH_METHOD values to compare')
+    parser.add_argument('--clients', type=int, default=8, help='Threads logging in and out')
+    parser.add_argument('--readers', type=int, default=2, help='Threads reading the search API meanwhile')
+    parser.add_argument('--pool', type=int, default=1, help='PASSWORD_VERIFY_THREADS (0 verifies inline)')
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f'{core_count()} cores, verification pool of {args.pool}')
+    print(f'{"method":<24} {"logins/s":>9} {"per core":>10} {"p50 ms":>9} {"p95 ms":>9} {"reads/s":>9} {"failed":>8}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        for method in args.methods:
+            path = os.path.join(directory, 'login.db')
+            run(f'sqlite:///{path}', method, args)
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
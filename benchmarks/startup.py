@@ -0,0 +1,59 @@
+"""Measure application startup time in fresh interpreter processes.
+
+Each run starts a new Python process, imports the app module and calls
+create_app(), then serves one request so lazily created state (the database
+engine, first connection) is included. Run from the repository root:
+
+    python benchmarks/startup.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+STARTUP_SNIPPET = '''
+import time
+started = time.perf_counter()
+from app import create_app
+from config import CONFIGS
+app = create_app(CONFIGS[{config!r}])
+created = time.perf_counter()
+app.test_client().get("/logout")
+served = time.perf_counter()
+print(created - started, served - started)
+'''
+
+
+def measure(config, runs):
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    create_times, first_request_times = [], []
+
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SNIPPET.format(config=config)],
+            cwd=repo_root, capture_output=True, text=True, check=True
+        ).stdout.split()
+        create_times.append(float(output[-2]))
+        first_request_times.append(float(output[-1]))
+
+    return create_times, first_request_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--config', action='append', dest='configs',
+                        help='Config name from config.CONFIGS (repeatable, default: production and testing)')
+    args = parser.parse_args()
+
+    print(f'{"config":<12} {"create_app ms":>14} {"first request ms":>17}  (median of {args.runs})')
+    for config in args.configs or ['production', 'testing']:
+        create_times, first_request_times = measure(config, args.runs)
+        print(f'{config:<12} {statistics.median(create_times) * 1000:>14.1f} '
+              f'{statistics.median(first_request_times) * 1000:>17.1f}')
+
+
+if __name__ == '__main__':
+    main()
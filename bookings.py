@@ -0,0 +1,172 @@
+from collections import Counter
+
+from app import db
+from earnings import record_earnings, sessions_paid_for
+from models import TutorProfile, Booking, BookingSeries, BookingStatus, Payment, PaymentStatus
+from reservations import lock_tutor_calendar
+from stats import adjust_admin_stats
+
+
+MAX_BATCH_SIZE = 500
+
+
+def _owned_by(user):
+    """Filter matching the bookings a user may complete or cancel"""
+    if user.is_student():
+        return Booking.student_id == user.id
+    if user.is_tutor():
+        return Booking.tutor_profile_id.in_(
+            db.select(TutorProfile.id).where(TutorProfile.user_id == user.id)
+        )
+    return db.true()
+
+
+def owned_booking_statuses(booking_ids, user):
+    """Get {booking id: status} for the requested bookings the user may change, in one query"""
+    return dict(db.session.execute(
+        db.select(Booking.id, Booking.status)
+        .where(Booking.id.in_(booking_ids))
+        .where(_owned_by(user))
+    ).all())
+
+
+def complete_bookings(statuses):
+    """Mark confirmed bookings as completed with one UPDATE and commit.
+
+    `statuses` is the output of owned_booking_statuses. Pending, cancelled and
+    already completed bookings are left alone. Returns the number of bookings
+    completed and the sorted ids of those skipped.
+    """
+    # Checked again in the UPDATE in case a booking changed since it was read
+    result = db.session.execute(
+        db.update(Booking)
+        .where(Booking.id.in_(statuses))
+        .where(Booking.status == BookingStatus.CONFIRMED)
+        .values(status=BookingStatus.COMPLETED)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    if result.rowcount:
+        adjust_admin_stats(booking_count=-result.rowcount)
+    skipped = sorted(booking_id for booking_id, status in statuses.items() if status != BookingStatus.CONFIRMED)
+    return result.rowcount, skipped
+
+
+# Bookings that can still be cancelled: completed sessions have been given and
+# cancelled ones are done with
+CANCELLABLE_STATUSES = (BookingStatus.PENDING, BookingStatus.CONFIRMED)
+
+
+def cancel_bookings(statuses):
+    """Cancel bookings, refund what was paid for them and commit.
+
+    `statuses` is the output of owned_booking_statuses. Only pending and
+    confirmed bookings are cancelled; the others are skipped. Cancelling an
+    occurrence of a recurring series cancels the rest of its pending and
+    confirmed occurrences with it, but never ones already completed. A single
+    booking's payment is refunded in full. The one payment of a series is
+    refunded in proportion to the occurrences cancelled, and in full once
+    none of the sessions it still pays for are left. Payments still being
+    processed in the background are marked failed so the worker skips them.
+    Earnings are taken back out of the rollup with one upsert per tutor and
+    month. Returns the number of bookings cancelled, the number of payments
+    refunded and the sorted ids of the bookings skipped.
+    """
+    # Lock the calendars first, in a fixed order, so a concurrent cancel of the
+    # same bookings waits and then sees them cancelled instead of refunding twice
+    tutor_profile_ids = db.session.scalars(
+        db.select(Booking.tutor_profile_id).where(Booking.id.in_(list(statuses))).distinct()
+    ).all()
+    for tutor_profile_id in sorted(tutor_profile_ids):
+        lock_tutor_calendar(tutor_profile_id)
+
+    series_ids = db.select(Booking.series_id) \
+        .where(Booking.id.in_(list(statuses))) \
+        .where(Booking.series_id != None)
+    rows = db.session.execute(
+        db.select(Booking.id, Booking.status, Booking.series_id)
+        .where(db.or_(
+            Booking.id.in_(list(statuses)),
+            Booking.series_id.in_(series_ids) & Booking.status.in_(CANCELLABLE_STATUSES)
+        ))
+    ).all()
+    skipped = sorted(row.id for row in rows if row.status not in CANCELLABLE_STATUSES)
+    rows = [row for row in rows if row.status in CANCELLABLE_STATUSES]
+    booking_ids = [row.id for row in rows]
+
+    db.session.execute(
+        db.update(Booking)
+        .where(Booking.id.in_(booking_ids))
+        .values(status=BookingStatus.CANCELLED)
+        .execution_options(synchronize_session=False)
+    )
+
+    # Occurrences cancelled per series, and the bookings paid for one by one
+    series_sessions = Counter(row.series_id for row in rows if row.series_id is not None)
+    single_ids = [row.id for row in rows if row.series_id is None]
+
+    payments = db.session.execute(
+        db.select(Payment.id, Payment.amount, Payment.platform_fee, Payment.tutor_payout, Payment.payment_date,
+                  Payment.series_id, Booking.tutor_profile_id, sessions_paid_for().label('sessions'))
+        .join(Booking, Booking.id == Payment.booking_id)
+        .outerjoin(BookingSeries, BookingSeries.id == Payment.series_id)
+        .where(db.or_(Payment.series_id.in_(list(series_sessions)), Payment.booking_id.in_(single_ids)))
+        .where(Payment.status == PaymentStatus.COMPLETED)
+    ).all()
+
+    full_refunds = []
+    refunded_fees = 0
+    monthly = {}
+    for payment in payments:
+        sessions = series_sessions[payment.series_id] if payment.series_id is not None else payment.sessions
+        if sessions >= payment.sessions:
+            # Nothing left to give, so return whatever is still paid for
+            full_refunds.append(payment.id)
+            sessions = payment.sessions
+            fee, payout = payment.platform_fee, payment.tutor_payout
+        else:
+            amount = round(payment.amount * sessions / payment.sessions, 2)
+            fee, payout = Payment.calculate_fee(amount)
+            db.session.execute(
+                db.update(Payment)
+                .where(Payment.id == payment.id)
+                .values(amount=Payment.amount - amount,
+                        platform_fee=Payment.platform_fee - fee,
+                        tutor_payout=Payment.tutor_payout - payout,
+                        refunded_amount=Payment.refunded_amount + amount,
+                        refunded_sessions=Payment.refunded_sessions + sessions)
+                .execution_options(synchronize_session=False)
+            )
+        refunded_fees += fee
+
+        # Take refunded payouts back out of the months they were paid in
+        key = (payment.tutor_profile_id, payment.payment_date.year, payment.payment_date.month)
+        total_payout, total_sessions, payment_date = monthly.get(key, (0, 0, payment.payment_date))
+        monthly[key] = (total_payout + payout, total_sessions + sessions, payment_date)
+
+    if full_refunds:
+        db.session.execute(
+            db.update(Payment)
+            .where(Payment.id.in_(full_refunds))
+            .values(status=PaymentStatus.REFUNDED)
+            .execution_options(synchronize_session=False)
+        )
+
+    db.session.execute(
+        db.update(Payment)
+        .where(Payment.booking_id.in_(booking_ids))
+        .where(Payment.status == PaymentStatus.PENDING)
+        .values(status=PaymentStatus.FAILED)
+        .execution_options(synchronize_session=False)
+    )
+
+    for (tutor_profile_id, _, _), (payout, sessions, payment_date) in monthly.items():
+        record_earnings(tutor_profile_id, payment_date, -payout, sessions=-sessions)
+
+    db.session.commit()
+
+    confirmed = sum(1 for row in rows if row.status == BookingStatus.CONFIRMED)
+    if confirmed or refunded_fees:
+        adjust_admin_stats(booking_count=-confirmed, total_revenue=-refunded_fees)
+    return len(booking_ids), len(payments), skipped
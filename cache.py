@@ -0,0 +1,133 @@
+import functools
+import hashlib
+import os
+import uuid
+from datetime import datetime, timezone
+
+from cachelib import FileSystemCache, NullCache, RedisCache, SimpleCache
+from flask import current_app, request, session
+
+
+class Cache:
+    """Flask extension wrapping a cachelib backend selected from the app config.
+
+    CACHE_TYPE picks the backend: 'simple' for an in-process TTL cache, fit
+    for a single process only since bump() can't reach the others,
+    'filesystem' to share entries between processes on one host (CACHE_DIR),
+    'redis' to share them between hosts (CACHE_REDIS_URL) or 'null' to disable
+    caching altogether.
+    """
+
+    def __init__(self, app=None):
+        self._backend = NullCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_TYPE', 'simple')
+        app.config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+        app.config.setdefault('CACHE_KEY_PREFIX', 'studyq:')
+        app.config.setdefault('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('CACHE_THRESHOLD', 500)
+        if not app.config.get('CACHE_DIR'):
+            app.config['CACHE_DIR'] = os.path.join(app.instance_path, 'cache')
+
+        self._backend = self._create_backend(app.config)
+        app.extensions['cache'] = self
+
+    @staticmethod
+    def _create_backend(config):
+        cache_type = config['CACHE_TYPE']
+        timeout = config['CACHE_DEFAULT_TIMEOUT']
+
+        if cache_type == 'null':
+            return NullCache()
+
+        if cache_type == 'simple':
+            return SimpleCache(threshold=config['CACHE_THRESHOLD'], default_timeout=timeout)
+
+        if cache_type == 'filesystem':
+            return FileSystemCache(config['CACHE_DIR'], threshold=config['CACHE_THRESHOLD'], default_timeout=timeout)
+
+        if cache_type == 'redis':
+            # redis is only needed when this backend is configured
+            import redis
+            client = redis.Redis.from_url(config['CACHE_REDIS_URL'])
+            return RedisCache(host=client, default_timeout=timeout, key_prefix=config['CACHE_KEY_PREFIX'])
+
+        raise ValueError(f'Unknown CACHE_TYPE: {cache_type}')
+
+    @property
+    def shared(self):
+        """Whether entries are seen by every process using the same configuration"""
+        return isinstance(self._backend, (FileSystemCache, RedisCache))
+
+    def get(self, key):
+        return self._backend.get(key)
+
+    def set(self, key, value, timeout=None):
+        return self._backend.set(key, value, timeout=timeout)
+
+    def delete(self, key):
+        return self._backend.delete(key)
+
+    def clear(self):
+        return self._backend.clear()
+
+    def version(self, name):
+        """Get the current version token of a named group of cache entries"""
+        key = f'version:{name}'
+        token = self._backend.get(key)
+        if token is None:
+            # Fresh random tokens mean an evicted version can't bring back old entries
+            token = uuid.uuid4().hex
+            self._backend.add(key, token, timeout=0)
+            # Read back in case another process added one first; the null
+            # backend keeps nothing, so then this token is as good as any
+            token = self._backend.get(key) or token
+        return token
+
+    def bump(self, *names):
+        """Invalidate every entry keyed on the given versions"""
+        for name in names:
+            self._backend.set(f'version:{name}', uuid.uuid4().hex, timeout=0)
+
+    def cached_response(self, versions=(), timeout=None, unless=None):
+        """Decorator caching a view's whole response to GET requests.
+
+        Entries are keyed on the path, the query string and the current token
+        of each name in `versions`, so bump() invalidates them. Responses get an
+        ETag and Last-Modified, and a matching conditional request is answered
+        with 304 Not Modified. Requests for which unless() returns true, error
+        responses and responses that touched the session are never cached.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or (unless is not None and unless()):
+                    return view(*args, **kwargs)
+
+                tokens = ':'.join(self.version(name) for name in versions)
+                key = f'response:{request.full_path}:{tokens}'
+                entry = self.get(key)
+
+                if entry is None:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.direct_passthrough or session.modified:
+                        return response
+                    body = response.get_data()
+                    entry = {
+                        'body': body,
+                        'mimetype': response.mimetype,
+                        'etag': hashlib.md5(body).hexdigest(),
+                        'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+                    }
+                    self.set(key, entry, timeout=timeout)
+
+                response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+                response.set_etag(entry['etag'])
+                response.last_modified = entry['last_modified']
+                response.vary.add('Cookie')
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
@@ -0,0 +1,90 @@
+"""Cached tutor data shown on the landing page and tutor pages.
+
+Entries are invalidated by key rather than left to expire: call tutors_changed
+after a tutor profile or rating changes and reviews_changed after a review is
+added. Pages cached with cache.cached_response(versions=[TUTORS_VERSION]) are
+invalidated along with them.
+
+The cache may be shared with other processes, so entries hold plain dicts of
+the fields the pages display rather than ORM objects: no password hashes or
+email addresses are written to it, and templates can read them with the same
+attribute syntax without anything left to lazy load.
+"""
+from app import cache, db
+from models import Review, TutorProfile, User
+
+
+FEATURED_TUTOR_COUNT = 4
+
+# Only the newest reviews are shown on a tutor's page
+TUTOR_REVIEW_COUNT = 20
+
+# Version of everything derived from tutor profiles and ratings
+TUTORS_VERSION = 'tutors'
+
+REVIEWS_KEY = 'tutor_reviews:{}'
+
+
+def _public_user(user):
+    return {'id': user.id, 'username': user.username}
+
+
+def get_featured_tutors():
+    """Get (profile, user) dicts of the top-rated tutors, querying only when a tutor has changed"""
+    key = f'featured_tutors:{cache.version(TUTORS_VERSION)}'
+    featured = cache.get(key)
+    if featured is None:
+        rows = db.session.query(TutorProfile, User) \
+            .join(User, User.id == TutorProfile.user_id) \
+            .order_by(TutorProfile.avg_rating.desc(), TutorProfile.id.desc()) \
+            .limit(FEATURED_TUTOR_COUNT) \
+            .all()
+        featured = [
+            ({
+                'id': profile.id,
+                'bio': profile.bio,
+                'hourly_rate': profile.hourly_rate,
+                'years_experience': profile.years_experience,
+                'profile_image': profile.profile_image,
+                'proficiency_level': profile.proficiency_level,
+                'specialization': profile.specialization,
+                'avg_rating': profile.avg_rating,
+                'review_count': profile.review_count,
+            }, _public_user(user))
+            for profile, user in rows
+        ]
+        cache.set(key, featured)
+    return featured
+
+
+def get_tutor_reviews(tutor_profile_id):
+    """Get (review, user) dicts of a tutor's newest reviews, querying only after a new review"""
+    key = REVIEWS_KEY.format(tutor_profile_id)
+    reviews = cache.get(key)
+    if reviews is None:
+        rows = db.session.query(Review, User) \
+            .join(User, User.id == Review.student_id) \
+            .filter(Review.tutor_profile_id == tutor_profile_id) \
+            .order_by(Review.created_at.desc()) \
+            .limit(TUTOR_REVIEW_COUNT) \
+            .all()
+        reviews = [
+            ({
+                'id': review.id,
+                'rating': review.rating,
+                'comment': review.comment,
+                'created_at': review.created_at,
+            }, _public_user(user))
+            for review, user in rows
+        ]
+        cache.set(key, reviews)
+    return reviews
+
+
+def tutors_changed():
+    cache.bump(TUTORS_VERSION)
+
+
+def reviews_changed(tutor_profile_id):
+    cache.delete(REVIEWS_KEY.format(tutor_profile_id))
+    tutors_changed()
@@ -0,0 +1,295 @@
+import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+from app import db
+from catalogue import tutors_changed
+from earnings import rebuild_earnings_rollup
+from exports import EXPORT_FORMATS, EXPORT_KINDS, export_chunks, export_query
+from fulltext import create_search_index, rebuild_search_index
+from jobs import Worker
+from models import User, Role, TutorProfile, Review
+from slot_index import rebuild_slot_index
+from stats import invalidate_admin_stats
+from synthetic import DEFAULT_BATCH_SIZE, IMPORT_MODELS, generate_data, import_csv
+
+
+# Tables derived from others, with the function that fills them from scratch
+DERIVED_TABLES = {
+    'availability_bins': rebuild_slot_index,
+    'tutor_earnings_monthly': rebuild_earnings_rollup,
+}
+
+
+def add_missing_columns():
+    """Add model columns that are missing from existing tables.
+
+    db.create_all() only creates tables that don't exist yet, so columns added
+    to a model later have to be added to older database files by hand.
+    """
+    inspector = inspect(db.engine)
+    preparer = db.engine.dialect.identifier_preparer
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            column_spec = CreateColumn(column).compile(dialect=db.engine.dialect)
+            db.session.execute(db.text(
+                f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_spec}'
+            ))
+            added.append(f'{table.name}.{column.name}')
+
+    db.session.commit()
+    return added
+
+
+def _index_names(connection, table_name):
+    """Get the names of a table's indexes"""
+    # SQLAlchemy doesn't reflect expression indexes on SQLite, so ask SQLite directly
+    if connection.dialect.name == 'sqlite':
+        return set(connection.scalars(
+            db.text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+            {'table': table_name}
+        ))
+    return {index['name'] for index in inspect(connection).get_indexes(table_name)}
+
+
+def create_missing_indexes():
+    """Create model indexes that are missing from existing tables"""
+    created = []
+
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = _index_names(connection, table.name)
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+                    created.append(index.name)
+
+    return created
+
+
+def upgrade_schema():
+    """Bring the database schema in line with the models.
+
+    Returns a list of human-readable descriptions of the changes made.
+    """
+    existing_tables = set(inspect(db.engine).get_table_names())
+    db.create_all()
+    added_columns = add_missing_columns()
+    changes = [f'Added column {column}' for column in added_columns]
+    # A derived table added to an existing database starts out empty
+    if existing_tables:
+        for table_name, rebuild in DERIVED_TABLES.items():
+            if table_name not in existing_tables:
+                rebuild()
+                changes.append(f'Filled in {table_name}')
+    changes += [f'Created index {index}' for index in create_missing_indexes()]
+    if 'tutor_profiles.avg_rating' in added_columns:
+        backfill_rating_aggregates()
+        changes.append('Filled in tutor_profiles.avg_rating')
+    if create_search_index():
+        rebuild_search_index()
+        changes.append('Created full-text search index')
+    return changes
+
+
+def seed_admin():
+    """Create the admin account from the ADMIN_* settings if it doesn't exist yet"""
+    config = current_app.config
+    if User.query.filter_by(username=config['ADMIN_USERNAME']).first():
+        return False
+
+    admin_user = User(
+        username=config['ADMIN_USERNAME'],
+        email=config['ADMIN_EMAIL'],
+        role=Role.ADMIN,
+        created_at=datetime.datetime.utcnow()
+    )
+    admin_user.set_password(config['ADMIN_PASSWORD'])
+    db.session.add(admin_user)
+    db.session.commit()
+    return True
+
+
+def backfill_rating_aggregates():
+    """Recompute every tutor's stored rating aggregates from the reviews table"""
+    rating_sum = db.select(db.func.coalesce(db.func.sum(Review.rating), 0)) \
+        .where(Review.tutor_profile_id == TutorProfile.id) \
+        .scalar_subquery()
+    rating_count = db.select(db.func.count(Review.id)) \
+        .where(Review.tutor_profile_id == TutorProfile.id) \
+        .scalar_subquery()
+    avg_rating = db.select(db.func.coalesce(db.func.avg(Review.rating), 0)) \
+        .where(Review.tutor_profile_id == TutorProfile.id) \
+        .scalar_subquery()
+
+    result = db.session.execute(
+        db.update(TutorProfile).values(rating_sum=rating_sum, rating_count=rating_count, avg_rating=avg_rating)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def rebuild_derived_data():
+    """Recompute everything derived from the core tables after a bulk load"""
+    backfill_rating_aggregates()
+    rebuild_earnings_rollup()
+    rebuild_slot_index()
+    rebuild_search_index()
+    invalidate_admin_stats()
+    tutors_changed()
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create or upgrade the schema and seed the admin account."""
+    for change in upgrade_schema():
+        click.echo(change)
+    if seed_admin():
+        click.echo('Admin user created.')
+    click.echo('Database is ready.')
+
+
+@click.command('seed-admin')
+@with_appcontext
+def seed_admin_command():
+    """Create the admin account if it doesn't exist."""
+    if seed_admin():
+        click.echo('Admin user created.')
+    else:
+        click.echo('Admin user already exists.')
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Create missing tables, columns and indexes."""
+    for change in upgrade_schema():
+        click.echo(change)
+    click.echo('Database schema is up to date.')
+
+
+@click.command('backfill-ratings')
+@with_appcontext
+def backfill_ratings_command():
+    """Recompute stored tutor rating aggregates from reviews."""
+    count = backfill_rating_aggregates()
+    tutors_changed()
+    click.echo(f'Updated rating aggregates for {count} tutor profiles.')
+
+
+@click.command('backfill-earnings')
+@with_appcontext
+def backfill_earnings_command():
+    """Rebuild the monthly tutor earnings rollup from payments."""
+    count = rebuild_earnings_rollup()
+    click.echo(f'Rebuilt {count} monthly earnings rows.')
+
+
+@click.command('run-worker')
+@click.option('--threads', type=int, help='Jobs to run at once (default JOB_WORKER_THREADS).')
+@click.option('--once', is_flag=True, help='Exit once the queue is empty instead of polling.')
+@with_appcontext
+def run_worker_command(threads, once):
+    """Run queued background jobs and the periodic maintenance jobs."""
+    click.echo('Worker started.')
+    Worker(current_app._get_current_object(), threads).run(once=once)
+
+
+@click.command('rebuild-slot-index')
+@with_appcontext
+def rebuild_slot_index_command():
+    """Recreate the weekly time-slot index used by tutor search."""
+    count = rebuild_slot_index()
+    click.echo(f'Indexed {count} time bins.')
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Recreate the full-text index used by tutor search."""
+    count = rebuild_search_index()
+    click.echo(f'Indexed {count} tutors.')
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(EXPORT_KINDS))
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--start-date', type=click.DateTime(['%Y-%m-%d']), help='First booking or payment date to include.')
+@click.option('--end-date', type=click.DateTime(['%Y-%m-%d']), help='Last booking or payment date to include.')
+@click.option('--status', help='Only rows with this status, e.g. confirmed.')
+@click.option('--output', type=click.File('w', encoding='utf-8', lazy=True), default='-',
+              help='File to write to (default stdout).')
+@with_appcontext
+def export_command(kind, export_format, start_date, end_date, status, output):
+    """Export bookings or payments as CSV or NDJSON."""
+    try:
+        query = export_query(kind, start_date and start_date.date(), end_date and end_date.date(), status)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--status')
+    for chunk in export_chunks(query, export_format):
+        output.write(chunk)
+
+
+@click.command('generate-data')
+@click.option('--tutors', type=int, default=1000, show_default=True)
+@click.option('--students', type=int, default=5000, show_default=True)
+@click.option('--bookings', type=int, default=50000, show_default=True)
+@click.option('--review-rate', type=float, default=0.5, show_default=True,
+              help='Share of completed bookings that get a review.')
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Rows per insert and transaction.')
+@click.option('--seed', type=int, help='Random seed, for repeatable data.')
+@with_appcontext
+def generate_data_command(tutors, students, bookings, review_rate, batch_size, seed):
+    """Add synthetic tutors, students, bookings, payments and reviews for load testing."""
+    counts = generate_data(tutors, students, bookings, review_rate, batch_size, seed, progress=click.echo)
+    click.echo('Rebuilding derived data...')
+    rebuild_derived_data()
+    click.echo(', '.join(f'{count} {table}' for table, count in counts.items()) + ' added.')
+
+
+@click.command('import-csv')
+@click.argument('table', type=click.Choice(list(IMPORT_MODELS)))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, show_default=True,
+              help='Rows per insert and transaction.')
+@click.option('--skip-rebuild', is_flag=True,
+              help='Leave derived data alone, e.g. when more tables are still to be imported.')
+@with_appcontext
+def import_csv_command(table, file, batch_size, skip_rebuild):
+    """Bulk import rows into a table from a CSV file with a header line."""
+    try:
+        count = import_csv(table, file, batch_size)
+    except ValueError as e:
+        raise click.ClickException(f'{e} (rows before the failing batch were imported)')
+    click.echo(f'Imported {count} {table} rows.')
+    if not skip_rebuild:
+        click.echo('Rebuilding derived data...')
+        rebuild_derived_data()
+
+
+def init_app(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_admin_command)
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(backfill_ratings_command)
+    app.cli.add_command(backfill_earnings_command)
+    app.cli.add_command(run_worker_command)
+    app.cli.add_command(rebuild_slot_index_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(generate_data_command)
+    app.cli.add_command(import_csv_command)
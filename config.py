@@ -0,0 +1,97 @@
+import os
+import logging
+
+from database import engine_options, normalize_database_uri
+
+
+DATABASE_URI = normalize_database_uri(os.environ.get("DATABASE_URL", "sqlite:///german_tutors.db"))
+
+
+class Config:
+    """Base settings shared by every environment, overridable from the environment"""
+    SECRET_KEY = os.environ.get("SESSION_SECRET", "german-tutors-dev-key")
+    SQLALCHEMY_DATABASE_URI = DATABASE_URI
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(DATABASE_URI, os.environ)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # SQLite connect-time pragmas (see database.init_app). WAL lets readers
+    # carry on while a booking is being written; NORMAL sync is safe with WAL.
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+    LOG_LEVEL = logging.INFO
+
+    # Raise on lazy relationship loads (see models.raise_on_lazy_load)
+    RAISE_ON_LAZY_LOAD = os.environ.get("RAISE_ON_LAZY_LOAD") == "1"
+
+    # Request instrumentation (see metrics.QueryMetrics)
+    METRICS_SLOW_REQUEST_MS = int(os.environ.get("METRICS_SLOW_REQUEST_MS", 500))
+    METRICS_SLOW_QUERY_COUNT = int(os.environ.get("METRICS_SLOW_QUERY_COUNT", 20))
+
+    # Caching (see cache.Cache)
+    CACHE_TYPE = os.environ.get("CACHE_TYPE", "simple")
+    CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    # Used by the filesystem backend; defaults to a folder in the instance path
+    CACHE_DIR = os.environ.get("CACHE_DIR")
+    ADMIN_STATS_TIMEOUT = int(os.environ.get("ADMIN_STATS_TIMEOUT", 300))
+    # Seconds to cache each logged-in user and tutor profile between requests
+    # (see models.load_user); 0 loads them from the database on every request.
+    # Needs a filesystem or redis cache.
+    LOGIN_CACHE_TTL = int(os.environ.get("LOGIN_CACHE_TTL", 0))
+
+    # Minutes a PENDING booking holds its slot while the student pays (see reservations)
+    BOOKING_HOLD_MINUTES = int(os.environ.get("BOOKING_HOLD_MINUTES", 15))
+
+    # PostgreSQL text search configuration for the tutor search index
+    SEARCH_TS_CONFIG = os.environ.get("SEARCH_TS_CONFIG", "simple")
+
+    # Background jobs (see jobs.py). With PAYMENTS_ASYNC, student_payment queues
+    # the charge for `flask run-worker` instead of taking it inside the request
+    # and sends the student to a page that polls the payment's status.
+    PAYMENTS_ASYNC = os.environ.get("PAYMENTS_ASYNC") == "1"
+    JOB_WORKER_THREADS = int(os.environ.get("JOB_WORKER_THREADS", 4))
+    JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+    JOB_MAINTENANCE_INTERVAL = int(os.environ.get("JOB_MAINTENANCE_INTERVAL", 60))
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+    JOB_LOCK_TIMEOUT = int(os.environ.get("JOB_LOCK_TIMEOUT", 300))
+    JOB_RETENTION_DAYS = int(os.environ.get("JOB_RETENTION_DAYS", 7))
+
+    # Password hashing (see passwords.py). Existing hashes are upgraded to the
+    # current method as users log in.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    PASSWORD_SALT_LENGTH = int(os.environ.get("PASSWORD_SALT_LENGTH", 16))
+    PASSWORD_VERIFY_THREADS = int(os.environ.get("PASSWORD_VERIFY_THREADS", 1))
+
+    # Seed account created by `flask init-db`
+    ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
+    ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL", "admin@germantutors.com")
+    ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "admin123")
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    LOG_LEVEL = logging.DEBUG
+
+
+class ProductionConfig(Config):
+    LOG_LEVEL = logging.WARNING
+    # Shared by every worker on the host, so cache.bump invalidates for all of them
+    CACHE_TYPE = os.environ.get("CACHE_TYPE", "filesystem")
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options("sqlite://", os.environ)
+    WTF_CSRF_ENABLED = False
+    RAISE_ON_LAZY_LOAD = True
+    CACHE_TYPE = "null"
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"
+
+
+CONFIGS = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+    "testing": TestingConfig,
+}
@@ -0,0 +1,55 @@
+import sqlite3
+from sqlalchemy import event
+
+
+def normalize_database_uri(uri):
+    """Accept postgres:// URLs as issued by Heroku-style platforms"""
+    if uri.startswith("postgres://"):
+        return "postgresql://" + uri[len("postgres://"):]
+    return uri
+
+
+def engine_options(uri, environ):
+    """Build SQLALCHEMY_ENGINE_OPTIONS suited to the database behind `uri`"""
+    if uri.startswith("sqlite"):
+        # Pooled connections are handed between request threads, never shared
+        # by two at once; the rest of the tuning is done with pragmas in init_app
+        return {"connect_args": {"check_same_thread": False}}
+
+    # Every gunicorn worker process has its own pool and serves WEB_THREADS
+    # requests at a time, so one connection per thread is all it can use; the
+    # server's connection limit has to cover workers x (pool + overflow)
+    return {
+        "pool_size": int(environ.get("DB_POOL_SIZE", environ.get("WEB_THREADS", 4))),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 2)),
+        "pool_timeout": int(environ.get("DB_POOL_TIMEOUT", 30)),
+        # Recycle before server-side idle timeouts close connections under us
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": environ.get("DB_POOL_PRE_PING", "1") == "1",
+    }
+
+
+def init_app(app, db):
+    """Apply connect-time settings to the app's engine"""
+    with app.app_context():
+        engine = db.engine
+
+    if engine.dialect.name != "sqlite":
+        return
+
+    # busy_timeout makes concurrent writers queue for the file lock instead of
+    # failing straight away with "database is locked"
+    pragmas = {
+        "journal_mode": app.config["SQLITE_JOURNAL_MODE"],
+        "synchronous": app.config["SQLITE_SYNCHRONOUS"],
+        "busy_timeout": app.config["SQLITE_BUSY_TIMEOUT_MS"],
+    }
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
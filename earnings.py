@@ -0,0 +1,91 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from models import Booking, BookingSeries, Payment, PaymentStatus, TutorEarningsMonthly
+
+
+def sessions_paid_for():
+    """SQL expression for the sessions a payment still covers.
+
+    That is every occurrence of a series, otherwise one, less any occurrences
+    refunded since. Needs BookingSeries outer-joined on Payment.series_id.
+    """
+    return db.func.coalesce(BookingSeries.occurrences, 1) - Payment.refunded_sessions
+
+
+def record_earnings(tutor_profile_id, payment_date, payout, sessions=1):
+    """Add a payout to the tutor's monthly rollup as part of the current transaction.
+
+    Pass a negative payout and session count to take a refunded payment back out
+    of the month it was originally paid in.
+    """
+    values = {
+        'tutor_profile_id': tutor_profile_id,
+        'year': payment_date.year,
+        'month': payment_date.month,
+        'total_payout': payout,
+        'session_count': sessions,
+    }
+    increments = {
+        'total_payout': TutorEarningsMonthly.total_payout + payout,
+        'session_count': TutorEarningsMonthly.session_count + sessions,
+    }
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        db.session.execute(
+            insert(TutorEarningsMonthly)
+            .values(**values)
+            .on_conflict_do_update(index_elements=['tutor_profile_id', 'year', 'month'], set_=increments)
+        )
+        return
+
+    # Other backends have no portable upsert, so update first and insert on a miss
+    result = db.session.execute(
+        db.update(TutorEarningsMonthly)
+        .where(TutorEarningsMonthly.tutor_profile_id == tutor_profile_id)
+        .where(TutorEarningsMonthly.year == values['year'])
+        .where(TutorEarningsMonthly.month == values['month'])
+        .values(**increments)
+    )
+    if result.rowcount == 0:
+        db.session.execute(db.insert(TutorEarningsMonthly).values(**values))
+
+
+def get_monthly_earnings(tutor_profile_id):
+    """Get a tutor's monthly rollup rows in chronological order"""
+    return TutorEarningsMonthly.query \
+        .filter_by(tutor_profile_id=tutor_profile_id) \
+        .order_by(TutorEarningsMonthly.year, TutorEarningsMonthly.month) \
+        .all()
+
+
+def rebuild_earnings_rollup():
+    """Recompute the whole monthly rollup from completed payments"""
+    year = db.extract('year', Payment.payment_date)
+    month = db.extract('month', Payment.payment_date)
+
+    monthly_totals = db.select(
+            Booking.tutor_profile_id,
+            year,
+            month,
+            db.func.sum(Payment.tutor_payout),
+            db.func.sum(sessions_paid_for())
+        ) \
+        .select_from(Payment) \
+        .join(Booking, Booking.id == Payment.booking_id) \
+        .outerjoin(BookingSeries, BookingSeries.id == Payment.series_id) \
+        .filter(Payment.status == PaymentStatus.COMPLETED) \
+        .filter(Payment.payment_date != None) \
+        .group_by(Booking.tutor_profile_id, year, month)
+
+    db.session.execute(db.delete(TutorEarningsMonthly))
+    result = db.session.execute(
+        db.insert(TutorEarningsMonthly).from_select(
+            ['tutor_profile_id', 'year', 'month', 'total_payout', 'session_count'],
+            monthly_totals
+        )
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,136 @@
+"""Streaming CSV and NDJSON exports of bookings and payments.
+
+Exports select plain columns rather than ORM entities and read them with
+yield_per, which uses a server-side cursor where the database supports one. Rows
+are written out a batch at a time and never enter the session, so memory use
+stays flat however many rows are exported.
+"""
+import csv
+import datetime
+import io
+import json
+from enum import Enum
+
+from sqlalchemy.orm import aliased
+
+from app import db
+from models import User, TutorProfile, Booking, BookingStatus, Payment, PaymentStatus
+
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_KINDS = ('bookings', 'payments')
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _bookings_query(start_date, end_date, status):
+    Student = aliased(User)
+    Tutor = aliased(User)
+
+    query = db.select(
+            Booking.id, Booking.status, Booking.booking_date, Booking.start_time, Booking.end_time,
+            Booking.series_id, Booking.created_at,
+            Booking.student_id, Student.username.label('student_username'), Student.email.label('student_email'),
+            Booking.tutor_profile_id, Tutor.username.label('tutor_username')
+        ) \
+        .join(Student, Student.id == Booking.student_id) \
+        .join(TutorProfile, TutorProfile.id == Booking.tutor_profile_id) \
+        .join(Tutor, Tutor.id == TutorProfile.user_id) \
+        .order_by(Booking.id)
+
+    if start_date:
+        query = query.where(Booking.booking_date >= start_date)
+    if end_date:
+        query = query.where(Booking.booking_date <= end_date)
+    if status:
+        query = query.where(Booking.status == BookingStatus(status))
+    return query
+
+
+def _payments_query(start_date, end_date, status):
+    Student = aliased(User)
+    Tutor = aliased(User)
+
+    query = db.select(
+            Payment.id, Payment.status, Payment.payment_date, Payment.amount, Payment.currency,
+            Payment.platform_fee, Payment.tutor_payout, Payment.refunded_amount, Payment.refunded_sessions,
+            Payment.transaction_id,
+            Payment.booking_id, Payment.series_id,
+            Booking.student_id, Student.username.label('student_username'),
+            Booking.tutor_profile_id, Tutor.username.label('tutor_username')
+        ) \
+        .join(Booking, Booking.id == Payment.booking_id) \
+        .join(Student, Student.id == Booking.student_id) \
+        .join(TutorProfile, TutorProfile.id == Booking.tutor_profile_id) \
+        .join(Tutor, Tutor.id == TutorProfile.user_id) \
+        .order_by(Payment.id)
+
+    if start_date:
+        query = query.where(Payment.payment_date >= start_date)
+    if end_date:
+        query = query.where(Payment.payment_date < end_date + datetime.timedelta(days=1))
+    if status:
+        query = query.where(Payment.status == PaymentStatus(status))
+    return query
+
+
+def export_query(kind, start_date=None, end_date=None, status=None):
+    """Build the export query for bookings or payments.
+
+    Dates are inclusive and filter on the booking date or the payment date.
+    Raises ValueError for an unknown kind or status.
+    """
+    if kind == 'bookings':
+        return _bookings_query(start_date, end_date, status)
+    if kind == 'payments':
+        return _payments_query(start_date, end_date, status)
+    raise ValueError(f'Unknown export: {kind}')
+
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def _batches(query):
+    result = db.session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for batch in result.partitions():
+        yield [tuple(_plain(value) for value in row) for row in batch]
+
+
+def _take(buffer):
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
+
+
+def _csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield _take(buffer)
+    for batch in batches:
+        writer.writerows(batch)
+        yield _take(buffer)
+
+
+def _ndjson_chunks(columns, batches):
+    for batch in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in batch)
+
+
+def export_chunks(query, export_format):
+    """Run an export query, yielding the output as text chunks of one batch each"""
+    columns = [column.name for column in query.selected_columns]
+    if export_format == 'csv':
+        return _csv_chunks(columns, _batches(query))
+    if export_format == 'ndjson':
+        return _ndjson_chunks(columns, _batches(query))
+    raise ValueError(f'Unknown export format: {export_format}')
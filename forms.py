@@ -46,8 +46,10 @@ class TutorProfileForm(FlaskForm):
 
 class BookingForm(FlaskForm):
     booking_date = SelectField('Select Date', validators=[DataRequired()])
-    start_time = SelectField('Start Time', validators=[DataRequired()])
-    end_time = SelectField('End Time', validators=[DataRequired()])
+    # Options are filled in client-side from get_available_times, and the route
+    # checks the chosen times against availability itself
+    start_time = SelectField('Start Time', validators=[DataRequired()], validate_choice=False)
+    end_time = SelectField('End Time', validators=[DataRequired()], validate_choice=False)
     submit = SubmitField('Book Session')
 
 
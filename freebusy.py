@@ -0,0 +1,146 @@
+"""Free/busy bitmaps for many tutors at once.
+
+A tutor's day is cut into BIN_MINUTES bins. The weekly templates and the
+bookings of every tutor asked about are fetched in one query each and turned
+into boolean arrays indexed [tutor, day, bin] with NumPy, so answering "who is
+free on Tuesday 18:00-19:00" is a slice and an all() over thousands of tutors
+rather than a query per tutor and day.
+"""
+import datetime
+
+import numpy as np
+
+from app import db
+from models import Availability, Booking
+from reservations import active_booking_filter
+
+
+BIN_MINUTES = 15
+BINS_PER_DAY = 24 * 60 // BIN_MINUTES
+
+MAX_FREEBUSY_DAYS = 14
+MAX_FREEBUSY_TUTORS = 100
+
+
+def _minute_of_day(column):
+    # Computed in SQL so thousands of rows come back as plain integers instead
+    # of time objects to be parsed and picked apart in Python
+    return db.extract('hour', column) * 60 + db.extract('minute', column)
+
+
+def _bins(minutes, round_up):
+    minutes = np.asarray(minutes, dtype=np.int32)
+    if round_up:
+        minutes = minutes + BIN_MINUTES - 1
+    return minutes // BIN_MINUTES
+
+
+def _columns(rows, count):
+    """Transpose result rows into one tuple of values per column"""
+    return tuple(zip(*rows)) if rows else ((),) * count
+
+
+def _fill(shape, index, start_bins, end_bins):
+    """Mark the bin ranges [start, end) as set, using a difference array and one cumulative sum"""
+    # Empty ranges would add a negative run that cancels out overlapping ones
+    keep = start_bins < end_bins
+    index = tuple(axis[keep] for axis in index)
+
+    diff = np.zeros(shape + (BINS_PER_DAY + 1,), dtype=np.int32)
+    np.add.at(diff, index + (start_bins[keep],), 1)
+    np.add.at(diff, index + (end_bins[keep],), -1)
+    return np.cumsum(diff, axis=-1)[..., :BINS_PER_DAY] > 0
+
+
+def free_busy(start_date, days, tutor_ids=None, start_time=None, end_time=None):
+    """Compute which bins each tutor is free in over `days` days from start_date.
+
+    With tutor_ids=None every tutor with a weekly template is included. Passing
+    start_time and end_time only loads the slots and bookings overlapping that
+    time of day, which is all free_during needs and far fewer rows across a
+    whole catalogue; bins outside it are then meaningless. Returns (tutor ids,
+    dates, free) where `free` is a bool array indexed [tutor, day, bin]; a bin
+    is free if it lies entirely inside an available slot and doesn't touch a
+    confirmed booking or an active hold.
+    """
+    dates = [start_date + datetime.timedelta(days=i) for i in range(days)]
+    weekdays = sorted({date.weekday() for date in dates})
+
+    availability = db.select(Availability.tutor_profile_id, Availability.day_of_week,
+                             _minute_of_day(Availability.start_time), _minute_of_day(Availability.end_time)) \
+        .where(Availability.is_available == True) \
+        .where(Availability.day_of_week.in_(weekdays))
+    bookings = db.select(Booking.tutor_profile_id, Booking.booking_date,
+                         _minute_of_day(Booking.start_time), _minute_of_day(Booking.end_time)) \
+        .where(Booking.booking_date >= dates[0]) \
+        .where(Booking.booking_date <= dates[-1]) \
+        .where(active_booking_filter())
+    if start_time is not None:
+        availability = availability \
+            .where(Availability.start_time < end_time) \
+            .where(Availability.end_time > start_time)
+        bookings = bookings \
+            .where(Booking.start_time < end_time) \
+            .where(Booking.end_time > start_time)
+    if tutor_ids is not None:
+        availability = availability.where(Availability.tutor_profile_id.in_(tutor_ids))
+        bookings = bookings.where(Booking.tutor_profile_id.in_(tutor_ids))
+
+    # Plain tuples straight off the connection; ORM result rows cost more than
+    # the arrays built from them once there are tens of thousands
+    connection = db.session.connection()
+    slot_tutors, slot_days, slot_starts, slot_ends = _columns(connection.execute(availability).all(), 4)
+    booking_tutors, booking_dates, booking_starts, booking_ends = _columns(connection.execute(bookings).all(), 4)
+
+    if tutor_ids is None:
+        ids = np.unique(np.array(slot_tutors, dtype=np.int64))
+    else:
+        ids = np.unique(np.array(list(tutor_ids), dtype=np.int64))
+    if not len(ids):
+        return ids, dates, np.zeros((0, days, BINS_PER_DAY), dtype=bool)
+
+    # Weekly template per tutor, for the weekdays in the window only; only
+    # bins fully inside a slot count as free
+    weekly = _fill(
+        (len(ids), len(weekdays)),
+        (np.searchsorted(ids, np.array(slot_tutors, dtype=np.int64)),
+         np.searchsorted(weekdays, np.array(slot_days, dtype=np.intp))),
+        _bins(slot_starts, round_up=True),
+        _bins(slot_ends, round_up=False)
+    )
+    free = weekly[:, [weekdays.index(date.weekday()) for date in dates], :]
+
+    # Bookings block every bin they touch. Without a tutor filter the query
+    # also returns bookings of tutors without a template, so drop those.
+    booking_tutors = np.array(booking_tutors, dtype=np.int64)
+    positions = np.searchsorted(ids, booking_tutors)
+    known = ids[np.minimum(positions, len(ids) - 1)] == booking_tutors
+    day_index = {date: i for i, date in enumerate(dates)}
+    busy = _fill(
+        (len(ids), days),
+        (positions[known], np.array([day_index[date] for date in booking_dates], dtype=np.intp)[known]),
+        _bins(booking_starts, round_up=False)[known],
+        _bins(booking_ends, round_up=True)[known]
+    )
+
+    return ids, dates, free & ~busy
+
+
+def free_during(free, start_time, end_time, day=0):
+    """Get a bool array of the tutors free for the whole of start_time-end_time on a day"""
+    start_bin = _bins(start_time.hour * 60 + start_time.minute, round_up=False)
+    end_bin = _bins(end_time.hour * 60 + end_time.minute, round_up=True)
+    return free[:, day, start_bin:end_bin].all(axis=-1)
+
+
+def _format_bin(index):
+    minutes = int(index) * BIN_MINUTES
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def free_ranges(bins):
+    """Turn one day's bins into a list of [start, end] 'HH:MM' ranges of free time"""
+    edges = np.diff(np.concatenate(([0], bins.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return [[_format_bin(start), _format_bin(end)] for start, end in zip(starts, ends)]
@@ -0,0 +1,133 @@
+"""Full-text search over tutor profiles.
+
+On SQLite the index is an FTS5 virtual table keyed by tutor profile id; on
+PostgreSQL it is a table of weighted tsvector documents with a GIN index. In
+both cases it is a copy of the searchable text of each profile and its user,
+refreshed by index_tutor whenever a profile is saved. Other databases fall
+back to LIKE matching.
+"""
+import re
+
+from flask import current_app
+from sqlalchemy import inspect
+
+from app import db
+from models import TutorProfile, User
+
+
+FTS_TABLE = 'tutor_search_fts'
+
+# Relative weight of each column in SQLite's bm25() ranking, in table column order
+FTS_COLUMNS = ['username', 'specialization', 'proficiency_level', 'bio']
+FTS_WEIGHTS = [2.0, 4.0, 2.0, 1.0]
+
+# Same idea as PostgreSQL setweight() classes
+TSVECTOR_WEIGHTS = {'username': 'A', 'specialization': 'A', 'proficiency_level': 'B', 'bio': 'C'}
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def create_search_index():
+    """Create the full-text index table if the database supports one and it is missing.
+
+    Returns True if it was created; fill it with rebuild_search_index.
+    """
+    dialect = _dialect()
+    if dialect not in ('sqlite', 'postgresql') or inspect(db.engine).has_table(FTS_TABLE):
+        return False
+
+    if dialect == 'sqlite':
+        db.session.execute(db.text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({', '.join(FTS_COLUMNS)}, "
+            f"tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+    else:
+        db.session.execute(db.text(
+            f"CREATE TABLE {FTS_TABLE} ("
+            f"tutor_profile_id INTEGER PRIMARY KEY REFERENCES tutor_profiles (id), "
+            f"document TSVECTOR NOT NULL)"
+        ))
+        db.session.execute(db.text(f"CREATE INDEX ix_{FTS_TABLE}_document ON {FTS_TABLE} USING GIN (document)"))
+    db.session.commit()
+    return True
+
+
+def _populate(where=''):
+    """Copy the searchable text of the profiles matching `where` into the index"""
+    select_columns = 'tutor_profiles.id, users.username, tutor_profiles.specialization, ' \
+                     'tutor_profiles.proficiency_level, tutor_profiles.bio'
+    source = f'FROM tutor_profiles JOIN users ON users.id = tutor_profiles.user_id {where}'
+
+    if _dialect() == 'sqlite':
+        return f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) SELECT {select_columns} {source}"
+
+    document = ' || '.join(
+        f"setweight(to_tsvector(CAST(:config AS regconfig), coalesce({table}.{name}, '')), '{weight}')"
+        for name, weight in TSVECTOR_WEIGHTS.items()
+        for table in ['users' if name == 'username' else 'tutor_profiles']
+    )
+    return f"INSERT INTO {FTS_TABLE} (tutor_profile_id, document) SELECT tutor_profiles.id, {document} {source}"
+
+
+def index_tutor(tutor_profile_id):
+    """Refresh one tutor's entry in the index as part of the current transaction"""
+    dialect = _dialect()
+    if dialect not in ('sqlite', 'postgresql'):
+        return
+
+    db.session.flush()
+    key = 'rowid' if dialect == 'sqlite' else 'tutor_profile_id'
+    db.session.execute(db.text(f"DELETE FROM {FTS_TABLE} WHERE {key} = :id"), {'id': tutor_profile_id})
+    db.session.execute(db.text(_populate('WHERE tutor_profiles.id = :id')),
+                       {'id': tutor_profile_id, 'config': current_app.config['SEARCH_TS_CONFIG']})
+
+
+def rebuild_search_index():
+    """Recreate the whole index from the profiles and commit; returns the number of tutors indexed"""
+    if _dialect() not in ('sqlite', 'postgresql'):
+        return 0
+
+    create_search_index()
+    db.session.execute(db.text(f"DELETE FROM {FTS_TABLE}"))
+    result = db.session.execute(db.text(_populate()), {'config': current_app.config['SEARCH_TS_CONFIG']})
+    db.session.commit()
+    return result.rowcount
+
+
+def tutor_matches(text):
+    """Get a subquery of (tutor_profile_id, rank) for tutors matching every word of `text`.
+
+    Words match as prefixes, so "gram" finds "Grammar". A higher rank means a
+    better match. Returns None if `text` contains no words.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        # Quoting every word keeps FTS5 query syntax in user input from being interpreted
+        fts = db.table(FTS_TABLE, db.column('rowid'))
+        match = ' '.join(f'"{word}"*' for word in words)
+        bm25 = db.func.bm25(db.literal_column(FTS_TABLE), *FTS_WEIGHTS)
+        return db.select(fts.c.rowid.label('tutor_profile_id'), (-bm25).label('rank')) \
+            .select_from(fts) \
+            .where(db.literal_column(FTS_TABLE).op('MATCH')(match)) \
+            .subquery()
+
+    if dialect == 'postgresql':
+        fts = db.table(FTS_TABLE, db.column('tutor_profile_id'), db.column('document'))
+        query = db.func.to_tsquery(db.cast(current_app.config['SEARCH_TS_CONFIG'], db.literal_column('regconfig')),
+                                   ' & '.join(f'{word}:*' for word in words))
+        return db.select(fts.c.tutor_profile_id, db.func.ts_rank(fts.c.document, query).label('rank')) \
+            .where(fts.c.document.op('@@')(query)) \
+            .subquery()
+
+    # No full-text support: every word has to appear somewhere, unranked
+    searchable = [User.username, TutorProfile.specialization, TutorProfile.proficiency_level, TutorProfile.bio]
+    return db.select(TutorProfile.id.label('tutor_profile_id'), db.literal(0.0).label('rank')) \
+        .join(User, User.id == TutorProfile.user_id) \
+        .where(db.and_(*[db.or_(*[column.ilike(f'%{word}%') for column in searchable]) for word in words])) \
+        .subquery()
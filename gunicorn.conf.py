@@ -0,0 +1,42 @@
+"""Gunicorn settings for running the app across all cores on Linux.
+
+Every setting can be overridden from the environment, so the same file works
+on a laptop and on a large host. Send SIGHUP to the master process to reload
+workers gracefully after a deploy.
+"""
+import multiprocessing
+import os
+
+from config import CONFIGS
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Two processes per core plus one, gunicorn's usual starting point, each
+# serving requests on a few threads so a worker blocked on the database
+# doesn't idle its core
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+
+# The simple cache lives inside each worker, so invalidating an entry in one
+# would leave the others serving it until it expires
+if workers > 1 and CONFIGS[os.environ.get('APP_CONFIG', 'production')].CACHE_TYPE == 'simple':
+    raise RuntimeError('CACHE_TYPE=simple is per process; use filesystem or redis with more than one worker')
+
+# Finish in-flight requests on reload/shutdown instead of dropping them
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth; jitter avoids all
+# workers restarting at once
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 200))
+
+# Each worker imports the app itself so no database connections are shared
+# across fork()
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
@@ -0,0 +1,240 @@
+"""Database-backed background jobs.
+
+Code enqueues a job as part of its own transaction, and `flask run-worker`
+claims queued jobs and runs them on a thread pool. The worker also schedules
+the maintenance jobs below every JOB_MAINTENANCE_INTERVAL seconds: expiring
+abandoned booking holds, completing sessions that have ended, and purging old
+finished jobs. Several workers can share the queue; a job is claimed with a
+conditional UPDATE, so only one of them runs it.
+"""
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import current_app
+
+from app import db
+from models import Booking, BookingStatus, Payment, PaymentStatus, Job, JobStatus
+from payments import settle_payment
+from reservations import SlotUnavailable
+from stats import adjust_admin_stats
+
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+MAINTENANCE_JOBS = ['expire_holds', 'complete_past_bookings', 'purge_jobs']
+
+
+def job(name):
+    """Register a function as the handler for jobs called `name`"""
+    def decorator(f):
+        _handlers[name] = f
+        return f
+    return decorator
+
+
+def enqueue(name, run_at=None, **payload):
+    """Add a job to the session; it is queued when the caller commits"""
+    new_job = Job(name=name, payload=payload, run_at=run_at or datetime.datetime.now())
+    db.session.add(new_job)
+    return new_job
+
+
+def _claimable(now):
+    # Queued jobs that are due, and running jobs whose worker has gone quiet
+    stale = now - datetime.timedelta(seconds=current_app.config['JOB_LOCK_TIMEOUT'])
+    return db.or_(
+        db.and_(Job.status == JobStatus.QUEUED, Job.run_at <= now),
+        db.and_(Job.status == JobStatus.RUNNING, Job.locked_at < stale)
+    )
+
+
+def claim_jobs(limit):
+    """Mark up to `limit` due jobs as RUNNING for this worker and return their ids"""
+    now = datetime.datetime.now()
+    candidates = db.session.scalars(
+        db.select(Job.id)
+        .where(_claimable(now))
+        .order_by(Job.run_at, Job.id)
+        .limit(limit)
+    ).all()
+
+    # Re-check the condition in the UPDATE so a job another worker claimed in
+    # the meantime matches no rows here
+    claimed = []
+    for job_id in candidates:
+        result = db.session.execute(
+            db.update(Job)
+            .where(Job.id == job_id)
+            .where(_claimable(now))
+            .values(status=JobStatus.RUNNING, locked_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def run_job(job_id):
+    """Run a claimed job, then mark it done, retry it later, or mark it failed"""
+    claimed = db.session.get(Job, job_id)
+    name, payload = claimed.name, claimed.payload or {}
+
+    try:
+        if name not in _handlers:
+            raise LookupError(f'No handler registered for job {name!r}')
+        _handlers[name](**payload)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('Job %s (%s) failed', job_id, name)
+
+        claimed = db.session.get(Job, job_id)
+        claimed.last_error = repr(e)
+        if claimed.attempts < current_app.config['JOB_MAX_ATTEMPTS']:
+            # Back off 30s, 60s, 120s, ... between attempts
+            delay = 30 * 2 ** (claimed.attempts - 1)
+            claimed.status = JobStatus.QUEUED
+            claimed.run_at = datetime.datetime.now() + datetime.timedelta(seconds=delay)
+        else:
+            claimed.status = JobStatus.FAILED
+            claimed.finished_at = datetime.datetime.now()
+        db.session.commit()
+        return
+
+    claimed = db.session.get(Job, job_id)
+    claimed.status = JobStatus.DONE
+    claimed.finished_at = datetime.datetime.now()
+    db.session.commit()
+
+
+def schedule_maintenance():
+    """Queue each maintenance job that isn't already queued or running"""
+    pending = set(db.session.scalars(
+        db.select(Job.name)
+        .where(Job.name.in_(MAINTENANCE_JOBS))
+        .where(Job.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]))
+    ))
+    for name in MAINTENANCE_JOBS:
+        if name not in pending:
+            enqueue(name)
+    db.session.commit()
+
+
+class Worker:
+    """Polls the jobs table and runs claimed jobs on a thread pool"""
+
+    def __init__(self, app, threads=None):
+        self.app = app
+        self.threads = threads or app.config['JOB_WORKER_THREADS']
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            run_job(job_id)
+
+    def run(self, once=False):
+        """Process jobs until interrupted, or with once=True until the queue is empty"""
+        config = self.app.config
+        next_maintenance = 0
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            while True:
+                with self.app.app_context():
+                    if time.monotonic() >= next_maintenance:
+                        schedule_maintenance()
+                        next_maintenance = time.monotonic() + config['JOB_MAINTENANCE_INTERVAL']
+                    job_ids = claim_jobs(self.threads)
+
+                if job_ids:
+                    wait([pool.submit(self._run, job_id) for job_id in job_ids])
+                elif once:
+                    return
+                else:
+                    time.sleep(config['JOB_POLL_INTERVAL'])
+
+
+# Job handlers. Each commits its own work and must be safe to run twice,
+# since a job is retried if its worker dies before marking it done.
+
+@job('process_payment')
+def process_payment(payment_id):
+    """Take a payment submitted with PAYMENTS_ASYNC and confirm its booking"""
+    payment = db.session.get(Payment, payment_id)
+    if payment is None or payment.status != PaymentStatus.PENDING:
+        return
+    booking = db.session.get(Booking, payment.booking_id)
+
+    try:
+        settle_payment(payment, booking)
+    except SlotUnavailable:
+        # The hold lapsed and someone else booked the slot first
+        payment = db.session.get(Payment, payment_id)
+        payment.status = PaymentStatus.FAILED
+        db.session.get(Booking, payment.booking_id).status = BookingStatus.CANCELLED
+        db.session.commit()
+        return
+
+    db.session.commit()
+    adjust_admin_stats(booking_count=1, total_revenue=payment.platform_fee)
+
+
+@job('expire_holds')
+def expire_holds():
+    """Cancel pending bookings whose hold has run out without a payment in progress"""
+    now = datetime.datetime.now()
+    # Bookings made before holds existed have no expiry time, so age them out instead
+    hold_start = now - datetime.timedelta(minutes=current_app.config['BOOKING_HOLD_MINUTES'])
+    payment_in_progress = db.select(Payment.id) \
+        .where(Payment.booking_id == Booking.id) \
+        .where(Payment.status == PaymentStatus.PENDING) \
+        .exists()
+
+    result = db.session.execute(
+        db.update(Booking)
+        .where(Booking.status == BookingStatus.PENDING)
+        .where(db.or_(
+            Booking.hold_expires_at < now,
+            db.and_(Booking.hold_expires_at == None, Booking.created_at < hold_start)
+        ))
+        .where(~payment_in_progress)
+        .values(status=BookingStatus.CANCELLED)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if result.rowcount:
+        logger.info('Expired %d booking holds', result.rowcount)
+
+
+@job('complete_past_bookings')
+def complete_past_bookings():
+    """Mark confirmed bookings as completed once their session has ended"""
+    now = datetime.datetime.now()
+    result = db.session.execute(
+        db.update(Booking)
+        .where(Booking.status == BookingStatus.CONFIRMED)
+        .where(db.or_(
+            Booking.booking_date < now.date(),
+            db.and_(Booking.booking_date == now.date(), Booking.end_time <= now.time())
+        ))
+        .values(status=BookingStatus.COMPLETED)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if result.rowcount:
+        adjust_admin_stats(booking_count=-result.rowcount)
+        logger.info('Completed %d past bookings', result.rowcount)
+
+
+@job('purge_jobs')
+def purge_jobs():
+    """Delete finished jobs older than JOB_RETENTION_DAYS"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=current_app.config['JOB_RETENTION_DAYS'])
+    db.session.execute(
+        db.delete(Job)
+        .where(Job.status.in_([JobStatus.DONE, JobStatus.FAILED]))
+        .where(Job.finished_at < cutoff)
+    )
+    db.session.commit()
@@ -0,0 +1,154 @@
+import threading
+import time
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryMetrics:
+    """Per-request SQL query and template render instrumentation.
+
+    Counts the queries each request issues and how long they take, reports them
+    in a Server-Timing header, keeps running per-endpoint totals for the admin
+    metrics page and logs requests that cross the configured thresholds.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_SERVER_TIMING', True)
+        app.config.setdefault('METRICS_SLOW_REQUEST_MS', 500)
+        app.config.setdefault('METRICS_SLOW_QUERY_COUNT', 20)
+        app.extensions['query_metrics'] = self
+
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        # Listening on the Engine class covers engines created after startup too
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+        app.before_request(_start_request)
+        app.after_request(self._finish_request)
+
+    def _finish_request(self, response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+
+        total_ms = (time.perf_counter() - stats['started']) * 1000
+        db_ms = stats['db_time'] * 1000
+        render_ms = stats['render_time'] * 1000
+
+        if current_app.config['METRICS_SERVER_TIMING']:
+            response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{stats["count"]} queries"')
+            response.headers.add('Server-Timing', f'render;dur={render_ms:.1f}')
+            response.headers.add('Server-Timing', f'total;dur={total_ms:.1f}')
+
+        endpoint = request.endpoint or request.path
+        self._record(endpoint, stats['count'], db_ms, render_ms, total_ms)
+
+        if total_ms > current_app.config['METRICS_SLOW_REQUEST_MS'] or stats['count'] > current_app.config['METRICS_SLOW_QUERY_COUNT']:
+            slowest_ms, slowest_sql = stats['slowest']
+            current_app.logger.warning(
+                'Slow request %s %s: %.1f ms total, %d queries, %.1f ms in db, %.1f ms rendering; '
+                'slowest query %.1f ms: %s',
+                request.method, request.path, total_ms, stats['count'], db_ms, render_ms,
+                slowest_ms * 1000, slowest_sql
+            )
+
+        return response
+
+    def _record(self, endpoint, query_count, db_ms, render_ms, total_ms):
+        with self._lock:
+            totals = self._endpoints.setdefault(endpoint, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'db_ms': 0.0,
+                'render_ms': 0.0,
+                'total_ms': 0.0,
+                'max_total_ms': 0.0,
+            })
+            totals['requests'] += 1
+            totals['queries'] += query_count
+            totals['max_queries'] = max(totals['max_queries'], query_count)
+            totals['db_ms'] += db_ms
+            totals['render_ms'] += render_ms
+            totals['total_ms'] += total_ms
+            totals['max_total_ms'] = max(totals['max_total_ms'], total_ms)
+
+    def snapshot(self):
+        """Get per-endpoint averages and maximums collected by this process"""
+        with self._lock:
+            endpoints = {endpoint: dict(totals) for endpoint, totals in self._endpoints.items()}
+
+        summary = {}
+        for endpoint, totals in endpoints.items():
+            requests = totals['requests']
+            summary[endpoint] = {
+                'requests': requests,
+                'avg_queries': round(totals['queries'] / requests, 2),
+                'max_queries': totals['max_queries'],
+                'avg_db_ms': round(totals['db_ms'] / requests, 2),
+                'avg_render_ms': round(totals['render_ms'] / requests, 2),
+                'avg_total_ms': round(totals['total_ms'] / requests, 2),
+                'max_total_ms': round(totals['max_total_ms'], 2),
+            }
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+def _start_request():
+    g.query_stats = {
+        'started': time.perf_counter(),
+        'count': 0,
+        'db_time': 0.0,
+        'render_time': 0.0,
+        'slowest': (0.0, None),
+    }
+
+
+# The start time is kept on the execution context, which is discarded along
+# with it when a statement fails and after_cursor_execute never runs
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_start_time', None)
+    if started is None or not has_request_context():
+        return
+
+    stats = g.get('query_stats')
+    if stats is None:
+        return
+
+    elapsed = time.perf_counter() - started
+    stats['count'] += 1
+    stats['db_time'] += elapsed
+    if elapsed > stats['slowest'][0]:
+        stats['slowest'] = (elapsed, statement)
+
+
+def _before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.render_started = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    stats = g.get('query_stats') if has_request_context() else None
+    if stats is not None and 'render_started' in g:
+        stats['render_time'] += time.perf_counter() - g.pop('render_started')
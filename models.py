@@ -1,8 +1,14 @@
 from datetime import datetime
 from enum import Enum
+from flask import current_app, has_app_context
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from app import db, login_manager
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.hybrid import hybrid_property
+from app import cache, db, login_manager
+from passwords import hash_password, password_needs_rehash, verify_password
 
 
 class Role(Enum):
@@ -27,10 +33,13 @@ class User(UserMixin, db.Model):
     reviews_given = db.relationship('Review', foreign_keys='Review.student_id', backref='student')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return password_needs_rehash(self.password_hash)
     
     def is_student(self):
         return self.role == Role.STUDENT
@@ -44,6 +53,11 @@ class User(UserMixin, db.Model):
 
 class TutorProfile(db.Model):
     __tablename__ = 'tutor_profiles'
+    __table_args__ = (
+        db.Index('ix_tutor_profiles_hourly_rate', 'hourly_rate', 'id'),
+        db.Index('ix_tutor_profiles_rating_count', 'rating_count', 'id'),
+        db.Index('ix_tutor_profiles_avg_rating', 'avg_rating', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -54,24 +68,46 @@ class TutorProfile(db.Model):
     proficiency_level = db.Column(db.String(50), nullable=True)  # Beginner, Intermediate, Advanced, Native
     specialization = db.Column(db.String(100), nullable=True)  # Conversation, Grammar, Business German, etc.
     
+    # Rating aggregates, kept in step with the reviews table by record_review
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Stored rather than computed so rating sorts and filters can use an index
+    avg_rating = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    
+    # Bumped by reservations.lock_tutor_calendar to serialise bookings per tutor
+    calendar_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationships
     availability = db.relationship('Availability', backref='tutor_profile', cascade='all, delete-orphan')
     bookings = db.relationship('Booking', backref='tutor_profile', cascade='all, delete-orphan')
     reviews = db.relationship('Review', backref='tutor_profile', cascade='all, delete-orphan')
     
-    @property
-    def avg_rating(self):
-        if not self.reviews:
-            return 0
-        return sum(review.rating for review in self.reviews) / len(self.reviews)
-    
-    @property
+    @hybrid_property
     def review_count(self):
-        return len(self.reviews)
+        return self.rating_count
+    
+    def record_review(self, rating):
+        """Add a new review's rating to the stored aggregates"""
+        # Increment in SQL so concurrent reviews don't overwrite each other
+        self.rating_sum = TutorProfile.rating_sum + rating
+        self.rating_count = TutorProfile.rating_count + 1
+        # The right-hand side sees the row before this update
+        self.avg_rating = db.cast(TutorProfile.rating_sum + rating, db.Float) / (TutorProfile.rating_count + 1)
+
+
+# Serves the experience sort, which treats a missing value as no experience
+db.Index('ix_tutor_profiles_experience', db.func.coalesce(TutorProfile.years_experience, db.literal_column('0')),
+         TutorProfile.id)
 
 
 class Availability(db.Model):
     __tablename__ = 'availability'
+    __table_args__ = (
+        db.Index('ix_availability_tutor_day', 'tutor_profile_id', 'day_of_week', 'is_available'),
+        # Covers the "who is free at this time" query of free_busy across all tutors
+        db.Index('ix_availability_day_time', 'day_of_week', 'start_time', 'end_time', 'tutor_profile_id',
+                 'is_available'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     tutor_profile_id = db.Column(db.Integer, db.ForeignKey('tutor_profiles.id'), nullable=False)
@@ -81,6 +117,20 @@ class Availability(db.Model):
     is_available = db.Column(db.Boolean, default=True)
 
 
+class AvailabilityBin(db.Model):
+    """One time bin of the week covered by an available slot, for searching tutors by time (see slot_index.py)"""
+    __tablename__ = 'availability_bins'
+    __table_args__ = (
+        db.Index('ix_availability_bins_day_bin', 'day_of_week', 'bin', 'tutor_profile_id'),
+        db.Index('ix_availability_bins_tutor', 'tutor_profile_id'),
+    )
+    
+    availability_id = db.Column(db.Integer, db.ForeignKey('availability.id'), primary_key=True)
+    bin = db.Column(db.Integer, primary_key=True)
+    tutor_profile_id = db.Column(db.Integer, db.ForeignKey('tutor_profiles.id'), nullable=False)
+    day_of_week = db.Column(db.Integer, nullable=False)
+
+
 class BookingStatus(Enum):
     PENDING = "pending"
     CONFIRMED = "confirmed"
@@ -90,6 +140,11 @@ class BookingStatus(Enum):
 
 class Booking(db.Model):
     __tablename__ = 'bookings'
+    __table_args__ = (
+        db.Index('ix_bookings_tutor_date_status', 'tutor_profile_id', 'booking_date', 'status'),
+        db.Index('ix_bookings_student_status_date', 'student_id', 'status', 'booking_date'),
+        db.Index('ix_bookings_series_id', 'series_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -98,12 +153,31 @@ class Booking(db.Model):
     start_time = db.Column(db.Time, nullable=False)
     end_time = db.Column(db.Time, nullable=False)
     status = db.Column(db.Enum(BookingStatus), default=BookingStatus.PENDING)
+    # PENDING bookings hold their slot until this time while the student pays
+    hold_expires_at = db.Column(db.DateTime, nullable=True)
+    series_id = db.Column(db.Integer, db.ForeignKey('booking_series.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship with payment
     payment = db.relationship('Payment', backref='booking', uselist=False, cascade='all, delete-orphan')
 
 
+class BookingSeries(db.Model):
+    """A weekly recurring booking: one Booking per occurrence, paid for with one Payment"""
+    __tablename__ = 'booking_series'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    tutor_profile_id = db.Column(db.Integer, db.ForeignKey('tutor_profiles.id'), nullable=False)
+    first_date = db.Column(db.Date, nullable=False)
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    occurrences = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    bookings = db.relationship('Booking', backref='series')
+
+
 class PaymentStatus(Enum):
     PENDING = "pending"
     COMPLETED = "completed"
@@ -113,9 +187,14 @@ class PaymentStatus(Enum):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_booking_id', 'booking_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    # Series payments cover every occurrence and are attached to the first one
     booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
+    series_id = db.Column(db.Integer, db.ForeignKey('booking_series.id'), nullable=True)
     amount = db.Column(db.Float, nullable=False)
     currency = db.Column(db.String(3), nullable=False, default="EUR")
     platform_fee = db.Column(db.Float, nullable=False)  # 20% of amount
@@ -123,6 +202,11 @@ class Payment(db.Model):
     status = db.Column(db.Enum(PaymentStatus), default=PaymentStatus.PENDING)
     transaction_id = db.Column(db.String(100), nullable=True)
     payment_date = db.Column(db.DateTime, nullable=True)
+    # Occurrences of a series cancelled while the rest went ahead, and the money
+    # returned for them. amount, platform_fee and tutor_payout are reduced by
+    # each such partial refund, so they always hold what is still paid for.
+    refunded_sessions = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    refunded_amount = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
     
     @staticmethod
     def calculate_fee(amount):
@@ -132,8 +216,27 @@ class Payment(db.Model):
         return fee, payout
 
 
+class TutorEarningsMonthly(db.Model):
+    """Monthly rollup of a tutor's completed payouts, maintained by earnings.record_earnings"""
+    __tablename__ = 'tutor_earnings_monthly'
+    
+    tutor_profile_id = db.Column(db.Integer, db.ForeignKey('tutor_profiles.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)  # 1 = January, 12 = December
+    total_payout = db.Column(db.Float, nullable=False, default=0.0)
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    @property
+    def label(self):
+        return datetime(self.year, self.month, 1).strftime('%B %Y')
+
+
 class Review(db.Model):
     __tablename__ = 'reviews'
+    __table_args__ = (
+        db.Index('ix_reviews_tutor_created', 'tutor_profile_id', 'created_at'),
+        db.Index('ix_reviews_booking_id', 'booking_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -144,6 +247,108 @@ class Review(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job(db.Model):
+    """A unit of background work, picked up by `flask run-worker` (see jobs.py)"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.JSON, nullable=True)
+    status = db.Column(db.Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+LOGIN_CACHE_KEY = 'login_user:{}'
+
+# Columns of the logged-in user and their tutor profile kept in the login
+# cache. The cache may be shared with other processes, so password hashes and
+# email addresses stay out of it, and so do the rating and calendar counters,
+# which change without a forget_login_user. A request that reads one of the
+# others loads it from the database.
+LOGIN_USER_FIELDS = ('id', 'username', 'role', 'created_at')
+LOGIN_PROFILE_FIELDS = ('id', 'user_id', 'bio', 'hourly_rate', 'years_experience', 'profile_image',
+                        'proficiency_level', 'specialization')
+
+
+def _login_cache_entry(user):
+    profile = user.tutor_profile
+    return (
+        {name: getattr(user, name) for name in LOGIN_USER_FIELDS},
+        None if profile is None else {name: getattr(profile, name) for name in LOGIN_PROFILE_FIELDS},
+    )
+
+
+def _user_from_login_cache(entry):
+    """Rebuild the cached user and profile as rows already in the database"""
+    user_fields, profile_fields = entry
+    user = User(**user_fields)
+    make_transient_to_detached(user)
+    profile = None
+    if profile_fields is not None:
+        profile = TutorProfile(**profile_fields)
+        make_transient_to_detached(profile)
+        set_committed_value(profile, 'user', user)
+    set_committed_value(user, 'tutor_profile', profile)
+    return db.session.merge(user, load=False)
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    """Load the logged-in user together with their tutor profile.
+    
+    Flask-Login keeps the result for the rest of the request, so routes can use
+    current_user.tutor_profile without another query. With LOGIN_CACHE_TTL set
+    the fields most requests read (LOGIN_USER_FIELDS and LOGIN_PROFILE_FIELDS)
+    are also cached across requests and merged back into the session without a
+    query at all; call forget_login_user when they change.
+    """
+    ttl = current_app.config['LOGIN_CACHE_TTL']
+    key = LOGIN_CACHE_KEY.format(int(user_id))
+    
+    if ttl:
+        cached = cache.get(key)
+        if cached is not None:
+            return _user_from_login_cache(cached)
+    
+    user = db.session.get(User, int(user_id), options=[joinedload(User.tutor_profile)])
+    if ttl and user is not None:
+        cache.set(key, _login_cache_entry(user), timeout=ttl)
+    return user
+
+
+def forget_login_user(user_id):
+    """Drop a user's cached login rows after their role or tutor profile changes"""
+    cache.delete(LOGIN_CACHE_KEY.format(user_id))
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def raise_on_lazy_load(orm_execute_state):
+    """Fail loudly on lazy loads when RAISE_ON_LAZY_LOAD is enabled.
+    
+    Routes are expected to declare the relationships they need with loader
+    options, so a lazy load here means a query per row slipped in somewhere.
+    """
+    if not orm_execute_state.is_select or orm_execute_state.lazy_loaded_from is None:
+        return
+    if not has_app_context() or not current_app.config.get('RAISE_ON_LAZY_LOAD'):
+        return
+    
+    instance = orm_execute_state.lazy_loaded_from.class_.__name__
+    raise InvalidRequestError(
+        f'Unexpected lazy load from {instance}; add a loader option to the query that loaded it'
+    )
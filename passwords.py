@@ -0,0 +1,60 @@
+"""Password hashing with a configurable algorithm and cost.
+
+PASSWORD_HASH_METHOD is any werkzeug method string, such as "scrypt",
+"scrypt:32768:8:1" or "pbkdf2:sha256:600000", and PASSWORD_SALT_LENGTH the
+length of the random salt. Hashes made with other settings still verify, and
+password_needs_rehash tells the login view to replace them.
+
+Verifying a password is the most CPU-heavy thing a request does, so it runs on
+a small pool of PASSWORD_VERIFY_THREADS threads per process. A burst of logins
+then queues for the pool instead of occupying every request thread, and the
+rest of the site stays responsive. A pool size of 0 verifies inline.
+"""
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def hash_password(password):
+    """Hash a password with the configured method"""
+    return generate_password_hash(password,
+                                  method=current_app.config['PASSWORD_HASH_METHOD'],
+                                  salt_length=current_app.config['PASSWORD_SALT_LENGTH'])
+
+
+@functools.lru_cache(maxsize=None)
+def _stored_method(method):
+    """Expand a method to the form stored in hashes, e.g. "scrypt" to "scrypt:32768:8:1" """
+    return generate_password_hash('', method=method, salt_length=1).split('$', 1)[0]
+
+
+def password_needs_rehash(password_hash):
+    """Whether a hash was made with other settings than the configured ones"""
+    # Hashes are stored as "method$salt$hash"
+    method, _, rest = password_hash.partition('$')
+    salt = rest.partition('$')[0]
+    return method != _stored_method(current_app.config['PASSWORD_HASH_METHOD']) \
+        or len(salt) != current_app.config['PASSWORD_SALT_LENGTH']
+
+
+def _verifier_pool(size):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix='password-verify')
+    return _pool
+
+
+def verify_password(password_hash, password):
+    """Check a password against a hash on the verification pool, waiting for the result"""
+    size = current_app.config['PASSWORD_VERIFY_THREADS']
+    if not size:
+        return check_password_hash(password_hash, password)
+    return _verifier_pool(size).submit(check_password_hash, password_hash, password).result()
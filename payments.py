@@ -0,0 +1,66 @@
+import datetime
+import uuid
+
+from app import db
+from earnings import record_earnings
+from models import Payment, PaymentStatus
+from reservations import confirm_reservation
+
+
+def create_payment(booking, amount):
+    """Add a PENDING payment for a booking to the session"""
+    platform_fee, tutor_payout = Payment.calculate_fee(amount)
+    payment = Payment(
+        booking_id=booking.id,
+        amount=amount,
+        platform_fee=platform_fee,
+        tutor_payout=tutor_payout,
+        status=PaymentStatus.PENDING
+    )
+    db.session.add(payment)
+    return payment
+
+
+def settle_payment(payment, booking):
+    """Take a pending payment and confirm its booking as part of the current transaction.
+
+    Raises reservations.SlotUnavailable, after rolling back, if the booking's
+    slot has been taken in the meantime. The caller commits otherwise.
+    """
+    confirm_reservation(booking)
+
+    # Process payment (mock)
+    payment.transaction_id = f"TRANS-{uuid.uuid4().hex[:8].upper()}"
+    payment.status = PaymentStatus.COMPLETED
+    payment.payment_date = datetime.datetime.now()
+
+    record_earnings(booking.tutor_profile_id, payment.payment_date, payment.tutor_payout)
+
+
+def pay_for_series(series, first_booking_id, hourly_rate):
+    """Take one payment covering every occurrence of a series as part of the current transaction.
+
+    The payment is attached to the series' first booking. Earnings are recorded
+    in the month of payment, counting one session per occurrence.
+    """
+    start_dt = datetime.datetime.combine(series.first_date, series.start_time)
+    end_dt = datetime.datetime.combine(series.first_date, series.end_time)
+    duration_hours = (end_dt - start_dt).total_seconds() / 3600
+    amount = round(hourly_rate * duration_hours * series.occurrences, 2)
+
+    platform_fee, tutor_payout = Payment.calculate_fee(amount)
+    payment = Payment(
+        booking_id=first_booking_id,
+        series_id=series.id,
+        amount=amount,
+        platform_fee=platform_fee,
+        tutor_payout=tutor_payout,
+        status=PaymentStatus.COMPLETED,
+        # Process payment (mock)
+        transaction_id=f"TRANS-{uuid.uuid4().hex[:8].upper()}",
+        payment_date=datetime.datetime.now()
+    )
+    db.session.add(payment)
+
+    record_earnings(series.tutor_profile_id, payment.payment_date, tutor_payout, sessions=series.occurrences)
+    return payment
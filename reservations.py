@@ -0,0 +1,169 @@
+import datetime
+
+from flask import current_app
+
+from app import db
+from models import TutorProfile, Availability, Booking, BookingSeries, BookingStatus
+
+
+MAX_SERIES_WEEKS = 52
+
+
+class SlotUnavailable(Exception):
+    """Raised when a requested slot overlaps a confirmed booking or an active hold.
+
+    For a series, `dates` lists the occurrences that can't be booked.
+    """
+    
+    def __init__(self, dates=()):
+        super().__init__(dates)
+        self.dates = list(dates)
+
+
+def active_booking_filter(now=None):
+    """Filter matching bookings that occupy their slot: confirmed, or pending with an unexpired hold"""
+    now = now or datetime.datetime.now()
+    return db.or_(
+        Booking.status == BookingStatus.CONFIRMED,
+        db.and_(Booking.status == BookingStatus.PENDING, Booking.hold_expires_at > now)
+    )
+
+
+def lock_tutor_calendar(tutor_profile_id):
+    """Take a write lock on the tutor's calendar for the rest of the transaction.
+
+    Every reservation for a tutor bumps the same row first, so a second request
+    for that tutor waits here until the first commits or rolls back and then
+    sees its booking in the conflict check. On SQLite the UPDATE takes the
+    database write lock; on PostgreSQL it takes the row lock.
+    """
+    db.session.execute(
+        db.update(TutorProfile)
+        .where(TutorProfile.id == tutor_profile_id)
+        .values(calendar_version=TutorProfile.calendar_version + 1)
+    )
+
+
+def find_conflict(tutor_profile_id, booking_date, start_time, end_time, exclude_booking_id=None):
+    """Get a booking that occupies any part of the given slot, if there is one"""
+    query = Booking.query \
+        .filter(Booking.tutor_profile_id == tutor_profile_id) \
+        .filter(Booking.booking_date == booking_date) \
+        .filter(Booking.start_time < end_time) \
+        .filter(Booking.end_time > start_time) \
+        .filter(active_booking_filter())
+
+    if exclude_booking_id is not None:
+        query = query.filter(Booking.id != exclude_booking_id)
+
+    return query.first()
+
+
+def reserve_slot(student_id, tutor_profile_id, booking_date, start_time, end_time):
+    """Hold a slot for a student as a PENDING booking and commit it.
+
+    The hold lasts BOOKING_HOLD_MINUTES, long enough to pay. Raises
+    SlotUnavailable if the slot was taken, in which case nothing is written.
+    """
+    lock_tutor_calendar(tutor_profile_id)
+
+    if find_conflict(tutor_profile_id, booking_date, start_time, end_time):
+        db.session.rollback()
+        raise SlotUnavailable()
+
+    hold_minutes = current_app.config['BOOKING_HOLD_MINUTES']
+    booking = Booking(
+        student_id=student_id,
+        tutor_profile_id=tutor_profile_id,
+        booking_date=booking_date,
+        start_time=start_time,
+        end_time=end_time,
+        status=BookingStatus.PENDING,
+        hold_expires_at=datetime.datetime.now() + datetime.timedelta(minutes=hold_minutes)
+    )
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+
+def confirm_reservation(booking):
+    """Mark a held booking CONFIRMED as part of the current transaction.
+
+    The slot is checked again under the calendar lock, because a hold that ran
+    out before payment may have been taken by someone else in the meantime.
+    Raises SlotUnavailable (after rolling back) if it was; the caller commits
+    otherwise.
+    """
+    lock_tutor_calendar(booking.tutor_profile_id)
+
+    if find_conflict(booking.tutor_profile_id, booking.booking_date, booking.start_time, booking.end_time,
+                     exclude_booking_id=booking.id):
+        db.session.rollback()
+        raise SlotUnavailable()
+
+    booking.status = BookingStatus.CONFIRMED
+    booking.hold_expires_at = None
+
+
+def reserve_series(student_id, tutor_profile_id, first_date, start_time, end_time, weeks):
+    """Book the same slot every week for `weeks` weeks as part of the current transaction.
+
+    All occurrences are checked together: the weekly template once, since
+    every occurrence falls on the same weekday, and existing bookings with a
+    single query over all the dates. The bookings are then inserted in one
+    bulk INSERT, already CONFIRMED since the series is paid for up front.
+    Raises SlotUnavailable (after rolling back) listing the dates that clash;
+    otherwise returns the series and the id of its first booking, and the
+    caller commits.
+    """
+    dates = [first_date + datetime.timedelta(weeks=week) for week in range(weeks)]
+    
+    lock_tutor_calendar(tutor_profile_id)
+    
+    covering_slot = Availability.query.filter_by(
+        tutor_profile_id=tutor_profile_id,
+        day_of_week=first_date.weekday(),
+        is_available=True
+    ).filter(
+        Availability.start_time <= start_time,
+        Availability.end_time >= end_time
+    ).first()
+    if not covering_slot:
+        db.session.rollback()
+        raise SlotUnavailable(dates)
+    
+    taken = db.session.scalars(
+        db.select(Booking.booking_date).distinct()
+        .where(Booking.tutor_profile_id == tutor_profile_id)
+        .where(Booking.booking_date.in_(dates))
+        .where(Booking.start_time < end_time)
+        .where(Booking.end_time > start_time)
+        .where(active_booking_filter())
+    ).all()
+    if taken:
+        db.session.rollback()
+        raise SlotUnavailable(sorted(taken))
+    
+    series = BookingSeries(
+        student_id=student_id,
+        tutor_profile_id=tutor_profile_id,
+        first_date=first_date,
+        start_time=start_time,
+        end_time=end_time,
+        occurrences=weeks
+    )
+    db.session.add(series)
+    db.session.flush()
+    
+    db.session.execute(db.insert(Booking), [
+        {'student_id': student_id, 'tutor_profile_id': tutor_profile_id, 'booking_date': date,
+         'start_time': start_time, 'end_time': end_time, 'status': BookingStatus.CONFIRMED,
+         'series_id': series.id}
+        for date in dates
+    ])
+    first_booking_id = db.session.scalar(
+        db.select(Booking.id)
+        .where(Booking.series_id == series.id)
+        .where(Booking.booking_date == first_date)
+    )
+    return series, first_booking_id
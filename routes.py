@@ -1,32 +1,63 @@
 import datetime
-import uuid
-from flask import render_template, redirect, url_for, flash, request, jsonify, session
+from flask import current_app, render_template, redirect, url_for, flash, request, jsonify, session, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
 from sqlalchemy import or_
-from sqlalchemy.orm import aliased
+from sqlalchemy.orm import aliased, contains_eager, selectinload
 
-from app import app, db
-from models import User, Role, TutorProfile, Availability, Booking, BookingStatus, Payment, PaymentStatus, Review
+from app import cache, db, metrics
+from bookings import MAX_BATCH_SIZE, cancel_bookings, complete_bookings, owned_booking_statuses
+from catalogue import TUTORS_VERSION, get_featured_tutors, get_tutor_reviews, reviews_changed, tutors_changed
+from models import User, Role, TutorProfile, Availability, Booking, BookingStatus, Payment, PaymentStatus, Review, TutorEarningsMonthly, forget_login_user
+from jobs import enqueue
+from payments import create_payment, pay_for_series, settle_payment
+from reservations import MAX_SERIES_WEEKS, SlotUnavailable, reserve_series, reserve_slot
+from schedule import DAY_NAMES, parse_weekly_template, replace_weekly_availability, serialize_weekly
+from earnings import get_monthly_earnings
+from exports import EXPORT_FORMATS, EXPORT_KINDS, export_chunks, export_query
+from freebusy import BIN_MINUTES, MAX_FREEBUSY_DAYS, MAX_FREEBUSY_TUTORS, free_busy, free_during, free_ranges
 from forms import LoginForm, RegistrationForm, TutorProfileForm, BookingForm, ReviewForm, AvailabilityForm, PaymentForm
-from utils import calculate_session_price, get_available_slots
+from fulltext import index_tutor
+from search import DEFAULT_PAGE_SIZE, DEFAULT_SORT, MAX_PRICE, RELEVANCE_SORT, SORT_OPTIONS, search_tutors, serialize_tutor
+from slot_index import index_slots, unindex_slots
+from stats import adjust_admin_stats, get_admin_stats
+from utils import IntervalIndex, calculate_session_price, get_available_slots, get_availability_window, get_weekly_availability
 
 
-@app.route('/')
+EARNINGS_PAYMENTS_PER_PAGE = 25
+
+# Views are collected here and added to each app by init_app. Unlike a
+# Blueprint this keeps endpoint names unprefixed, so url_for('login') in the
+# templates keeps working.
+_views = []
+
+
+def route(rule, **options):
+    """Register a view function for every app created by create_app"""
+    def decorator(view):
+        _views.append((rule, view, options))
+        return view
+    return decorator
+
+
+def init_app(app):
+    for rule, view, options in _views:
+        app.add_url_rule(rule, view.__name__, view, **options)
+
+
+def _personalised():
+    """Whether this request's pages show anything specific to the visitor"""
+    return current_user.is_authenticated or '_flashes' in session
+
+
+@route('/')
+@cache.cached_response(versions=[TUTORS_VERSION], unless=_personalised)
 def index():
     # Featured tutors (top rated)
-    featured_tutors = db.session.query(TutorProfile, User) \
-        .join(User, User.id == TutorProfile.user_id) \
-        .join(Review, Review.tutor_profile_id == TutorProfile.id, isouter=True) \
-        .group_by(TutorProfile.id) \
-        .order_by(db.func.avg(Review.rating).desc()) \
-        .limit(4) \
-        .all()
-    
-    return render_template('index.html', featured_tutors=featured_tutors)
+    return render_template('index.html', featured_tutors=get_featured_tutors())
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
@@ -35,6 +66,10 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data):
+            # Upgrade hashes made before the hashing settings last changed
+            if user.password_needs_rehash():
+                user.set_password(form.password.data)
+                db.session.commit()
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
             return redirect(next_page or url_for('dashboard'))
@@ -44,7 +79,7 @@ def login():
     return render_template('login.html', form=form)
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
@@ -64,21 +99,30 @@ def register():
         if form.role.data == 'tutor':
             profile = TutorProfile(user=user, hourly_rate=25.0)
             db.session.add(profile)
+            db.session.flush()
+            index_tutor(profile.id)
             
         db.session.commit()
+        
+        if user.is_tutor():
+            adjust_admin_stats(tutor_count=1)
+            tutors_changed()
+        else:
+            adjust_admin_stats(student_count=1)
+        
         flash('Your account has been created! You can now log in.', 'success')
         return redirect(url_for('login'))
     
     return render_template('register.html', form=form)
 
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     logout_user()
     return redirect(url_for('index'))
 
 
-@app.route('/dashboard')
+@route('/dashboard')
 @login_required
 def dashboard():
     if current_user.is_admin():
@@ -89,7 +133,7 @@ def dashboard():
         return redirect(url_for('student_dashboard'))
 
 
-@app.route('/student/dashboard')
+@route('/student/dashboard')
 @login_required
 def student_dashboard():
     if not current_user.is_student():
@@ -103,6 +147,7 @@ def student_dashboard():
         .filter(Booking.student_id == current_user.id) \
         .filter(Booking.status.in_([BookingStatus.CONFIRMED, BookingStatus.PENDING])) \
         .filter(Booking.booking_date >= datetime.date.today()) \
+        .options(selectinload(Booking.payment)) \
         .order_by(Booking.booking_date, Booking.start_time) \
         .all()
     
@@ -114,6 +159,7 @@ def student_dashboard():
         .filter(Booking.student_id == current_user.id) \
         .filter(Booking.status == BookingStatus.COMPLETED) \
         .filter(or_(Review.id == None, Booking.booking_date < datetime.date.today())) \
+        .options(selectinload(Booking.payment)) \
         .order_by(Booking.booking_date.desc()) \
         .limit(5) \
         .all()
@@ -123,7 +169,7 @@ def student_dashboard():
                            past_bookings=past_bookings)
 
 
-@app.route('/student/tutors')
+@route('/student/tutors')
 @login_required
 def student_tutor_list():
     if not current_user.is_student():
@@ -131,25 +177,13 @@ def student_tutor_list():
         return redirect(url_for('dashboard'))
     
     # Get filter parameters
-    min_price = request.args.get('min_price', type=float, default=0)
-    max_price = request.args.get('max_price', type=float, default=1000)
-    min_rating = request.args.get('min_rating', type=int, default=0)
-    specialization = request.args.get('specialization', type=str, default=None)
+    search_args = _tutor_search_args()
     
-    # Query tutors with filters
-    query = db.session.query(TutorProfile, User) \
-        .join(User, User.id == TutorProfile.user_id) \
-        .filter(TutorProfile.hourly_rate >= min_price) \
-        .filter(TutorProfile.hourly_rate <= max_price)
-    
-    if specialization:
-        query = query.filter(TutorProfile.specialization == specialization)
-    
-    tutors = query.all()
-    
-    # Filter by rating (can't do this in SQL with avg calculation)
-    if min_rating > 0:
-        tutors = [(profile, user) for profile, user in tutors if profile.avg_rating >= min_rating]
+    try:
+        tutors, next_cursor = search_tutors(**search_args)
+    except ValueError:
+        # Stale or tampered cursor, start again from the first page
+        tutors, next_cursor = search_tutors(**dict(search_args, cursor=None))
     
     # Get all available specializations for filter dropdown
     specializations = db.session.query(TutorProfile.specialization) \
@@ -160,14 +194,123 @@ def student_tutor_list():
     
     return render_template('student/tutor_list.html', 
                            tutors=tutors,
+                           next_cursor=next_cursor,
                            specializations=specializations,
-                           min_price=min_price,
-                           max_price=max_price,
-                           min_rating=min_rating,
-                           current_specialization=specialization)
+                           sort_options=list(SORT_OPTIONS),
+                           current_sort=search_args['sort'],
+                           min_price=search_args['min_price'],
+                           max_price=search_args['max_price'],
+                           min_rating=search_args['min_rating'],
+                           current_specialization=search_args['specialization'],
+                           current_date=search_args['date'],
+                           current_day=search_args['day_of_week'],
+                           current_start=search_args['start_time'],
+                           current_end=search_args['end_time'],
+                           current_q=search_args['q'])
+
+
+@route('/api/tutors')
+@login_required
+def api_tutor_list():
+    if not current_user.is_student():
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    try:
+        tutors, next_cursor = search_tutors(**_tutor_search_args())
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    return jsonify({
+        'tutors': [serialize_tutor(profile, user) for profile, user in tutors],
+        'next_cursor': next_cursor
+    })
+
+
+@route('/api/freebusy')
+@login_required
+def api_freebusy():
+    if not current_user.is_student():
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    try:
+        start_date = datetime.datetime.strptime(
+            request.args.get('start_date', datetime.date.today().strftime('%Y-%m-%d')), '%Y-%m-%d').date()
+        days = request.args.get('days', type=int, default=7)
+        tutor_ids = request.args.get('tutor_ids')
+        if tutor_ids is not None:
+            tutor_ids = [int(tutor_id) for tutor_id in tutor_ids.split(',') if tutor_id]
+        start_time = request.args.get('start')
+        end_time = request.args.get('end')
+        if start_time or end_time:
+            start_time = datetime.datetime.strptime(start_time or '', '%H:%M').time()
+            end_time = datetime.datetime.strptime(end_time or '', '%H:%M').time()
+    except ValueError:
+        return jsonify({'error': 'Invalid start_date, tutor_ids, start or end'}), 400
+    
+    # With a time range, answer "who is free then" across all tutors (or the ones given)
+    if start_time:
+        if start_time >= end_time:
+            return jsonify({'error': 'end must be after start'}), 400
+        ids, _, free = free_busy(start_date, 1, tutor_ids, start_time, end_time)
+        return jsonify({
+            'date': start_date.strftime('%Y-%m-%d'),
+            'start': start_time.strftime('%H:%M'),
+            'end': end_time.strftime('%H:%M'),
+            'tutor_ids': ids[free_during(free, start_time, end_time)].tolist()
+        })
+    
+    # Otherwise return the free time of a page of tutors, day by day
+    if not tutor_ids or len(tutor_ids) > MAX_FREEBUSY_TUTORS:
+        return jsonify({'error': f'Pass between 1 and {MAX_FREEBUSY_TUTORS} tutor_ids'}), 400
+    if not 1 <= days <= MAX_FREEBUSY_DAYS:
+        return jsonify({'error': f'days must be between 1 and {MAX_FREEBUSY_DAYS}'}), 400
+    
+    ids, dates, free = free_busy(start_date, days, tutor_ids)
+    return jsonify({
+        'bin_minutes': BIN_MINUTES,
+        'tutors': {
+            str(tutor_id): {
+                date.strftime('%Y-%m-%d'): free_ranges(free[i, day])
+                for day, date in enumerate(dates)
+            }
+            for i, tutor_id in enumerate(ids.tolist())
+        }
+    })
+
+
+def _tutor_search_args():
+    """Read tutor search filters, sort order and page position from the query string"""
+    # A date (YYYY-MM-DD) implies its weekday and also excludes tutors booked then;
+    # day (0 = Monday) searches the weekly schedules only
+    date = request.args.get('date', type=_parse_date, default=None)
+    # Free-text search over tutor names, bios and subjects, best match first by default
+    q = request.args.get('q', type=str, default='').strip() or None
+    
+    return {
+        'min_price': request.args.get('min_price', type=float, default=0),
+        'max_price': request.args.get('max_price', type=float, default=MAX_PRICE),
+        'min_rating': request.args.get('min_rating', type=int, default=0),
+        'specialization': request.args.get('specialization', type=str, default=None),
+        'sort': request.args.get('sort', type=str, default=RELEVANCE_SORT if q else DEFAULT_SORT),
+        'cursor': request.args.get('cursor', type=str, default=None),
+        'limit': request.args.get('limit', type=int, default=DEFAULT_PAGE_SIZE),
+        'day_of_week': date.weekday() if date else request.args.get('day', type=int, default=None),
+        'start_time': request.args.get('start', type=_parse_time, default=None),
+        'end_time': request.args.get('end', type=_parse_time, default=None),
+        'date': date,
+        'q': q,
+    }
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _parse_time(value):
+    return datetime.datetime.strptime(value, '%H:%M').time()
 
 
-@app.route('/student/tutor/<int:tutor_id>')
+@route('/student/tutor/<int:tutor_id>')
 @login_required
 def student_tutor_profile(tutor_id):
     if not current_user.is_student():
@@ -178,51 +321,15 @@ def student_tutor_profile(tutor_id):
     tutor_user = User.query.get_or_404(tutor_profile.user_id)
     
     # Get tutor reviews
-    reviews = db.session.query(Review, User) \
-        .join(User, User.id == Review.student_id) \
-        .filter(Review.tutor_profile_id == tutor_id) \
-        .order_by(Review.created_at.desc()) \
-        .all()
+    reviews = get_tutor_reviews(tutor_id)
     
     # Get availability for next 7 days
-    today = datetime.date.today()
-    dates = [today + datetime.timedelta(days=i) for i in range(7)]
-    availability = {}
-    
-    for date in dates:
-        day_of_week = date.weekday()  # 0 = Monday, 6 = Sunday
-        slots = Availability.query.filter_by(
-            tutor_profile_id=tutor_id,
-            day_of_week=day_of_week,
-            is_available=True
-        ).all()
-        
-        # Check if any slots are already booked
-        date_bookings = Booking.query.filter_by(
-            tutor_profile_id=tutor_id,
-            booking_date=date,
-            status=BookingStatus.CONFIRMED
-        ).all()
-        
-        booked_slots = [(b.start_time, b.end_time) for b in date_bookings]
-        available_slots = []
-        
-        for slot in slots:
-            # Check if slot overlaps with any booked slots
-            is_available = True
-            for booked_start, booked_end in booked_slots:
-                if not (slot.end_time <= booked_start or slot.start_time >= booked_end):
-                    is_available = False
-                    break
-            
-            if is_available:
-                available_slots.append({
-                    'start': slot.start_time.strftime('%H:%M'),
-                    'end': slot.end_time.strftime('%H:%M')
-                })
-        
-        if available_slots:
-            availability[date.strftime('%Y-%m-%d')] = available_slots
+    window = get_availability_window(tutor_id, datetime.date.today(), 7)
+    availability = {
+        date.strftime('%Y-%m-%d'): slots
+        for date, slots in window.items()
+        if slots
+    }
     
     return render_template('student/tutor_profile.html',
                            tutor_profile=tutor_profile,
@@ -231,7 +338,7 @@ def student_tutor_profile(tutor_id):
                            availability=availability)
 
 
-@app.route('/student/book/<int:tutor_id>', methods=['GET', 'POST'])
+@route('/student/book/<int:tutor_id>', methods=['GET', 'POST'])
 @login_required
 def student_book_tutor(tutor_id):
     if not current_user.is_student():
@@ -246,17 +353,13 @@ def student_book_tutor(tutor_id):
     # Populate the available dates dropdown
     today = datetime.date.today()
     available_dates = []
+    weekly_availability = get_weekly_availability(tutor_id)
     
     for i in range(14):  # Next 14 days
         check_date = today + datetime.timedelta(days=i)
-        day_of_week = check_date.weekday()
         
         # Check if tutor has availability on this day
-        if Availability.query.filter_by(
-            tutor_profile_id=tutor_id,
-            day_of_week=day_of_week,
-            is_available=True
-        ).first():
+        if check_date.weekday() in weekly_availability:
             available_dates.append((check_date.strftime('%Y-%m-%d'), check_date.strftime('%A, %b %d')))
     
     form.booking_date.choices = available_dates
@@ -268,55 +371,22 @@ def student_book_tutor(tutor_id):
         end_time = datetime.datetime.strptime(form.end_time.data, '%H:%M').time()
         
         # Check if slot is available
-        day_of_week = booking_date.weekday()
-        slot_available = Availability.query.filter_by(
-            tutor_profile_id=tutor_id,
-            day_of_week=day_of_week,
-            is_available=True
-        ).filter(
-            Availability.start_time <= start_time,
-            Availability.end_time >= end_time
-        ).first()
+        slot_available = any(
+            slot.start_time <= start_time and slot.end_time >= end_time
+            for slot in weekly_availability.get(booking_date.weekday(), [])
+        )
         
         if not slot_available:
             flash('This time slot is not available', 'danger')
             return redirect(url_for('student_book_tutor', tutor_id=tutor_id))
         
-        # Check if slot is already booked
-        existing_booking = Booking.query.filter_by(
-            tutor_profile_id=tutor_id,
-            booking_date=booking_date,
-            status=BookingStatus.CONFIRMED
-        ).filter(
-            or_(
-                (Booking.start_time <= start_time) & (Booking.end_time > start_time),
-                (Booking.start_time < end_time) & (Booking.end_time >= end_time),
-                (Booking.start_time >= start_time) & (Booking.end_time <= end_time)
-            )
-        ).first()
-        
-        if existing_booking:
+        # Hold the slot while the student pays, unless someone else already has it
+        try:
+            booking = reserve_slot(current_user.id, tutor_id, booking_date, start_time, end_time)
+        except SlotUnavailable:
             flash('This time slot has already been booked', 'danger')
             return redirect(url_for('student_book_tutor', tutor_id=tutor_id))
         
-        # Calculate duration and price
-        start_dt = datetime.datetime.combine(booking_date, start_time)
-        end_dt = datetime.datetime.combine(booking_date, end_time)
-        duration_hours = (end_dt - start_dt).total_seconds() / 3600
-        total_price = tutor_profile.hourly_rate * duration_hours
-        
-        # Create booking
-        booking = Booking(
-            student_id=current_user.id,
-            tutor_profile_id=tutor_id,
-            booking_date=booking_date,
-            start_time=start_time,
-            end_time=end_time,
-            status=BookingStatus.PENDING
-        )
-        db.session.add(booking)
-        db.session.commit()
-        
         # Redirect to payment page
         return redirect(url_for('student_payment', booking_id=booking.id))
     
@@ -326,7 +396,7 @@ def student_book_tutor(tutor_id):
                            tutor_user=tutor_user)
 
 
-@app.route('/student/get_available_times', methods=['POST'])
+@route('/student/get_available_times', methods=['POST'])
 @login_required
 def get_available_times():
     tutor_id = request.json.get('tutor_id')
@@ -335,48 +405,58 @@ def get_available_times():
     if not tutor_id or not date_str:
         return jsonify({'error': 'Missing parameters'}), 400
     
-    booking_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-    day_of_week = booking_date.weekday()
+    available_times = get_available_slots(tutor_id, date_str)
     
-    # Get available slots for this day
-    slots = Availability.query.filter_by(
-        tutor_profile_id=tutor_id,
-        day_of_week=day_of_week,
-        is_available=True
-    ).all()
+    return jsonify({'available_times': available_times})
+
+
+@route('/api/tutors/<int:tutor_id>/series', methods=['POST'])
+@login_required
+def api_book_series(tutor_id):
+    if not current_user.is_student():
+        return jsonify({'error': 'Permission denied'}), 403
     
-    # Check for existing bookings
-    bookings = Booking.query.filter_by(
-        tutor_profile_id=tutor_id,
-        booking_date=booking_date,
-        status=BookingStatus.CONFIRMED
-    ).all()
+    tutor_profile = TutorProfile.query.get_or_404(tutor_id)
     
-    booked_times = [(b.start_time, b.end_time) for b in bookings]
+    data = request.get_json(silent=True) or {}
+    try:
+        first_date = datetime.datetime.strptime(data.get('start_date', ''), '%Y-%m-%d').date()
+        start_time = datetime.datetime.strptime(data.get('start', ''), '%H:%M').time()
+        end_time = datetime.datetime.strptime(data.get('end', ''), '%H:%M').time()
+        weeks = int(data.get('weeks', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Expected start_date (YYYY-MM-DD), start and end (HH:MM) and weeks'}), 400
+    
+    if first_date < datetime.date.today() or start_time >= end_time:
+        return jsonify({'error': 'The series must start in the future and end after it starts'}), 400
+    if not 1 <= weeks <= MAX_SERIES_WEEKS:
+        return jsonify({'error': f'weeks must be between 1 and {MAX_SERIES_WEEKS}'}), 400
+    
+    # Book every occurrence and take one payment for all of them together
+    try:
+        series, first_booking_id = reserve_series(current_user.id, tutor_id, first_date, start_time, end_time, weeks)
+    except SlotUnavailable as e:
+        return jsonify({
+            'error': 'Some sessions in this series are not available',
+            'dates': [date.strftime('%Y-%m-%d') for date in e.dates]
+        }), 409
+    
+    payment = pay_for_series(series, first_booking_id, tutor_profile.hourly_rate)
+    result = {
+        'series_id': series.id,
+        'occurrences': weeks,
+        'amount': payment.amount,
+        'transaction_id': payment.transaction_id
+    }
+    platform_fee = payment.platform_fee
+    db.session.commit()
     
-    # Format available times
-    available_times = []
-    for slot in slots:
-        slot_start = slot.start_time
-        slot_end = slot.end_time
-        
-        # Check if slot overlaps with any booking
-        is_available = True
-        for booked_start, booked_end in booked_times:
-            if not (slot_end <= booked_start or slot_start >= booked_end):
-                is_available = False
-                break
-        
-        if is_available:
-            available_times.append({
-                'start': slot_start.strftime('%H:%M'),
-                'end': slot_end.strftime('%H:%M')
-            })
+    adjust_admin_stats(booking_count=weeks, total_revenue=platform_fee)
     
-    return jsonify({'available_times': available_times})
+    return jsonify(result), 201
 
 
-@app.route('/student/payment/<int:booking_id>', methods=['GET', 'POST'])
+@route('/student/payment/<int:booking_id>', methods=['GET', 'POST'])
 @login_required
 def student_payment(booking_id):
     if not current_user.is_student():
@@ -395,6 +475,10 @@ def student_payment(booking_id):
         flash('Payment has already been processed for this booking', 'info')
         return redirect(url_for('student_dashboard'))
     
+    if booking.status != BookingStatus.PENDING:
+        flash('This booking can no longer be paid for', 'danger')
+        return redirect(url_for('student_dashboard'))
+    
     tutor_profile = TutorProfile.query.get(booking.tutor_profile_id)
     tutor = User.query.get(tutor_profile.user_id)
     
@@ -409,26 +493,27 @@ def student_payment(booking_id):
     form = PaymentForm()
     
     if form.validate_on_submit():
-        # Process payment (mock)
-        transaction_id = f"TRANS-{uuid.uuid4().hex[:8].upper()}"
-        
-        # Create payment record
-        payment = Payment(
-            booking_id=booking.id,
-            amount=total_price,
-            platform_fee=platform_fee,
-            tutor_payout=tutor_payout,
-            status=PaymentStatus.COMPLETED,
-            transaction_id=transaction_id,
-            payment_date=datetime.datetime.now()
-        )
+        payment = create_payment(booking, total_price)
         
-        # Update booking status
-        booking.status = BookingStatus.CONFIRMED
+        if current_app.config['PAYMENTS_ASYNC']:
+            # Leave the charge to the background worker; the status page polls payment_status
+            db.session.flush()
+            enqueue('process_payment', payment_id=payment.id)
+            db.session.commit()
+            
+            return redirect(url_for('student_payment_pending', payment_id=payment.id))
         
-        db.session.add(payment)
+        # Confirm the slot as part of taking payment; the hold may have run out
+        tutor_id = booking.tutor_profile_id
+        try:
+            settle_payment(payment, booking)
+        except SlotUnavailable:
+            flash('Your hold on this time slot expired and it has since been booked', 'danger')
+            return redirect(url_for('student_book_tutor', tutor_id=tutor_id))
         db.session.commit()
         
+        adjust_admin_stats(booking_count=1, total_revenue=platform_fee)
+        
         flash('Your payment has been processed and the session is confirmed!', 'success')
         return redirect(url_for('student_dashboard'))
     
@@ -442,7 +527,59 @@ def student_payment(booking_id):
                            form=form)
 
 
-@app.route('/student/review/<int:booking_id>', methods=['GET', 'POST'])
+@route('/api/payment_status/<int:payment_id>')
+@login_required
+def payment_status(payment_id):
+    payment, booking = db.session.query(Payment, Booking) \
+        .join(Booking, Booking.id == Payment.booking_id) \
+        .filter(Payment.id == payment_id) \
+        .first_or_404()
+    
+    # Verify this payment belongs to the current user
+    if booking.student_id != current_user.id:
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    return jsonify({
+        'status': payment.status.value,
+        'booking_status': booking.status.value,
+        'transaction_id': payment.transaction_id
+    })
+
+
+@route('/student/payment/status/<int:payment_id>')
+@login_required
+def student_payment_pending(payment_id):
+    payment, booking = db.session.query(Payment, Booking) \
+        .join(Booking, Booking.id == Payment.booking_id) \
+        .filter(Payment.id == payment_id) \
+        .first_or_404()
+    
+    # Verify this payment belongs to the current user
+    if booking.student_id != current_user.id:
+        flash('You do not have permission to access this payment', 'danger')
+        return redirect(url_for('student_dashboard'))
+    
+    # Queued with PAYMENTS_ASYNC: the page polls payment_status until the worker has taken it
+    if payment.status == PaymentStatus.PENDING:
+        return render_template('student/payment_pending.html',
+                               payment=payment,
+                               booking=booking,
+                               status_url=url_for('payment_status', payment_id=payment.id))
+    
+    if payment.status == PaymentStatus.COMPLETED:
+        flash('Your payment has been processed and the session is confirmed!', 'success')
+        return redirect(url_for('student_dashboard'))
+    
+    if payment.status == PaymentStatus.FAILED:
+        # The hold ran out and the slot was booked, or the booking was cancelled
+        flash('Your payment could not be completed and the booking has been cancelled', 'danger')
+        return redirect(url_for('student_book_tutor', tutor_id=booking.tutor_profile_id))
+    
+    flash('This session has been cancelled and your payment refunded', 'info')
+    return redirect(url_for('student_dashboard'))
+
+
+@route('/student/review/<int:booking_id>', methods=['GET', 'POST'])
 @login_required
 def student_review(booking_id):
     if not current_user.is_student():
@@ -480,7 +617,9 @@ def student_review(booking_id):
             comment=form.comment.data
         )
         db.session.add(review)
+        tutor_profile.record_review(review.rating)
         db.session.commit()
+        reviews_changed(tutor_profile.id)
         
         flash('Your review has been submitted. Thank you for your feedback!', 'success')
         return redirect(url_for('student_dashboard'))
@@ -492,7 +631,7 @@ def student_review(booking_id):
                            tutor=tutor)
 
 
-@app.route('/tutor/dashboard')
+@route('/tutor/dashboard')
 @login_required
 def tutor_dashboard():
     if not current_user.is_tutor():
@@ -500,13 +639,17 @@ def tutor_dashboard():
         return redirect(url_for('dashboard'))
     
     # Get tutor profile
-    tutor_profile = TutorProfile.query.filter_by(user_id=current_user.id).first()
+    tutor_profile = current_user.tutor_profile
     
     if not tutor_profile:
         # Create a basic profile if it doesn't exist
-        tutor_profile = TutorProfile(user_id=current_user.id, hourly_rate=25.0)
+        tutor_profile = TutorProfile(user=current_user._get_current_object(), hourly_rate=25.0)
         db.session.add(tutor_profile)
+        db.session.flush()
+        index_tutor(tutor_profile.id)
         db.session.commit()
+        forget_login_user(current_user.id)
+        tutors_changed()
     
     # Get upcoming bookings
     upcoming_bookings = db.session.query(Booking, User) \
@@ -514,6 +657,7 @@ def tutor_dashboard():
         .filter(Booking.tutor_profile_id == tutor_profile.id) \
         .filter(Booking.status.in_([BookingStatus.CONFIRMED, BookingStatus.PENDING])) \
         .filter(Booking.booking_date >= datetime.date.today()) \
+        .options(selectinload(Booking.payment)) \
         .order_by(Booking.booking_date, Booking.start_time) \
         .all()
     
@@ -523,15 +667,14 @@ def tutor_dashboard():
         .join(User, User.id == Booking.student_id) \
         .filter(Booking.tutor_profile_id == tutor_profile.id) \
         .filter(Payment.status == PaymentStatus.COMPLETED) \
+        .options(contains_eager(Payment.booking)) \
         .order_by(Payment.payment_date.desc()) \
         .limit(5) \
         .all()
     
     # Calculate total earnings
-    total_earnings = db.session.query(db.func.sum(Payment.tutor_payout)) \
-        .join(Booking, Booking.id == Payment.booking_id) \
-        .filter(Booking.tutor_profile_id == tutor_profile.id) \
-        .filter(Payment.status == PaymentStatus.COMPLETED) \
+    total_earnings = db.session.query(db.func.sum(TutorEarningsMonthly.total_payout)) \
+        .filter(TutorEarningsMonthly.tutor_profile_id == tutor_profile.id) \
         .scalar() or 0
     
     # Get recent reviews
@@ -550,39 +693,46 @@ def tutor_dashboard():
                            recent_reviews=recent_reviews)
 
 
-@app.route('/tutor/profile', methods=['GET', 'POST'])
+@route('/tutor/profile', methods=['GET', 'POST'])
 @login_required
 def tutor_profile():
     if not current_user.is_tutor():
         flash('Access denied: You are not registered as a tutor', 'danger')
         return redirect(url_for('dashboard'))
     
-    tutor_profile = TutorProfile.query.filter_by(user_id=current_user.id).first()
+    tutor_profile = current_user.tutor_profile
     
     if not tutor_profile:
-        tutor_profile = TutorProfile(user_id=current_user.id, hourly_rate=25.0)
+        tutor_profile = TutorProfile(user=current_user._get_current_object(), hourly_rate=25.0)
         db.session.add(tutor_profile)
+        db.session.flush()
+        index_tutor(tutor_profile.id)
         db.session.commit()
+        forget_login_user(current_user.id)
+        tutors_changed()
     
     form = TutorProfileForm(obj=tutor_profile)
     
     if form.validate_on_submit():
         form.populate_obj(tutor_profile)
+        index_tutor(tutor_profile.id)
         db.session.commit()
+        forget_login_user(current_user.id)
+        tutors_changed()
         flash('Your profile has been updated!', 'success')
         return redirect(url_for('tutor_dashboard'))
     
     return render_template('tutor/profile.html', form=form, tutor_profile=tutor_profile)
 
 
-@app.route('/tutor/schedule', methods=['GET', 'POST'])
+@route('/tutor/schedule', methods=['GET', 'POST'])
 @login_required
 def tutor_schedule():
     if not current_user.is_tutor():
         flash('Access denied: You are not registered as a tutor', 'danger')
         return redirect(url_for('dashboard'))
     
-    tutor_profile = TutorProfile.query.filter_by(user_id=current_user.id).first()
+    tutor_profile = current_user.tutor_profile
     
     if not tutor_profile:
         flash('You need to set up your profile first', 'warning')
@@ -590,6 +740,9 @@ def tutor_schedule():
     
     form = AvailabilityForm()
     
+    # Get current availability for the whole week in one query
+    weekly_availability = get_weekly_availability(tutor_profile.id)
+    
     if form.validate_on_submit():
         day = form.day_of_week.data
         start_time = datetime.datetime.strptime(form.start_time.data, '%H:%M').time()
@@ -599,20 +752,11 @@ def tutor_schedule():
         if start_time >= end_time:
             flash('End time must be after start time', 'danger')
         else:
-            # Check for overlapping slots
-            overlapping = Availability.query.filter_by(
-                tutor_profile_id=tutor_profile.id,
-                day_of_week=day,
-                is_available=True
-            ).filter(
-                or_(
-                    (Availability.start_time <= start_time) & (Availability.end_time > start_time),
-                    (Availability.start_time < end_time) & (Availability.end_time >= end_time),
-                    (Availability.start_time >= start_time) & (Availability.end_time <= end_time)
-                )
-            ).first()
+            # Check for overlapping slots against the week already loaded
+            day_slots = weekly_availability.get(day, [])
+            existing = IntervalIndex((slot.start_time, slot.end_time) for slot in day_slots)
             
-            if overlapping:
+            if existing.overlaps(start_time, end_time):
                 flash('This time slot overlaps with an existing availability', 'danger')
             else:
                 availability = Availability(
@@ -623,19 +767,15 @@ def tutor_schedule():
                     is_available=True
                 )
                 db.session.add(availability)
+                db.session.flush()
+                index_slots([availability])
                 db.session.commit()
                 flash('Availability added successfully!', 'success')
+                
+                # The commit expired the loaded slots, so reload them in one go
+                weekly_availability = get_weekly_availability(tutor_profile.id)
     
-    # Get current availability
-    availabilities = {}
-    for day in range(7):  # 0 = Monday, 6 = Sunday
-        day_slots = Availability.query.filter_by(
-            tutor_profile_id=tutor_profile.id,
-            day_of_week=day,
-            is_available=True
-        ).order_by(Availability.start_time).all()
-        
-        availabilities[day] = day_slots
+    availabilities = {day: weekly_availability.get(day, []) for day in range(7)}  # 0 = Monday, 6 = Sunday
     
     # Get upcoming bookings
     upcoming_bookings = Booking.query.filter_by(
@@ -643,16 +783,47 @@ def tutor_schedule():
         status=BookingStatus.CONFIRMED
     ).filter(
         Booking.booking_date >= datetime.date.today()
+    ).options(
+        selectinload(Booking.student)
     ).order_by(Booking.booking_date, Booking.start_time).all()
     
     return render_template('tutor/schedule.html',
                            form=form,
                            availabilities=availabilities,
                            upcoming_bookings=upcoming_bookings,
-                           day_names=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
+                           day_names=DAY_NAMES)
+
+
+@route('/api/tutor/availability', methods=['GET', 'PUT'])
+@login_required
+def api_tutor_availability():
+    if not current_user.is_tutor():
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    tutor_profile = current_user.tutor_profile
+    if not tutor_profile:
+        return jsonify({'error': 'Tutor profile not found'}), 404
+    
+    if request.method == 'GET':
+        return jsonify({'availability': serialize_weekly(get_weekly_availability(tutor_profile.id))})
+    
+    # Replace the whole weekly template with the one sent
+    data = request.get_json(silent=True) or {}
+    try:
+        template = parse_weekly_template(data.get('availability'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    added, removed = replace_weekly_availability(tutor_profile.id, template)
+    
+    return jsonify({
+        'added': added,
+        'removed': removed,
+        'availability': serialize_weekly(get_weekly_availability(tutor_profile.id))
+    })
 
 
-@app.route('/tutor/availability/delete/<int:availability_id>', methods=['POST'])
+@route('/tutor/availability/delete/<int:availability_id>', methods=['POST'])
 @login_required
 def delete_availability(availability_id):
     if not current_user.is_tutor():
@@ -660,12 +831,13 @@ def delete_availability(availability_id):
         return redirect(url_for('dashboard'))
     
     availability = Availability.query.get_or_404(availability_id)
-    tutor_profile = TutorProfile.query.filter_by(user_id=current_user.id).first()
+    tutor_profile = current_user.tutor_profile
     
     if availability.tutor_profile_id != tutor_profile.id:
         flash('You do not have permission to delete this availability', 'danger')
         return redirect(url_for('tutor_schedule'))
     
+    unindex_slots([availability.id])
     db.session.delete(availability)
     db.session.commit()
     
@@ -673,56 +845,47 @@ def delete_availability(availability_id):
     return redirect(url_for('tutor_schedule'))
 
 
-@app.route('/tutor/earnings')
+@route('/tutor/earnings')
 @login_required
 def tutor_earnings():
     if not current_user.is_tutor():
         flash('Access denied: You are not registered as a tutor', 'danger')
         return redirect(url_for('dashboard'))
     
-    tutor_profile = TutorProfile.query.filter_by(user_id=current_user.id).first()
+    tutor_profile = current_user.tutor_profile
     
     if not tutor_profile:
         flash('You need to set up your profile first', 'warning')
         return redirect(url_for('tutor_profile'))
     
-    # Get all completed payments
-    payments = db.session.query(Payment, Booking, User) \
+    # Get one page of completed payments
+    page = request.args.get('page', 1, type=int)
+    pagination = db.session.query(Payment, Booking, User) \
         .join(Booking, Booking.id == Payment.booking_id) \
         .join(User, User.id == Booking.student_id) \
         .filter(Booking.tutor_profile_id == tutor_profile.id) \
         .filter(Payment.status == PaymentStatus.COMPLETED) \
+        .options(contains_eager(Payment.booking)) \
         .order_by(Payment.payment_date.desc()) \
-        .all()
-    
-    # Calculate total earnings
-    total_earnings = sum(payment.tutor_payout for payment, _, _ in payments)
-    
-    # Calculate monthly earnings for chart
-    monthly_earnings = {}
-    for payment, booking, _ in payments:
-        month = payment.payment_date.strftime('%B %Y')
-        if month in monthly_earnings:
-            monthly_earnings[month] += payment.tutor_payout
-        else:
-            monthly_earnings[month] = payment.tutor_payout
+        .paginate(page=page, per_page=EARNINGS_PAYMENTS_PER_PAGE, error_out=False)
     
-    # Sort months chronologically
-    sorted_months = sorted(monthly_earnings.keys(), 
-                          key=lambda x: datetime.datetime.strptime(x, '%B %Y'))
+    # Monthly earnings for the chart and the total come from the rollup table
+    monthly_earnings = get_monthly_earnings(tutor_profile.id)
+    total_earnings = sum(month.total_payout for month in monthly_earnings)
     chart_data = {
-        'labels': sorted_months,
-        'data': [monthly_earnings[month] for month in sorted_months]
+        'labels': [month.label for month in monthly_earnings],
+        'data': [round(month.total_payout, 2) for month in monthly_earnings]
     }
     
     return render_template('tutor/earnings.html',
                            tutor_profile=tutor_profile,
-                           payments=payments,
+                           payments=pagination.items,
+                           pagination=pagination,
                            total_earnings=total_earnings,
                            chart_data=chart_data)
 
 
-@app.route('/admin/dashboard')
+@route('/admin/dashboard')
 @login_required
 def admin_dashboard():
     if not current_user.is_admin():
@@ -730,12 +893,7 @@ def admin_dashboard():
         return redirect(url_for('dashboard'))
     
     # Get stats
-    tutor_count = User.query.filter_by(role=Role.TUTOR).count()
-    student_count = User.query.filter_by(role=Role.STUDENT).count()
-    booking_count = Booking.query.filter_by(status=BookingStatus.CONFIRMED).count()
-    total_revenue = db.session.query(db.func.sum(Payment.platform_fee)) \
-        .filter(Payment.status == PaymentStatus.COMPLETED) \
-        .scalar() or 0
+    stats = get_admin_stats()
     
     Student = aliased(User)
     Tutor = aliased(User)
@@ -745,6 +903,7 @@ def admin_dashboard():
         .join(TutorProfile, TutorProfile.id == Booking.tutor_profile_id) \
         .join(Tutor, Tutor.id == TutorProfile.user_id) \
         .filter(Booking.status.in_([BookingStatus.CONFIRMED, BookingStatus.COMPLETED])) \
+        .options(selectinload(Booking.payment)) \
         .order_by(Booking.created_at.desc()) \
         .limit(10) \
         .all()
@@ -759,80 +918,153 @@ def admin_dashboard():
         .join(TutorProfile, TutorProfile.id == Booking.tutor_profile_id) \
         .join(Tutor, Tutor.id == TutorProfile.user_id) \
         .filter(Payment.status == PaymentStatus.COMPLETED) \
+        .options(contains_eager(Payment.booking)) \
         .order_by(Payment.payment_date.desc()) \
         .limit(10) \
         .all()
 
     
-    # Top tutors by booking count
-    top_tutors = db.session.query(
-            TutorProfile, 
-            User, 
-            db.func.count(Booking.id).label('booking_count'),
-            db.func.sum(Payment.tutor_payout).label('earnings')
-        ) \
-        .join(User, User.id == TutorProfile.user_id) \
-        .join(Booking, Booking.tutor_profile_id == TutorProfile.id) \
-        .join(Payment, Payment.booking_id == Booking.id) \
-        .filter(Payment.status == PaymentStatus.COMPLETED) \
-        .group_by(TutorProfile.id) \
-        .order_by(db.func.count(Booking.id).desc()) \
-        .limit(5) \
-        .all()
+    # Top tutors by booking count, loading the cached tutors' profiles in one query
+    top_tutor_ids = [tutor_profile_id for tutor_profile_id, _, _ in stats['top_tutors']]
+    top_profiles = {
+        profile.id: (profile, user)
+        for profile, user in db.session.query(TutorProfile, User)
+            .join(User, User.id == TutorProfile.user_id)
+            .filter(TutorProfile.id.in_(top_tutor_ids))
+    }
+    top_tutors = [
+        (*top_profiles[tutor_profile_id], booking_count, earnings)
+        for tutor_profile_id, booking_count, earnings in stats['top_tutors']
+        if tutor_profile_id in top_profiles
+    ]
     
     return render_template('admin/dashboard.html',
-                           tutor_count=tutor_count,
-                           student_count=student_count,
-                           booking_count=booking_count,
-                           total_revenue=total_revenue,
+                           tutor_count=stats['tutor_count'],
+                           student_count=stats['student_count'],
+                           booking_count=stats['booking_count'],
+                           total_revenue=stats['total_revenue'],
                            recent_bookings=recent_bookings,
                            recent_payments=recent_payments,
                            top_tutors=top_tutors)
 
 
-@app.route('/api/complete_booking/<int:booking_id>', methods=['POST'])
+@route('/admin/metrics')
+@login_required
+def admin_metrics():
+    if not current_user.is_admin():
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    return jsonify({'endpoints': metrics.snapshot()})
+
+
+@route('/admin/export/<kind>')
+@login_required
+def admin_export(kind):
+    if not current_user.is_admin():
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    export_format = request.args.get('format', 'csv')
+    if kind not in EXPORT_KINDS or export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Export one of {", ".join(EXPORT_KINDS)} as {" or ".join(EXPORT_FORMATS)}'}), 400
+    
+    try:
+        start_date = request.args.get('start_date')
+        start_date = _parse_date(start_date) if start_date else None
+        end_date = request.args.get('end_date')
+        end_date = _parse_date(end_date) if end_date else None
+        query = export_query(kind, start_date, end_date, request.args.get('status'))
+    except ValueError:
+        return jsonify({'error': 'Invalid start_date, end_date or status'}), 400
+    
+    # Stream rows out as they are read instead of building the file in memory
+    filename = f'{kind}-{datetime.date.today():%Y%m%d}.{export_format}'
+    return current_app.response_class(
+        stream_with_context(export_chunks(query, export_format)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+@route('/api/complete_booking/<int:booking_id>', methods=['POST'])
 @login_required
 def complete_booking(booking_id):
-    booking = Booking.query.get_or_404(booking_id)
+    Booking.query.get_or_404(booking_id)
     
     # Verify permission
-    if current_user.is_student() and booking.student_id != current_user.id:
+    statuses = owned_booking_statuses([booking_id], current_user)
+    if not statuses:
         return jsonify({'error': 'Permission denied'}), 403
     
-    if current_user.is_tutor():
-        tutor_profile = TutorProfile.query.filter_by(user_id=current_user.id).first()
-        if not tutor_profile or booking.tutor_profile_id != tutor_profile.id:
-            return jsonify({'error': 'Permission denied'}), 403
-    
-    # Update booking status
-    booking.status = BookingStatus.COMPLETED
-    db.session.commit()
+    completed, _ = complete_bookings(statuses)
+    if not completed:
+        return jsonify({'error': 'Only confirmed bookings can be completed'}), 409
     
     return jsonify({'success': True})
 
 
-@app.route('/api/cancel_booking/<int:booking_id>', methods=['POST'])
+@route('/api/cancel_booking/<int:booking_id>', methods=['POST'])
 @login_required
 def cancel_booking(booking_id):
-    booking = Booking.query.get_or_404(booking_id)
+    Booking.query.get_or_404(booking_id)
     
     # Verify permission
-    if current_user.is_student() and booking.student_id != current_user.id:
+    statuses = owned_booking_statuses([booking_id], current_user)
+    if not statuses:
         return jsonify({'error': 'Permission denied'}), 403
     
-    if current_user.is_tutor():
-        tutor_profile = TutorProfile.query.filter_by(user_id=current_user.id).first()
-        if not tutor_profile or booking.tutor_profile_id != tutor_profile.id:
-            return jsonify({'error': 'Permission denied'}), 403
+    cancelled, _, _ = cancel_bookings(statuses)
+    if not cancelled:
+        return jsonify({'error': 'Only pending or confirmed bookings can be cancelled'}), 409
     
-    # Update booking status
-    booking.status = BookingStatus.CANCELLED
+    return jsonify({'success': True})
+
+
+@route('/api/bookings/complete', methods=['POST'])
+@login_required
+def complete_bookings_batch():
+    try:
+        booking_ids = _batch_booking_ids()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Refund payment if exists
-    payment = Payment.query.filter_by(booking_id=booking.id).first()
-    if payment and payment.status == PaymentStatus.COMPLETED:
-        payment.status = PaymentStatus.REFUNDED
+    statuses = owned_booking_statuses(booking_ids, current_user)
+    denied = sorted(set(booking_ids) - set(statuses))
+    if denied:
+        return jsonify({'error': 'Permission denied', 'booking_ids': denied}), 403
     
-    db.session.commit()
+    # Bookings that aren't confirmed are left as they are and reported back
+    completed, skipped = complete_bookings(statuses)
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'completed': completed, 'skipped': skipped})
+
+
+@route('/api/bookings/cancel', methods=['POST'])
+@login_required
+def cancel_bookings_batch():
+    try:
+        booking_ids = _batch_booking_ids()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    statuses = owned_booking_statuses(booking_ids, current_user)
+    denied = sorted(set(booking_ids) - set(statuses))
+    if denied:
+        return jsonify({'error': 'Permission denied', 'booking_ids': denied}), 403
+    
+    # Completed and already cancelled bookings are left as they are and reported back
+    cancelled, refunded, skipped = cancel_bookings(statuses)
+    
+    return jsonify({'success': True, 'cancelled': cancelled, 'refunded': refunded, 'skipped': skipped})
+
+
+def _batch_booking_ids():
+    """Read the distinct booking ids from a batch request's JSON body"""
+    booking_ids = (request.get_json(silent=True) or {}).get('booking_ids')
+    
+    if not isinstance(booking_ids, list) or not booking_ids \
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in booking_ids):
+        raise ValueError('booking_ids must be a non-empty list of integers')
+    if len(booking_ids) > MAX_BATCH_SIZE:
+        raise ValueError(f'At most {MAX_BATCH_SIZE} bookings per request')
+    
+    return list(set(booking_ids))
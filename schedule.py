@@ -0,0 +1,110 @@
+import datetime
+
+from app import db
+from models import Availability
+from slot_index import reindex_tutor, unindex_slots
+
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def _parse_time(value):
+    try:
+        return datetime.datetime.strptime(value, '%H:%M').time()
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid time {value!r}, expected HH:MM')
+
+
+def parse_weekly_template(slots):
+    """Validate a whole weekly template and return it as a set of (day, start, end).
+
+    `slots` is a list of {"day_of_week": 0-6, "start": "HH:MM", "end": "HH:MM"}.
+    Raises ValueError describing the first problem found, including slots
+    that overlap each other.
+    """
+    if not isinstance(slots, list):
+        raise ValueError('Expected a list of slots')
+
+    by_day = {}
+    for slot in slots:
+        if not isinstance(slot, dict):
+            raise ValueError('Each slot must be an object')
+
+        day = slot.get('day_of_week')
+        if not isinstance(day, int) or isinstance(day, bool) or not 0 <= day <= 6:
+            raise ValueError(f'Invalid day_of_week {day!r}, expected 0 (Monday) to 6 (Sunday)')
+
+        start_time = _parse_time(slot.get('start'))
+        end_time = _parse_time(slot.get('end'))
+        if start_time >= end_time:
+            raise ValueError(f'Slot {slot["start"]}-{slot["end"]} on {DAY_NAMES[day]} ends before it starts')
+
+        by_day.setdefault(day, []).append((start_time, end_time))
+
+    # Sorted by start, a day's slots overlap exactly when one starts before the previous one ends
+    template = set()
+    for day, intervals in by_day.items():
+        intervals.sort()
+        for (_, previous_end), (start_time, end_time) in zip(intervals, intervals[1:]):
+            if start_time < previous_end:
+                raise ValueError(f'Slots on {DAY_NAMES[day]} overlap at {start_time.strftime("%H:%M")}')
+        template.update((day, start_time, end_time) for start_time, end_time in intervals)
+
+    return template
+
+
+def replace_weekly_availability(tutor_profile_id, template):
+    """Make a tutor's availability match `template` in one transaction.
+
+    Slots already present are left alone, so only the difference is written:
+    one bulk DELETE for removed slots and one bulk INSERT for new ones.
+    Returns the number of slots added and removed.
+    """
+    existing = db.session.execute(
+        db.select(Availability.id, Availability.day_of_week, Availability.start_time,
+                  Availability.end_time, Availability.is_available)
+        .where(Availability.tutor_profile_id == tutor_profile_id)
+    ).all()
+
+    kept = set()
+    removed_ids = []
+    for row in existing:
+        key = (row.day_of_week, row.start_time, row.end_time)
+        if row.is_available and key in template and key not in kept:
+            kept.add(key)
+        else:
+            removed_ids.append(row.id)
+
+    added = [
+        {'tutor_profile_id': tutor_profile_id, 'day_of_week': day,
+         'start_time': start_time, 'end_time': end_time, 'is_available': True}
+        for day, start_time, end_time in sorted(template - kept)
+    ]
+
+    if removed_ids:
+        unindex_slots(removed_ids)
+        db.session.execute(
+            db.delete(Availability)
+            .where(Availability.id.in_(removed_ids))
+            .execution_options(synchronize_session=False)
+        )
+    if added:
+        db.session.execute(db.insert(Availability), added)
+        reindex_tutor(tutor_profile_id)
+    db.session.commit()
+
+    return len(added), len(removed_ids)
+
+
+def serialize_weekly(weekly):
+    """Turn get_weekly_availability output into a JSON-ready list of slots"""
+    return [
+        {
+            'id': slot.id,
+            'day_of_week': day,
+            'start': slot.start_time.strftime('%H:%M'),
+            'end': slot.end_time.strftime('%H:%M')
+        }
+        for day in sorted(weekly)
+        for slot in weekly[day]
+    ]
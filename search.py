@@ -0,0 +1,133 @@
+import base64
+import json
+
+from app import db
+from fulltext import tutor_matches
+from models import TutorProfile, User
+from slot_index import available_tutors_filter
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Top of the price filter, meaning no upper limit
+MAX_PRICE = 1000
+
+# Sort option -> (SQL sort key, descending). The experience key has to match
+# the expression of its index exactly, so its 0 is inlined rather than bound.
+SORT_OPTIONS = {
+    'rating': (TutorProfile.avg_rating, True),
+    'price': (TutorProfile.hourly_rate, False),
+    'experience': (db.func.coalesce(TutorProfile.years_experience, db.literal_column('0')), True),
+    'reviews': (TutorProfile.rating_count, True),
+}
+DEFAULT_SORT = 'rating'
+
+# Best full-text match first; only available together with a search query
+RELEVANCE_SORT = 'relevance'
+
+
+def encode_cursor(sort_value, tutor_id):
+    """Encode the position after a tutor as an opaque URL-safe cursor"""
+    payload = json.dumps([sort_value, tutor_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, tutor_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+    if not isinstance(sort_value, (int, float)) or not isinstance(tutor_id, int):
+        raise ValueError('Invalid cursor')
+    return sort_value, tutor_id
+
+
+def search_tutors(min_price=0, max_price=MAX_PRICE, min_rating=0, specialization=None,
+                  sort=DEFAULT_SORT, cursor=None, limit=DEFAULT_PAGE_SIZE,
+                  day_of_week=None, start_time=None, end_time=None, date=None, q=None):
+    """Get one page of (TutorProfile, User) rows and the cursor for the next page.
+
+    Uses keyset pagination on (sort key, tutor id) so every page is a single
+    bounded query, however deep into the catalogue it is. Given a weekday and
+    a start and end time, only tutors teaching then are included, looked up
+    in the slot index; given a date too, tutors booked then are left out.
+    Given a text query q, only tutors whose profile matches every word of it
+    are included and they can be sorted by relevance.
+    """
+    matches = tutor_matches(q) if q else None
+    if sort == RELEVANCE_SORT and matches is not None:
+        sort_key, descending = matches.c.rank, True
+    else:
+        sort_key, descending = SORT_OPTIONS.get(sort, SORT_OPTIONS[DEFAULT_SORT])
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    query = db.session.query(TutorProfile, User, sort_key.label('sort_value')) \
+        .join(User, User.id == TutorProfile.user_id)
+
+    # Only filter on price when asked to, otherwise the planner walks the price
+    # index for the whole catalogue instead of the index matching the sort
+    if min_price > 0:
+        query = query.filter(TutorProfile.hourly_rate >= min_price)
+    if max_price < MAX_PRICE:
+        query = query.filter(TutorProfile.hourly_rate <= max_price)
+
+    if matches is not None:
+        query = query.join(matches, matches.c.tutor_profile_id == TutorProfile.id)
+
+    if specialization:
+        query = query.filter(TutorProfile.specialization == specialization)
+
+    if min_rating > 0:
+        query = query.filter(TutorProfile.avg_rating >= min_rating)
+
+    if day_of_week is not None and start_time and end_time and start_time < end_time:
+        query = query.filter(available_tutors_filter(TutorProfile.id, day_of_week, start_time, end_time, date))
+
+    # Continue after the last tutor of the previous page
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        # Spelled out rather than as a row-value comparison, which SQLite can't
+        # seek an expression index with
+        if descending:
+            query = query.filter(sort_key <= last_value) \
+                .filter(db.or_(sort_key < last_value, TutorProfile.id < last_id))
+        else:
+            query = query.filter(sort_key >= last_value) \
+                .filter(db.or_(sort_key > last_value, TutorProfile.id > last_id))
+
+    # The id tie-break runs in the same direction so a (key, id) index serves the whole ordering
+    if descending:
+        order = [sort_key.desc(), TutorProfile.id.desc()]
+    else:
+        order = [sort_key.asc(), TutorProfile.id.asc()]
+    rows = query.order_by(*order) \
+        .limit(limit + 1) \
+        .all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_profile, _, last_value = rows[-1]
+        next_cursor = encode_cursor(last_value, last_profile.id)
+
+    return [(profile, user) for profile, user, _ in rows], next_cursor
+
+
+def serialize_tutor(profile, user):
+    """Convert a tutor profile and its user into a JSON-friendly dict"""
+    return {
+        'id': profile.id,
+        'username': user.username,
+        'bio': profile.bio,
+        'hourly_rate': profile.hourly_rate,
+        'years_experience': profile.years_experience,
+        'profile_image': profile.profile_image,
+        'proficiency_level': profile.proficiency_level,
+        'specialization': profile.specialization,
+        'avg_rating': profile.avg_rating,
+        'review_count': profile.review_count,
+    }
@@ -0,0 +1,20 @@
+"""Serve the app with waitress, for platforms where gunicorn isn't available (e.g. Windows).
+
+Waitress runs a single process with a thread pool; on Linux prefer gunicorn
+with gunicorn.conf.py to use every core.
+"""
+import os
+from waitress import serve
+
+from wsgi import app
+
+
+if __name__ == "__main__":
+    serve(
+        app,
+        host=os.environ.get("HOST", "0.0.0.0"),
+        port=int(os.environ.get("PORT", 8000)),
+        threads=int(os.environ.get("WEB_THREADS", (os.cpu_count() or 1) * 4)),
+        connection_limit=int(os.environ.get("WEB_CONNECTION_LIMIT", 1000)),
+        channel_timeout=int(os.environ.get("WEB_TIMEOUT", 60)),
+    )
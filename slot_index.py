@@ -0,0 +1,112 @@
+"""Weekly time-slot index for searching tutors by when they teach.
+
+Every available slot is expanded into the BIN_MINUTES bins of the week it
+fully covers, one availability_bins row each, indexed on (day_of_week, bin).
+"Who teaches on Tuesdays 18:00-19:00" is then an index range scan over four
+bins instead of a scan of every tutor's slots. The index is kept up to date
+wherever slots are added or removed; `flask rebuild-slot-index` recreates it.
+"""
+from app import db
+from freebusy import BIN_MINUTES
+from models import Availability, AvailabilityBin, Booking
+from reservations import active_booking_filter
+
+
+REBUILD_BATCH_SIZE = 5000
+
+
+def _minute_of_day(t):
+    return t.hour * 60 + t.minute
+
+
+def slot_bins(start_time, end_time):
+    """Get the bins lying entirely inside a slot"""
+    first = -(-_minute_of_day(start_time) // BIN_MINUTES)
+    last = _minute_of_day(end_time) // BIN_MINUTES
+    return range(first, last)
+
+
+def _bin_rows(slots):
+    return [
+        {'availability_id': slot.id, 'tutor_profile_id': slot.tutor_profile_id,
+         'day_of_week': slot.day_of_week, 'bin': index}
+        for slot in slots
+        for index in slot_bins(slot.start_time, slot.end_time)
+    ]
+
+
+def index_slots(slots):
+    """Add bins for newly created slots as part of the current transaction"""
+    rows = _bin_rows(slot for slot in slots if slot.is_available)
+    if rows:
+        db.session.execute(db.insert(AvailabilityBin), rows)
+
+
+def unindex_slots(availability_ids):
+    """Remove the bins of slots about to be deleted, as part of the current transaction"""
+    if availability_ids:
+        db.session.execute(
+            db.delete(AvailabilityBin).where(AvailabilityBin.availability_id.in_(availability_ids))
+        )
+
+
+def reindex_tutor(tutor_profile_id):
+    """Replace all of one tutor's bins after a bulk schedule change, as part of the current transaction"""
+    db.session.execute(db.delete(AvailabilityBin).where(AvailabilityBin.tutor_profile_id == tutor_profile_id))
+    index_slots(db.session.execute(
+        db.select(Availability.id, Availability.tutor_profile_id, Availability.day_of_week,
+                  Availability.start_time, Availability.end_time, Availability.is_available)
+        .where(Availability.tutor_profile_id == tutor_profile_id)
+    ).all())
+
+
+def rebuild_slot_index():
+    """Recreate the whole index from the availability table and commit"""
+    db.session.execute(db.delete(AvailabilityBin))
+
+    slots = db.session.execute(
+        db.select(Availability.id, Availability.tutor_profile_id, Availability.day_of_week,
+                  Availability.start_time, Availability.end_time)
+        .where(Availability.is_available == True)
+        .execution_options(yield_per=REBUILD_BATCH_SIZE)
+    )
+    count = 0
+    for batch in slots.partitions():
+        rows = _bin_rows(batch)
+        if rows:
+            db.session.execute(db.insert(AvailabilityBin), rows)
+        count += len(rows)
+
+    db.session.commit()
+    return count
+
+
+def available_tutors_filter(tutor_id_column, day_of_week, start_time, end_time, date=None):
+    """Filter matching tutors who teach for the whole of start_time-end_time on a weekday.
+
+    With a date, tutors already booked or held for any part of that time are
+    left out as well.
+    """
+    first = _minute_of_day(start_time) // BIN_MINUTES
+    last = -(-_minute_of_day(end_time) // BIN_MINUTES)
+
+    # Overlapping slots can cover the same bin twice, so count distinct bins
+    covering = db.select(AvailabilityBin.tutor_profile_id) \
+        .where(AvailabilityBin.day_of_week == day_of_week) \
+        .where(AvailabilityBin.bin >= first) \
+        .where(AvailabilityBin.bin < last) \
+        .group_by(AvailabilityBin.tutor_profile_id) \
+        .having(db.func.count(db.distinct(AvailabilityBin.bin)) == last - first)
+    clause = tutor_id_column.in_(covering)
+
+    if date is not None:
+        booked = db.select(Booking.id) \
+            .where(Booking.tutor_profile_id == tutor_id_column) \
+            .where(Booking.booking_date == date) \
+            .where(Booking.start_time < end_time) \
+            .where(Booking.end_time > start_time) \
+            .where(active_booking_filter()) \
+            .exists()
+        clause = db.and_(clause, ~booked)
+
+    return clause
@@ -0,0 +1,95 @@
+import time
+
+from flask import current_app
+
+from app import cache, db
+from models import User, Role, Booking, BookingStatus, Payment, PaymentStatus
+
+
+ADMIN_STATS_KEY = 'admin_stats'
+
+
+def compute_admin_stats():
+    """Run the aggregate queries behind the admin dashboard"""
+    role_counts = dict(
+        db.session.query(User.role, db.func.count(User.id))
+        .filter(User.role.in_([Role.TUTOR, Role.STUDENT]))
+        .group_by(User.role)
+        .all()
+    )
+
+    booking_count = Booking.query.filter_by(status=BookingStatus.CONFIRMED).count()
+    total_revenue = db.session.query(db.func.sum(Payment.platform_fee)) \
+        .filter(Payment.status == PaymentStatus.COMPLETED) \
+        .scalar() or 0
+
+    # Top tutors by booking count
+    top_tutors = db.session.query(
+            Booking.tutor_profile_id,
+            db.func.count(Booking.id).label('booking_count'),
+            db.func.sum(Payment.tutor_payout).label('earnings')
+        ) \
+        .join(Payment, Payment.booking_id == Booking.id) \
+        .filter(Payment.status == PaymentStatus.COMPLETED) \
+        .group_by(Booking.tutor_profile_id) \
+        .order_by(db.func.count(Booking.id).desc()) \
+        .limit(5) \
+        .all()
+
+    return {
+        'tutor_count': role_counts.get(Role.TUTOR, 0),
+        'student_count': role_counts.get(Role.STUDENT, 0),
+        'booking_count': booking_count,
+        'total_revenue': total_revenue,
+        'top_tutors': [tuple(row) for row in top_tutors],
+    }
+
+
+def _cached_stats():
+    """Get the cached (computed_at, stats) entry, or None if missing or older than ADMIN_STATS_TIMEOUT"""
+    entry = cache.get(ADMIN_STATS_KEY)
+    # Entries cached before computed_at was stored alongside are plain dicts
+    if not isinstance(entry, tuple) or time.time() - entry[0] >= current_app.config['ADMIN_STATS_TIMEOUT']:
+        return None
+    return entry
+
+
+def _store_stats(computed_at, stats):
+    # Expire the entry when the original computation goes stale, however often
+    # it has been adjusted since
+    remaining = current_app.config['ADMIN_STATS_TIMEOUT'] - (time.time() - computed_at)
+    cache.set(ADMIN_STATS_KEY, (computed_at, stats), timeout=max(1, int(remaining) + 1))
+
+
+def get_admin_stats():
+    """Get the admin dashboard aggregates, computing them only on a cache miss"""
+    entry = _cached_stats()
+    if entry is not None:
+        return entry[1]
+
+    computed_at = time.time()
+    stats = compute_admin_stats()
+    _store_stats(computed_at, stats)
+    return stats
+
+
+def adjust_admin_stats(**deltas):
+    """Apply changes to the cached counters after a commit.
+
+    Nothing is cached until the dashboard is next viewed, so there is nothing to
+    adjust on a miss. Concurrent adjustments can race, which is why the entry
+    still expires ADMIN_STATS_TIMEOUT after it was computed and gets recomputed
+    from scratch; adjusting it doesn't extend its life.
+    """
+    entry = _cached_stats()
+    if entry is None:
+        return
+
+    computed_at, stats = entry
+    for name, delta in deltas.items():
+        stats[name] += delta
+    _store_stats(computed_at, stats)
+
+
+def invalidate_admin_stats():
+    cache.delete(ADMIN_STATS_KEY)
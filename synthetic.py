@@ -0,0 +1,277 @@
+"""Synthetic data for load testing, and bulk import of CSV files.
+
+generate_data fills the database with realistic tutors, students, weekly
+schedules, bookings, payments and reviews at any scale. import_csv loads one
+table from a CSV file. Both write with bulk Core inserts, one executemany per
+batch, and commit batch by batch. Memory use therefore depends on the batch
+size and the number of tutors, not on the number of bookings.
+
+Neither goes through the routes, so data derived from these tables (rating
+aggregates, the earnings rollup, the slot and search indexes) has to be rebuilt
+afterwards. `flask generate-data` and `flask import-csv` do that.
+"""
+import csv
+import datetime
+import json
+import random
+
+from app import db
+from models import User, Role, TutorProfile, Availability, Booking, BookingStatus, Payment, PaymentStatus, Review
+from passwords import hash_password
+
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Every generated account can log in with this password
+SYNTHETIC_PASSWORD = 'password'
+
+SPECIALIZATIONS = ['Conversation', 'Grammar', 'Business German', 'Exam Preparation', 'Beginners', 'Children', 'Culture']
+PROFICIENCY_LEVELS = ['Beginner', 'Intermediate', 'Advanced', 'Native']
+BIO_PHRASES = [
+    'I have taught German online for several years.',
+    'My lessons focus on speaking from the very first session.',
+    'I prepare students for Goethe and telc exams.',
+    'Grammar does not have to be dry: we learn it through real conversations.',
+    'I work with professionals who need German for their job.',
+    'Children learn best through games and stories.',
+    'We will read newspapers, watch films and talk about culture.',
+    'Patient, structured and always well prepared.',
+]
+REVIEW_COMMENTS = [
+    'Great lesson, very patient.',
+    'Clear explanations of difficult grammar.',
+    'Helped me pass my exam!',
+    'Friendly and well prepared.',
+    'Good, but the lesson started late.',
+    None,
+]
+
+# Tables import_csv can load, by table name
+IMPORT_MODELS = {model.__tablename__: model for model in [User, TutorProfile, Availability, Booking, Payment, Review]}
+
+
+def _max_id(model):
+    return db.session.scalar(db.select(db.func.max(model.id))) or 0
+
+
+def _insert_batches(model, rows, batch_size):
+    """Insert row dicts with one executemany and one commit per batch; returns the row count"""
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.session.execute(db.insert(model), batch)
+            db.session.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(model), batch)
+        db.session.commit()
+        count += len(batch)
+    return count
+
+
+def _user_rows(role, count, first_number, password_hash, created_at):
+    for number in range(first_number, first_number + count):
+        yield {'username': f'{role.value}{number}', 'email': f'{role.value}{number}@example.com',
+               'password_hash': password_hash, 'role': role, 'created_at': created_at}
+
+
+def _profile_rows(user_ids, rng):
+    for user_id in user_ids:
+        yield {
+            'user_id': user_id,
+            'bio': ' '.join(rng.sample(BIO_PHRASES, 3)),
+            'hourly_rate': float(rng.randrange(30, 161)) / 2,
+            'years_experience': rng.randint(0, 30),
+            'proficiency_level': rng.choice(PROFICIENCY_LEVELS),
+            'specialization': rng.choice(SPECIALIZATIONS),
+        }
+
+
+def _weekly_slots(rng):
+    """Pick a tutor's weekly template as (day, start hour, end hour) blocks"""
+    slots = []
+    for day in sorted(rng.sample(range(7), rng.randint(2, 5))):
+        start = rng.randint(8, 12)
+        slots.append((day, start, start + rng.randint(1, 4)))
+        if rng.random() < 0.5:
+            start = rng.randint(16, 19)
+            slots.append((day, start, min(start + rng.randint(1, 3), 22)))
+    return slots
+
+
+def _booking_rows(count, profile_ids, student_ids, schedules, today, rng):
+    for _ in range(count):
+        profile_id = rng.choice(profile_ids)
+        day, start, end = rng.choice(schedules[profile_id])
+        hour = rng.randrange(start, end)
+
+        # Somewhere from six months ago to a month ahead, on one of the tutor's teaching days
+        date = today + datetime.timedelta(days=rng.randint(-180, 30))
+        date += datetime.timedelta(days=(day - date.weekday()) % 7)
+        if date < today:
+            status = BookingStatus.COMPLETED if rng.random() < 0.85 else BookingStatus.CANCELLED
+        else:
+            status = BookingStatus.CONFIRMED if rng.random() < 0.9 else BookingStatus.CANCELLED
+
+        yield {
+            'student_id': rng.choice(student_ids),
+            'tutor_profile_id': profile_id,
+            'booking_date': date,
+            'start_time': datetime.time(hour),
+            'end_time': datetime.time(hour + 1),
+            'status': status,
+            'created_at': datetime.datetime.combine(date - datetime.timedelta(days=rng.randint(1, 21)),
+                                                    datetime.time(rng.randint(7, 22), rng.randint(0, 59))),
+        }
+
+
+def generate_data(tutors, students, bookings, review_rate=0.5, batch_size=DEFAULT_BATCH_SIZE, seed=None,
+                  progress=None):
+    """Add synthetic tutors, students and their bookings, payments and reviews.
+
+    Bookings fall on the tutors' weekly schedules but aren't checked against
+    each other, so a few overlap at large scale. Past bookings are mostly
+    completed and paid for, and review_rate of those are reviewed. Returns the
+    number of rows added per table. progress, if given, is called with a
+    message after each stage.
+    """
+    rng = random.Random(seed)
+    report = progress or (lambda message: None)
+    now = datetime.datetime.utcnow()
+    password_hash = hash_password(SYNTHETIC_PASSWORD)
+    counts = {}
+
+    # Numbering usernames from the current highest id keeps repeated runs unique
+    last_user_id = _max_id(User)
+    counts['users'] = _insert_batches(User, _user_rows(Role.TUTOR, tutors, last_user_id + 1, password_hash, now),
+                                      batch_size)
+    counts['users'] += _insert_batches(User, _user_rows(Role.STUDENT, students, last_user_id + 1, password_hash, now),
+                                       batch_size)
+    tutor_user_ids = db.session.scalars(
+        db.select(User.id).where(User.id > last_user_id).where(User.role == Role.TUTOR).order_by(User.id)
+    ).all()
+    student_ids = db.session.scalars(
+        db.select(User.id).where(User.id > last_user_id).where(User.role == Role.STUDENT).order_by(User.id)
+    ).all()
+    report(f'Added {tutors} tutors and {students} students.')
+
+    counts['tutor_profiles'] = _insert_batches(TutorProfile, _profile_rows(tutor_user_ids, rng), batch_size)
+    rates = dict(db.session.execute(
+        db.select(TutorProfile.id, TutorProfile.hourly_rate).where(TutorProfile.user_id > last_user_id)
+    ).all())
+    profile_ids = sorted(rates)
+
+    schedules = {profile_id: _weekly_slots(rng) for profile_id in profile_ids}
+    counts['availability'] = _insert_batches(Availability, (
+        {'tutor_profile_id': profile_id, 'day_of_week': day, 'start_time': datetime.time(start),
+         'end_time': datetime.time(end), 'is_available': True}
+        for profile_id, slots in schedules.items()
+        for day, start, end in slots
+    ), batch_size)
+    report(f'Added {counts["availability"]} weekly availability slots.')
+
+    counts.update(bookings=0, payments=0, reviews=0)
+    if not (profile_ids and student_ids):
+        return counts
+
+    rows = _booking_rows(bookings, profile_ids, student_ids, schedules, now.date(), rng)
+    for offset in range(0, bookings, batch_size):
+        last_booking_id = _max_id(Booking)
+        batch = [next(rows) for _ in range(min(batch_size, bookings - offset))]
+        db.session.execute(db.insert(Booking), batch)
+
+        # Read the batch back for the ids its payments and reviews refer to
+        added = db.session.execute(
+            db.select(Booking.id, Booking.student_id, Booking.tutor_profile_id, Booking.booking_date,
+                      Booking.status, Booking.created_at)
+            .where(Booking.id > last_booking_id)
+        ).all()
+
+        payments = []
+        reviews = []
+        for booking in added:
+            if booking.status == BookingStatus.CANCELLED and rng.random() < 0.5:
+                continue
+            fee, payout = Payment.calculate_fee(rates[booking.tutor_profile_id])
+            payments.append({
+                'booking_id': booking.id, 'amount': rates[booking.tutor_profile_id], 'currency': 'EUR',
+                'platform_fee': fee, 'tutor_payout': payout,
+                'status': PaymentStatus.REFUNDED if booking.status == BookingStatus.CANCELLED else PaymentStatus.COMPLETED,
+                'transaction_id': f'synthetic-{booking.id}', 'payment_date': booking.created_at,
+            })
+            if booking.status == BookingStatus.COMPLETED and rng.random() < review_rate:
+                reviews.append({
+                    'student_id': booking.student_id, 'tutor_profile_id': booking.tutor_profile_id,
+                    'booking_id': booking.id, 'rating': rng.choices([5, 4, 3, 2, 1], weights=[50, 30, 12, 5, 3])[0],
+                    'comment': rng.choice(REVIEW_COMMENTS),
+                    'created_at': datetime.datetime.combine(booking.booking_date, datetime.time(21)),
+                })
+        if payments:
+            db.session.execute(db.insert(Payment), payments)
+        if reviews:
+            db.session.execute(db.insert(Review), reviews)
+        db.session.commit()
+
+        counts['bookings'] += len(batch)
+        counts['payments'] += len(payments)
+        counts['reviews'] += len(reviews)
+        report(f'Added {counts["bookings"]} of {bookings} bookings.')
+
+    return counts
+
+
+def _converter(column):
+    """Get a function turning a CSV field into a value for a column"""
+    python_type = getattr(column.type, 'enum_class', None)
+    if python_type is None:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            return str
+
+    if python_type is bool:
+        return lambda value: value.strip().lower() in ('1', 'true', 'yes')
+    if python_type in (datetime.datetime, datetime.date, datetime.time):
+        return python_type.fromisoformat
+    if python_type is dict:
+        return json.loads
+    return python_type
+
+
+def import_csv(table, file, batch_size=DEFAULT_BATCH_SIZE):
+    """Bulk insert the rows of a CSV file into one table; returns the number of rows.
+
+    The header names the columns; columns the table doesn't have are ignored,
+    so exports can be loaded back, and empty fields become NULL. A users file
+    may give a plain `password` column instead of `password_hash`; each is
+    hashed with its own salt, which is slow for large files. Raises
+    ValueError for an unknown table or a malformed value.
+    """
+    model = IMPORT_MODELS.get(table)
+    if model is None:
+        raise ValueError(f'Cannot import into {table}; choose one of {", ".join(IMPORT_MODELS)}')
+
+    reader = csv.DictReader(file)
+    fieldnames = reader.fieldnames or []
+    converters = {column.name: _converter(column) for column in model.__table__.columns if column.name in fieldnames}
+    hash_passwords = model is User and 'password' in fieldnames and 'password_hash' not in fieldnames
+
+    def rows():
+        for line in reader:
+            row = {name: convert(line[name]) if line[name] != '' else None for name, convert in converters.items()}
+            if hash_passwords:
+                row['password_hash'] = hash_password(line['password'])
+            yield row
+
+    count = _insert_batches(model, rows(), batch_size)
+
+    # Explicit ids leave a PostgreSQL sequence behind the rows they were inserted with
+    if 'id' in converters and db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+        ))
+        db.session.commit()
+    return count
@@ -0,0 +1,70 @@
+import datetime
+
+import jinja2
+import pytest
+
+from app import create_app, db
+from config import TestingConfig
+from models import Availability, Booking, BookingStatus, Payment, PaymentStatus, Review, Role, TutorProfile, User
+
+
+@pytest.fixture
+def app():
+    app = create_app(TestingConfig)
+    with app.app_context():
+        import commands
+        commands.upgrade_schema()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def people(app):
+    """A tutor with weekly availability and a student with bookings, a payment and a review"""
+    tutor = User(username='tutor', email='tutor@example.com', role=Role.TUTOR)
+    student = User(username='student', email='student@example.com', role=Role.STUDENT)
+    for user in (tutor, student):
+        user.set_password('secret')
+    profile = TutorProfile(user=tutor, hourly_rate=30.0, specialization='Grammar')
+    db.session.add_all([tutor, student, profile])
+    db.session.flush()
+
+    for day in range(5):
+        db.session.add(Availability(tutor_profile_id=profile.id, day_of_week=day,
+                                    start_time=datetime.time(9), end_time=datetime.time(12)))
+
+    today = datetime.date.today()
+    upcoming = Booking(student_id=student.id, tutor_profile_id=profile.id,
+                       booking_date=today + datetime.timedelta(days=7),
+                       start_time=datetime.time(9), end_time=datetime.time(10),
+                       status=BookingStatus.CONFIRMED)
+    past = Booking(student_id=student.id, tutor_profile_id=profile.id,
+                   booking_date=today - datetime.timedelta(days=7),
+                   start_time=datetime.time(10), end_time=datetime.time(11),
+                   status=BookingStatus.COMPLETED)
+    db.session.add_all([upcoming, past])
+    db.session.flush()
+
+    db.session.add(Payment(booking_id=past.id, amount=30.0, platform_fee=6.0, tutor_payout=24.0,
+                           status=PaymentStatus.COMPLETED, payment_date=datetime.datetime.now()))
+    db.session.add(Review(student_id=student.id, tutor_profile_id=profile.id, booking_id=past.id, rating=5))
+    db.session.commit()
+    return {'tutor': tutor.id, 'student': student.id, 'profile': profile.id}
+
+
+@pytest.fixture
+def client(app):
+    # Only the queries behind the pages are under test, not their markup
+    app.jinja_loader = jinja2.FunctionLoader(lambda name: '')
+    return app.test_client()
+
+
+@pytest.fixture
+def log_in(client):
+    """Get a function that signs the test client in as the given user"""
+    def log_in(user_id):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+    return log_in
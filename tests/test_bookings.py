@@ -0,0 +1,197 @@
+import datetime
+
+import pytest
+
+from app import db
+from earnings import get_monthly_earnings, rebuild_earnings_rollup
+from bookings import MAX_BATCH_SIZE
+from models import Booking, BookingStatus, Payment, PaymentStatus, Role, User
+from payments import pay_for_series
+from reservations import reserve_series
+
+
+def rollup(tutor_profile_id):
+    return [(row.total_payout, row.session_count) for row in get_monthly_earnings(tutor_profile_id)]
+
+
+@pytest.fixture
+def series(people):
+    """A paid 10-week series of 11:00-12:00 lessons, €30 each"""
+    today = datetime.date.today()
+    first_date = today + datetime.timedelta(days=7 - today.weekday())
+    series, first_booking_id = reserve_series(people['student'], people['profile'], first_date,
+                                              datetime.time(11), datetime.time(12), 10)
+    payment = pay_for_series(series, first_booking_id, 30.0)
+    db.session.commit()
+    # Count the payments made by the people fixture as well
+    rebuild_earnings_rollup()
+    booking_ids = db.session.scalars(
+        db.select(Booking.id).where(Booking.series_id == series.id).order_by(Booking.booking_date)
+    ).all()
+    return {'id': series.id, 'payment': payment.id, 'booking_ids': booking_ids}
+
+
+@pytest.fixture
+def single_bookings(people):
+    """The people fixture's bookings, the upcoming one paid for, plus a held booking awaiting payment"""
+    upcoming, past = db.session.scalars(
+        db.select(Booking).where(Booking.student_id == people['student']).order_by(Booking.booking_date.desc())
+    ).all()
+    held = Booking(student_id=people['student'], tutor_profile_id=people['profile'],
+                   booking_date=upcoming.booking_date, start_time=datetime.time(10), end_time=datetime.time(11),
+                   status=BookingStatus.PENDING,
+                   hold_expires_at=datetime.datetime.now() + datetime.timedelta(minutes=15))
+    db.session.add(held)
+    db.session.flush()
+    db.session.add_all([
+        Payment(booking_id=upcoming.id, amount=30.0, platform_fee=6.0, tutor_payout=24.0,
+                status=PaymentStatus.COMPLETED, payment_date=datetime.datetime.now()),
+        Payment(booking_id=held.id, amount=30.0, platform_fee=6.0, tutor_payout=24.0,
+                status=PaymentStatus.PENDING),
+    ])
+    db.session.commit()
+    rebuild_earnings_rollup()
+    return {'upcoming': upcoming.id, 'past': past.id, 'held': held.id}
+
+
+def payment_statuses(booking_ids):
+    return [payment.status for payment in db.session.scalars(
+        db.select(Payment).where(Payment.booking_id.in_(booking_ids)).order_by(Payment.booking_id)
+    )]
+
+
+def statuses(booking_ids):
+    return [db.session.get(Booking, booking_id).status for booking_id in booking_ids]
+
+
+def test_cancelling_the_last_lesson_of_a_series_refunds_only_that_lesson(client, log_in, people, series):
+    booking_ids = series['booking_ids']
+    db.session.execute(db.update(Booking)
+                       .where(Booking.id.in_(booking_ids[:9]))
+                       .values(status=BookingStatus.COMPLETED))
+    db.session.commit()
+    before = rollup(people['profile'])
+
+    log_in(people['student'])
+    assert client.post(f'/api/cancel_booking/{booking_ids[9]}').status_code == 200
+
+    db.session.expire_all()
+    assert statuses(booking_ids) == [BookingStatus.COMPLETED] * 9 + [BookingStatus.CANCELLED]
+    payment = db.session.get(Payment, series['payment'])
+    assert payment.status == PaymentStatus.COMPLETED
+    assert (payment.amount, payment.refunded_amount, payment.refunded_sessions) == (270.0, 30.0, 1)
+    assert (payment.platform_fee, payment.tutor_payout) == (54.0, 216.0)
+
+    # The rollup loses one lesson's payout, and agrees with a rebuild from scratch
+    after = rollup(people['profile'])
+    assert after == [(payout - 24.0, sessions - 1) for payout, sessions in before]
+    rebuild_earnings_rollup()
+    assert rollup(people['profile']) == after
+
+
+def test_cancelling_a_lesson_cancels_the_rest_of_the_series(client, log_in, people, series):
+    booking_ids = series['booking_ids']
+    db.session.execute(db.update(Booking)
+                       .where(Booking.id.in_(booking_ids[:4]))
+                       .values(status=BookingStatus.COMPLETED))
+    db.session.commit()
+
+    log_in(people['student'])
+    response = client.post('/api/bookings/cancel', json={'booking_ids': [booking_ids[0], booking_ids[4]]})
+    assert response.json == {'success': True, 'cancelled': 6, 'refunded': 1, 'skipped': [booking_ids[0]]}
+
+    db.session.expire_all()
+    assert statuses(booking_ids) == [BookingStatus.COMPLETED] * 4 + [BookingStatus.CANCELLED] * 6
+    payment = db.session.get(Payment, series['payment'])
+    assert (payment.status, payment.amount, payment.refunded_sessions) == (PaymentStatus.COMPLETED, 120.0, 6)
+
+
+def test_cancelling_a_whole_series_refunds_it_in_full(client, log_in, people, series):
+    before = rollup(people['profile'])
+
+    log_in(people['student'])
+    assert client.post(f"/api/cancel_booking/{series['booking_ids'][3]}").status_code == 200
+
+    db.session.expire_all()
+    assert statuses(series['booking_ids']) == [BookingStatus.CANCELLED] * 10
+    assert db.session.get(Payment, series['payment']).status == PaymentStatus.REFUNDED
+    assert rollup(people['profile']) == [(payout - 240.0, sessions - 10) for payout, sessions in before]
+
+    # Nothing is refunded a second time
+    assert client.post(f"/api/cancel_booking/{series['booking_ids'][3]}").status_code == 409
+
+
+def test_batch_cancel_refunds_completed_payments_and_fails_pending_ones(client, log_in, people, single_bookings):
+    before = rollup(people['profile'])
+
+    log_in(people['student'])
+    response = client.post('/api/bookings/cancel', json={'booking_ids': list(single_bookings.values())})
+    assert response.json == {'success': True, 'cancelled': 2, 'refunded': 1, 'skipped': [single_bookings['past']]}
+
+    db.session.expire_all()
+    assert statuses([single_bookings['upcoming'], single_bookings['past'], single_bookings['held']]) == \
+        [BookingStatus.CANCELLED, BookingStatus.COMPLETED, BookingStatus.CANCELLED]
+    assert payment_statuses([single_bookings['upcoming']]) == [PaymentStatus.REFUNDED]
+    assert payment_statuses([single_bookings['past']]) == [PaymentStatus.COMPLETED]
+    assert payment_statuses([single_bookings['held']]) == [PaymentStatus.FAILED]
+
+    # Only the refunded payment comes off the rollup
+    assert rollup(people['profile']) == [(payout - 24.0, sessions - 1) for payout, sessions in before]
+
+
+def test_batch_complete_skips_bookings_that_are_not_confirmed(client, log_in, people, single_bookings):
+    log_in(people['tutor'])
+    response = client.post('/api/bookings/complete', json={'booking_ids': list(single_bookings.values())})
+    assert response.json == {'success': True, 'completed': 1,
+                             'skipped': sorted([single_bookings['past'], single_bookings['held']])}
+
+    db.session.expire_all()
+    assert statuses([single_bookings['upcoming'], single_bookings['held']]) == \
+        [BookingStatus.COMPLETED, BookingStatus.PENDING]
+
+
+@pytest.mark.parametrize('action', ['cancel', 'complete'])
+def test_batch_is_denied_if_any_booking_belongs_to_someone_else(client, log_in, people, single_bookings, action):
+    other = User(username='other', email='other@example.com', role=Role.STUDENT, password_hash='-')
+    db.session.add(other)
+    db.session.flush()
+    booking = Booking(student_id=other.id, tutor_profile_id=people['profile'],
+                      booking_date=datetime.date.today(), start_time=datetime.time(11),
+                      end_time=datetime.time(12), status=BookingStatus.CONFIRMED)
+    db.session.add(booking)
+    db.session.commit()
+    own = booking.id
+
+    log_in(other.id)
+    response = client.post(f'/api/bookings/{action}', json={'booking_ids': [own, single_bookings['upcoming']]})
+    assert response.status_code == 403
+    assert response.json['booking_ids'] == [single_bookings['upcoming']]
+
+    db.session.expire_all()
+    assert statuses([own, single_bookings['upcoming']]) == [BookingStatus.CONFIRMED] * 2
+    assert payment_statuses([single_bookings['upcoming']]) == [PaymentStatus.COMPLETED]
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    {},
+    {'booking_ids': []},
+    {'booking_ids': 1},
+    {'booking_ids': ['1']},
+    {'booking_ids': [1.0]},
+    {'booking_ids': [True]},
+    {'booking_ids': list(range(1, MAX_BATCH_SIZE + 2))},
+])
+@pytest.mark.parametrize('action', ['cancel', 'complete'])
+def test_batch_rejects_malformed_booking_ids(client, log_in, people, action, body):
+    log_in(people['student'])
+    response = client.post(f'/api/bookings/{action}', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.json
+
+
+def test_batch_accepts_the_largest_batch(client, log_in, people, single_bookings):
+    log_in(people['tutor'])
+    booking_ids = [single_bookings['upcoming']] * (MAX_BATCH_SIZE - 1) + [single_bookings['past']]
+    response = client.post('/api/bookings/complete', json={'booking_ids': booking_ids})
+    assert response.json == {'success': True, 'completed': 1, 'skipped': [single_bookings['past']]}
@@ -0,0 +1,47 @@
+from cachelib import SimpleCache
+from sqlalchemy import event
+
+from app import cache as app_cache, db
+from cache import Cache
+from models import LOGIN_CACHE_KEY, load_user
+
+
+def test_landing_page_with_caching_disabled(client):
+    # TestingConfig uses the null backend, which stores nothing
+    assert client.get('/').status_code == 200
+    assert client.get('/').status_code == 200
+
+
+def test_version_without_a_backend(app):
+    assert isinstance(Cache(app).version('tutors'), str)
+
+
+def test_version_is_stable_until_bumped(app):
+    app.config['CACHE_TYPE'] = 'simple'
+    cache = Cache(app)
+
+    first = cache.version('tutors')
+    assert cache.version('tutors') == first
+    cache.bump('tutors')
+    assert cache.version('tutors') != first
+
+
+def test_login_cache_holds_no_secrets(app, people):
+    app.config['LOGIN_CACHE_TTL'] = 60
+    app_cache._backend = SimpleCache()
+    load_user(people['tutor'])
+    db.session.remove()
+
+    user_fields, profile_fields = app_cache.get(LOGIN_CACHE_KEY.format(people['tutor']))
+    assert 'password_hash' not in user_fields and 'email' not in user_fields
+    assert profile_fields['id'] == people['profile']
+
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    user = load_user(people['tutor'])
+    assert user.tutor_profile.id == people['profile'] and user.tutor_profile.user is user
+    assert statements == []
+
+    # Anything left out is read from the database when it is needed
+    assert user.email == 'tutor@example.com'
+    assert user.check_password('secret')
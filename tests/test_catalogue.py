@@ -0,0 +1,35 @@
+import datetime
+
+from app import cache, db
+from catalogue import TUTOR_REVIEW_COUNT, get_featured_tutors, get_tutor_reviews
+from models import Review
+
+
+def use_simple_cache(app):
+    app.config['CACHE_TYPE'] = 'simple'
+    cache.init_app(app)
+
+
+def test_featured_tutors_cache_display_fields_only(app, people):
+    use_simple_cache(app)
+
+    (profile, user), = get_featured_tutors()
+    assert profile['id'] == people['profile']
+    assert user == {'id': people['tutor'], 'username': 'tutor'}
+    assert get_featured_tutors() == [(profile, user)]
+
+
+def test_tutor_reviews_are_capped(app, people):
+    use_simple_cache(app)
+    now = datetime.datetime.now()
+    db.session.add_all(
+        Review(student_id=people['student'], tutor_profile_id=people['profile'], rating=4,
+               created_at=now + datetime.timedelta(minutes=i))
+        for i in range(TUTOR_REVIEW_COUNT + 5)
+    )
+    db.session.commit()
+
+    reviews = get_tutor_reviews(people['profile'])
+    assert len(reviews) == TUTOR_REVIEW_COUNT
+    assert reviews[0][0]['created_at'] == now + datetime.timedelta(minutes=TUTOR_REVIEW_COUNT + 4)
+    assert all(set(user) == {'id', 'username'} for _, user in reviews)
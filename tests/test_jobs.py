@@ -0,0 +1,128 @@
+import datetime
+
+import pytest
+
+import jobs
+from app import db
+from jobs import claim_jobs, enqueue, expire_holds, run_job
+from models import Booking, BookingStatus, Job, JobStatus, Payment, PaymentStatus
+
+
+PAYMENT_FORM = {
+    'card_number': '4242424242424242',
+    'card_expiry': '12/30',
+    'card_cvc': '123',
+    'cardholder_name': 'Student',
+}
+
+
+def hold(people, start_hour, expires_in_minutes):
+    booking = Booking(student_id=people['student'], tutor_profile_id=people['profile'],
+                      booking_date=datetime.date.today() + datetime.timedelta(days=14),
+                      start_time=datetime.time(start_hour), end_time=datetime.time(start_hour + 1),
+                      status=BookingStatus.PENDING,
+                      hold_expires_at=datetime.datetime.now() + datetime.timedelta(minutes=expires_in_minutes))
+    db.session.add(booking)
+    db.session.commit()
+    return booking.id
+
+
+@pytest.fixture
+def failing_job(monkeypatch):
+    """Register a job called 'fail' that always raises"""
+    def fail():
+        raise RuntimeError('card declined')
+    monkeypatch.setitem(jobs._handlers, 'fail', fail)
+
+
+def make_due(job_id):
+    db.session.execute(db.update(Job).where(Job.id == job_id).values(run_at=datetime.datetime.now()))
+    db.session.commit()
+
+
+def test_async_payment_redirects_to_its_status_page(app, client, log_in, people):
+    app.config['PAYMENTS_ASYNC'] = True
+    booking_id = hold(people, 10, 15)
+
+    log_in(people['student'])
+    response = client.post(f'/student/payment/{booking_id}', data=PAYMENT_FORM)
+    payment = db.session.scalar(db.select(Payment).where(Payment.booking_id == booking_id))
+    assert response.headers['Location'] == f'/student/payment/status/{payment.id}'
+    assert payment.status == PaymentStatus.PENDING
+    assert client.get(response.headers['Location']).status_code == 200
+    assert client.get(f'/api/payment_status/{payment.id}').json['status'] == 'pending'
+
+    # The worker takes the payment and the status page sends the student on
+    job_ids = claim_jobs(10)
+    assert [db.session.get(Job, job_id).payload for job_id in job_ids] == [{'payment_id': payment.id}]
+    run_job(job_ids[0])
+
+    db.session.expire_all()
+    assert (payment.status, db.session.get(Booking, booking_id).status) == \
+        (PaymentStatus.COMPLETED, BookingStatus.CONFIRMED)
+    assert client.get(f'/api/payment_status/{payment.id}').json['booking_status'] == 'confirmed'
+    assert client.get(f'/student/payment/status/{payment.id}').headers['Location'] == '/student/dashboard'
+
+
+def test_claimed_jobs_are_not_claimed_again(app):
+    queued = enqueue('purge_jobs')
+    db.session.commit()
+    job_id = queued.id
+
+    assert claim_jobs(10) == [job_id]
+    assert claim_jobs(10) == []
+
+    # Until the worker holding the job goes quiet
+    stale = datetime.datetime.now() - datetime.timedelta(seconds=app.config['JOB_LOCK_TIMEOUT'] + 1)
+    db.session.execute(db.update(Job).where(Job.id == job_id).values(locked_at=stale))
+    db.session.commit()
+    assert claim_jobs(10) == [job_id]
+
+
+def test_failed_jobs_are_retried_with_backoff(app, failing_job):
+    app.config['JOB_MAX_ATTEMPTS'] = 3
+    queued = enqueue('fail')
+    db.session.commit()
+    job_id = queued.id
+
+    for attempt, delay in [(1, 30), (2, 60)]:
+        assert claim_jobs(10) == [job_id]
+        started = datetime.datetime.now()
+        run_job(job_id)
+
+        failed = db.session.get(Job, job_id)
+        assert (failed.status, failed.attempts) == (JobStatus.QUEUED, attempt)
+        assert failed.last_error == "RuntimeError('card declined')"
+        assert started + datetime.timedelta(seconds=delay) <= failed.run_at \
+            <= datetime.datetime.now() + datetime.timedelta(seconds=delay)
+        # Not due again until the backoff has passed
+        assert claim_jobs(10) == []
+        make_due(job_id)
+
+    assert claim_jobs(10) == [job_id]
+    run_job(job_id)
+    failed = db.session.get(Job, job_id)
+    assert (failed.status, failed.attempts) == (JobStatus.FAILED, 3)
+    assert failed.finished_at is not None
+    assert claim_jobs(10) == []
+
+
+def test_expire_holds_cancels_only_lapsed_holds_without_a_payment(people):
+    lapsed = hold(people, 9, -1)
+    paying = hold(people, 10, -1)
+    active = hold(people, 11, 15)
+    db.session.add(Payment(booking_id=paying, amount=30.0, platform_fee=6.0, tutor_payout=24.0,
+                           status=PaymentStatus.PENDING))
+    # Held before holds had an expiry time
+    legacy = Booking(student_id=people['student'], tutor_profile_id=people['profile'],
+                     booking_date=datetime.date.today() + datetime.timedelta(days=15),
+                     start_time=datetime.time(9), end_time=datetime.time(10), status=BookingStatus.PENDING,
+                     created_at=datetime.datetime.now() - datetime.timedelta(hours=1))
+    db.session.add(legacy)
+    db.session.commit()
+
+    expire_holds()
+
+    db.session.expire_all()
+    assert [db.session.get(Booking, booking_id).status for booking_id in (lapsed, paying, active, legacy.id)] == \
+        [BookingStatus.CANCELLED, BookingStatus.PENDING, BookingStatus.PENDING, BookingStatus.CANCELLED]
@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy.exc import InvalidRequestError
+
+from app import db
+from models import Availability, Booking, BookingStatus, TutorProfile
+
+
+def test_lazy_load_raises(app, people):
+    profile = db.session.get(TutorProfile, people['profile'])
+
+    with pytest.raises(InvalidRequestError, match='Unexpected lazy load from TutorProfile'):
+        profile.bookings
+
+
+def test_bulk_update_and_delete_pass_through(app, people):
+    # ORM UPDATE and DELETE statements go through the same hook but have no
+    # lazy_loaded_from to look at
+    db.session.execute(
+        db.update(Booking)
+        .where(Booking.tutor_profile_id == people['profile'])
+        .values(status=BookingStatus.CANCELLED)
+    )
+    db.session.execute(db.delete(Availability).where(Availability.tutor_profile_id == people['profile']))
+    db.session.commit()
+
+    assert db.session.scalar(db.select(db.func.count(Availability.id))) == 0
+    assert set(db.session.scalars(db.select(Booking.status))) == {BookingStatus.CANCELLED}
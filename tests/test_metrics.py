@@ -0,0 +1,29 @@
+import pytest
+from flask import g
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from metrics import _start_request
+
+
+def test_failed_queries_leave_no_timing_behind(app):
+    with app.test_request_context('/'):
+        _start_request()
+        with db.engine.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    connection.exec_driver_sql('SELECT * FROM no_such_table')
+            connection.exec_driver_sql('SELECT 1')
+            connection.exec_driver_sql('SELECT 2')
+
+            assert 'query_start_time' not in connection.info
+
+        assert g.query_stats['count'] == 2
+        assert g.query_stats['slowest'][1] in ('SELECT 1', 'SELECT 2')
+
+
+def test_requests_report_their_queries(client, people):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert any(value.startswith('db;') and 'queries' in value
+               for value in response.headers.getlist('Server-Timing'))
@@ -0,0 +1,95 @@
+"""Check that the hot queries are answered from indexes.
+
+Each test runs the real code path, records the SQL it sends and asks SQLite
+for the plan of every statement. A full scan of a large table fails the
+test, and so does a tutor search page sorted in a temporary B-tree.
+"""
+import datetime
+import re
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from freebusy import free_busy
+from search import SORT_OPTIONS, encode_cursor, search_tutors
+from utils import get_availability_window, get_available_slots
+
+
+class RecordedPlans:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.statements.append((statement, parameters))
+
+    def plans(self):
+        """Get a (statement, plan details) pair for every recorded query"""
+        with db.engine.connect() as connection:
+            return [
+                (statement, [row[3] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement,
+                                                                         parameters)])
+                for statement, parameters in self.statements
+            ]
+
+
+@pytest.fixture
+def recorded():
+    recorder = RecordedPlans()
+    event.listen(db.engine, 'before_cursor_execute', recorder)
+    yield recorder
+    event.remove(db.engine, 'before_cursor_execute', recorder)
+
+
+def assert_indexed(recorder, tables, sorted_by_index=False):
+    """Fail if any recorded query scans one of `tables`.
+
+    With sorted_by_index, also fail if a query sorts its rows in a temporary
+    B-tree rather than reading them in index order.
+    """
+    plans = recorder.plans()
+    assert plans
+    full_scan = re.compile(r'^SCAN (%s)\b(?!.*\bINDEX\b)' % '|'.join(tables))
+    for statement, details in plans:
+        for detail in details:
+            assert not full_scan.match(detail), f'{detail} in {statement}'
+            if sorted_by_index:
+                assert 'TEMP B-TREE' not in detail, f'{detail} in {statement}'
+
+
+def test_tutor_dashboard_queries_use_indexes(client, log_in, people, recorded):
+    log_in(people['tutor'])
+
+    assert client.get('/tutor/dashboard').status_code == 200
+    assert_indexed(recorded, ['bookings', 'payments', 'reviews', 'tutor_earnings_monthly'])
+
+
+def test_student_dashboard_queries_use_indexes(client, log_in, people, recorded):
+    log_in(people['student'])
+
+    assert client.get('/student/dashboard').status_code == 200
+    assert_indexed(recorded, ['bookings', 'payments', 'reviews'])
+
+
+def test_slot_queries_use_indexes(app, people, recorded):
+    start = datetime.date.today() + datetime.timedelta(days=1)
+
+    assert get_availability_window(people['profile'], start, 14)
+    get_available_slots(people['profile'], start.strftime('%Y-%m-%d'))
+    assert_indexed(recorded, ['availability', 'bookings'])
+
+
+def test_who_is_free_query_uses_indexes(app, people, recorded):
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+
+    free_busy(tomorrow, 1, start_time=datetime.time(10), end_time=datetime.time(11))
+    assert_indexed(recorded, ['availability'])
+
+
+@pytest.mark.parametrize('sort', list(SORT_OPTIONS))
+def test_search_sorts_use_indexes(app, people, recorded, sort):
+    # The first page and a later one, which adds the keyset condition
+    search_tutors(sort=sort)
+    search_tutors(sort=sort, cursor=encode_cursor(3, 100))
+    assert_indexed(recorded, ['tutor_profiles'], sorted_by_index=True)
@@ -0,0 +1,148 @@
+"""Race students for the same slot against a file-backed SQLite database.
+
+The in-memory database the other tests use has a single connection, so it
+can't show two requests interleaving. Here every thread has its own app
+context and connection, as a request thread of the real server would, and a
+barrier releases them together. See benchmarks/booking_race.py for the same
+race run through the HTTP routes.
+"""
+import datetime
+import threading
+
+import pytest
+from sqlalchemy.orm import aliased
+
+from app import create_app, db
+from config import TestingConfig
+from database import engine_options
+from models import Availability, Booking, BookingStatus, Role, TutorProfile, User
+from reservations import SlotUnavailable, confirm_reservation, reserve_slot
+
+
+STUDENTS = 8
+SLOT_DATE = datetime.date.today() + datetime.timedelta(days=1)
+SLOT = (SLOT_DATE, datetime.time(10), datetime.time(11))
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'race.db'}"
+
+    class RaceConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = uri
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(uri, {})
+
+    app = create_app(RaceConfig)
+    with app.app_context():
+        import commands
+        commands.upgrade_schema()
+
+        tutor = User(username='tutor', email='tutor@example.com', role=Role.TUTOR, password_hash='-')
+        profile = TutorProfile(user=tutor, hourly_rate=30.0)
+        db.session.add_all([tutor, profile])
+        db.session.flush()
+        db.session.add(Availability(tutor_profile_id=profile.id, day_of_week=SLOT_DATE.weekday(),
+                                    start_time=datetime.time(8), end_time=datetime.time(20)))
+        db.session.execute(db.insert(User), [
+            {'username': f'student{i}', 'email': f'student{i}@example.com',
+             'password_hash': '-', 'role': Role.STUDENT}
+            for i in range(STUDENTS)
+        ])
+        db.session.commit()
+        app.config['RACE_PROFILE_ID'] = profile.id
+        app.config['RACE_STUDENT_IDS'] = db.session.scalars(
+            db.select(User.id).where(User.role == Role.STUDENT)
+        ).all()
+    yield app
+
+    with app.app_context():
+        db.engine.dispose()
+
+
+def race(app, target, args_list):
+    """Run target(*args) in one thread per entry of args_list, all started at once"""
+    barrier = threading.Barrier(len(args_list))
+    outcomes = []
+    lock = threading.Lock()
+
+    def contender(*args):
+        with app.app_context():
+            barrier.wait()
+            try:
+                outcome = target(*args)
+            except SlotUnavailable:
+                outcome = 'refused'
+            except Exception as error:
+                outcome = error
+            finally:
+                db.session.remove()
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=contender, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def book(student_id, profile_id):
+    return reserve_slot(student_id, profile_id, *SLOT).id
+
+
+def pay(booking_id):
+    confirm_reservation(db.session.get(Booking, booking_id))
+    db.session.commit()
+    return 'confirmed'
+
+
+def count_overlaps():
+    other = aliased(Booking)
+    return db.session.query(db.func.count()) \
+        .select_from(Booking) \
+        .join(other, db.and_(
+            other.tutor_profile_id == Booking.tutor_profile_id,
+            other.booking_date == Booking.booking_date,
+            other.id > Booking.id,
+            other.start_time < Booking.end_time,
+            other.end_time > Booking.start_time
+        )) \
+        .filter(Booking.status == BookingStatus.CONFIRMED) \
+        .filter(other.status == BookingStatus.CONFIRMED) \
+        .scalar()
+
+
+def test_only_one_student_holds_a_contested_slot(file_app):
+    profile_id = file_app.config['RACE_PROFILE_ID']
+    student_ids = file_app.config['RACE_STUDENT_IDS']
+
+    holds = race(file_app, book, [(student_id, profile_id) for student_id in student_ids])
+
+    booking_ids = [outcome for outcome in holds if isinstance(outcome, int)]
+    assert len(booking_ids) == 1
+    assert holds.count('refused') == STUDENTS - 1
+
+    outcomes = race(file_app, pay, [(booking_ids[0],)])
+    assert outcomes == ['confirmed']
+    with file_app.app_context():
+        assert count_overlaps() == 0
+
+
+def test_only_one_expired_hold_is_confirmed(file_app):
+    # Holds that run out at once let every student reserve the slot, so the
+    # race moves to payment, where the slot is checked again
+    file_app.config['BOOKING_HOLD_MINUTES'] = 0
+    profile_id = file_app.config['RACE_PROFILE_ID']
+    student_ids = file_app.config['RACE_STUDENT_IDS']
+
+    with file_app.app_context():
+        booking_ids = [book(student_id, profile_id) for student_id in student_ids]
+
+    outcomes = race(file_app, pay, [(booking_id,) for booking_id in booking_ids])
+
+    assert outcomes.count('confirmed') == 1
+    assert outcomes.count('refused') == STUDENTS - 1
+    with file_app.app_context():
+        assert count_overlaps() == 0
+        assert db.session.query(Booking).filter_by(status=BookingStatus.CONFIRMED).count() == 1
@@ -1,5 +1,7 @@
+import bisect
 import datetime
-from models import Availability, Booking, BookingStatus
+from models import Availability, Booking
+from reservations import active_booking_filter
 
 
 def calculate_session_price(hourly_rate, start_time, end_time):
@@ -19,46 +21,102 @@ def calculate_session_price(hourly_rate, start_time, end_time):
     return price
 
 
-def get_available_slots(tutor_profile_id, date):
-    """Get available time slots for a specific tutor on a specific date"""
-    if isinstance(date, str):
-        date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+class IntervalIndex:
+    """Sorted index of (start, end) intervals answering overlap queries with bisect.
+    
+    Building the index is O(m log m) for m intervals and each overlap check is
+    O(log m), so filtering n slots costs O((n + m) log m) instead of O(n * m).
+    """
+    
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self._starts = [start for start, _ in intervals]
+        
+        # Running maximum of end times: the latest end among all intervals
+        # starting before a given point is then a single lookup
+        self._max_ends = []
+        for _, end in intervals:
+            if self._max_ends and self._max_ends[-1] > end:
+                end = self._max_ends[-1]
+            self._max_ends.append(end)
     
-    day_of_week = date.weekday()  # 0 = Monday, 6 = Sunday
+    def __len__(self):
+        return len(self._starts)
     
-    # Get availability for this day of week
-    availabilities = Availability.query.filter_by(
+    def overlaps(self, start, end):
+        """Check whether the half-open interval [start, end) overlaps any indexed interval"""
+        # Intervals starting before `end` are the only candidates
+        i = bisect.bisect_left(self._starts, end)
+        return i > 0 and self._max_ends[i - 1] > start
+    
+    def free_slots(self, slots):
+        """Filter availability slots down to those not overlapping any indexed interval"""
+        if not self._starts:
+            return list(slots)
+        return [slot for slot in slots if not self.overlaps(slot.start_time, slot.end_time)]
+
+
+def get_weekly_availability(tutor_profile_id):
+    """Get a tutor's available weekly slots grouped by day of week"""
+    slots = Availability.query.filter_by(
         tutor_profile_id=tutor_profile_id,
-        day_of_week=day_of_week,
         is_available=True
-    ).all()
+    ).order_by(Availability.start_time).all()
     
-    # Get existing bookings
-    bookings = Booking.query.filter_by(
-        tutor_profile_id=tutor_profile_id,
-        booking_date=date,
-        status=BookingStatus.CONFIRMED
+    weekly = {}
+    for slot in slots:
+        weekly.setdefault(slot.day_of_week, []).append(slot)
+    
+    return weekly
+
+
+def get_availability_window(tutor_profile_id, start_date, days):
+    """Get available time slots for each date in a window starting at start_date.
+    
+    Loads the weekly availability and all bookings holding a slot in the window in one
+    query each, so the cost stays at two round-trips however wide the window is.
+    """
+    if isinstance(start_date, str):
+        start_date = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+    
+    dates = [start_date + datetime.timedelta(days=i) for i in range(days)]
+    weekly = get_weekly_availability(tutor_profile_id)
+    
+    if not weekly:
+        return {date: [] for date in dates}
+    
+    # Get bookings and unexpired holds for the whole window
+    bookings = Booking.query.filter(
+        Booking.tutor_profile_id == tutor_profile_id,
+        Booking.booking_date >= dates[0],
+        Booking.booking_date <= dates[-1],
+        active_booking_filter()
     ).all()
     
-    booked_slots = [(b.start_time, b.end_time) for b in bookings]
-    
-    # Filter out booked slots
-    available_slots = []
-    for slot in availabilities:
-        # Check if slot overlaps with any booking
-        is_available = True
-        for booked_start, booked_end in booked_slots:
-            if not (slot.end_time <= booked_start or slot.start_time >= booked_end):
-                is_available = False
-                break
-        
-        if is_available:
-            available_slots.append({
+    booked_slots = {}
+    for booking in bookings:
+        booked_slots.setdefault(booking.booking_date, []).append((booking.start_time, booking.end_time))
+    
+    window = {}
+    for date in dates:
+        booked = IntervalIndex(booked_slots.get(date, []))
+        window[date] = [
+            {
                 'start': slot.start_time.strftime('%H:%M'),
                 'end': slot.end_time.strftime('%H:%M')
-            })
+            }
+            for slot in booked.free_slots(weekly.get(date.weekday(), []))
+        ]
+    
+    return window
+
+
+def get_available_slots(tutor_profile_id, date):
+    """Get available time slots for a specific tutor on a specific date"""
+    if isinstance(date, str):
+        date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
     
-    return available_slots
+    return get_availability_window(tutor_profile_id, date, 1)[date]
 
 
 def format_datetime(date, time):
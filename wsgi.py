@@ -0,0 +1,7 @@
+"""WSGI entry point for production servers, e.g. ``gunicorn -c gunicorn.conf.py wsgi:app``"""
+import os
+
+from app import create_app
+from config import CONFIGS
+
+app = create_app(CONFIGS[os.environ.get("APP_CONFIG", "production")])